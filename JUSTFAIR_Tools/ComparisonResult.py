@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 10:14:37 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def classify_rates(section_percent, rest_percent, threshold = 0.05):
+    """
+    Labels each section rate as above, about or below the rest's rate, all at once.
+
+    Parameters
+    ----------
+    section_percent : array like
+        the section's percents.
+    rest_percent : array like
+        the rest's percents, lined up with section_percent.
+    threshold : float or tuple, optional
+        how far (relative to the rest's rate) the section has to be before it counts as above or below.
+        A tuple is (below, above), for different amounts on each side. The default is 0.05, so above means
+        more than 1.05 times the rest's rate and below means less than 0.95 times it.
+
+    Returns
+    -------
+    numpy array
+        'above', 'about' or 'below' for each rate, None where either rate is missing.
+
+    """
+    below, above = threshold if np.ndim(threshold) > 0 else (threshold, threshold)
+    section_percent = np.asarray(section_percent, dtype = float)
+    rest_percent = np.asarray(rest_percent, dtype = float)
+    missing = np.isnan(section_percent) | np.isnan(rest_percent)
+    return np.select([missing, section_percent > (1 + above) * rest_percent, section_percent < (1 - below) * rest_percent],
+                     [None, 'above', 'below'], default = 'about').astype(object)
+
+
+### ComparisonResult class
+class ComparisonResult:
+
+    def __init__(self, comparison, order_of_outputs, section_category_name, section_name,
+                 larger_group_category_name, larger_group_name, state_name = None, larger_group_is_state = False,
+                 threshold = 0.05):
+        """
+        The findings of comparing a section to the rest of its larger group (tb_compare_section_to_larger_group),
+        kept as data instead of printed.
+
+        Parameters
+        ----------
+        comparison : dict
+            what compare_section_data returns.
+        order_of_outputs : list
+            the departures, in the order they should be listed.
+        section_category_name, section_name, larger_group_category_name, larger_group_name : str
+            what was compared, same as in tb_compare_section_to_larger_group.
+        state_name : str, optional
+            the state's name, for narrating. The default is None.
+        larger_group_is_state : bool, optional
+            True when the larger group is the whole state. The default is False.
+        threshold : float or tuple, optional
+            passed to classify_rates. The default is 0.05.
+
+        Attributes
+        ----------
+        rates : pandas DataFrame
+            one row per (unique identifier, departure), with section_count, section_percent, rest_count,
+            rest_percent, difference (section_percent - rest_percent) and label.  The index is the unique
+            identifier levels plus departure, or just departure when only departure was grouped by.
+        overlapping_years : list
+            the years both the section and the larger group have data.
+        data : dict or tuple
+            the per year data that tb_compare_section_to_larger_group returns.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.section_category_name = section_category_name
+        self.section_name = section_name
+        self.larger_group_category_name = larger_group_category_name
+        self.larger_group_name = larger_group_name
+        self.state_name = state_name
+        self.larger_group_is_state = larger_group_is_state
+        self.threshold = threshold
+        self.overlapping_years = comparison['overlapping_years']
+        self.unique_identifiers = comparison['unique_identifiers']
+        self.data = comparison['result']
+
+        ### line the two sides up: every unique identifier with every departure, in order
+        section_stats = comparison['section_allyr_stats']
+        rest_stats = comparison['rest_allyr_stats']
+        if len(self.unique_identifiers) > 0:
+            index = pd.MultiIndex.from_tuples([unique_id + (departure,) for unique_id in self.unique_identifiers
+                                               for departure in order_of_outputs], names = rest_stats.index.names)
+        else:
+            index = pd.Index(list(order_of_outputs), name = rest_stats.index.name)
+        section_stats = section_stats.reindex(index)
+        rest_stats = rest_stats.reindex(index)
+        rates = pd.DataFrame({'section_count': section_stats['count'], 'section_percent': section_stats['percent'],
+                              'rest_count': rest_stats['count'], 'rest_percent': rest_stats['percent']}, index = index)
+        rates = rates[rates['section_count'].notna() | rates['rest_count'].notna()]
+        rates['difference'] = rates['section_percent'] - rates['rest_percent']
+        rates['label'] = classify_rates(rates['section_percent'], rates['rest_percent'], threshold)
+        self.rates = rates
+
+    def __repr__(self):
+        return 'ComparisonResult(' + str(self.section_name) + ' ' + str(self.section_category_name) + ' vs ' + \
+            str(self.larger_group_name) + ' ' + str(self.larger_group_category_name) + ', ' + \
+            str(len(self.rates)) + ' rates)'
+
+    def labels(self):
+        """
+        Returns
+        -------
+        pandas Series
+            the above / about / below label of every rate that both sides have.
+
+        """
+        return self.rates['label'].dropna()
+
+    def messages(self):
+        """
+        The findings written out as sentences, the way tb_compare_section_to_larger_group used to print them.
+
+        Returns
+        -------
+        list
+            the sentences, in order.
+
+        """
+        if self.larger_group_is_state:
+            lines = ['large group = state']
+        else:
+            lines = ['large group = ' + str(self.larger_group_name) + ' ' + str(self.larger_group_category_name)]
+        lines.append(str(self.section_name) + ' was active in the years: ' + str(self.overlapping_years))
+        wording = {'above': 'rate above', 'about': 'rate about at', 'below': 'rate below'}
+        labels = self.labels()
+        if len(self.unique_identifiers) == 0:  # just departure was grouped by
+            lines.append('Looking at ' + str(self.section_name) + ' vs ' + str(self.state_name) + ' all')
+            groups = [((), labels)]
+        else:
+            row_ids = [tuple(ind[:-1]) for ind in labels.index]
+            groups = [(unique_id, labels[[row_id == unique_id for row_id in row_ids]])
+                      for unique_id in self.unique_identifiers]
+        for unique_id, rows in groups:
+            if len(unique_id) > 0:
+                lines.append('Looking at ' + str(self.section_name) + ' vs ' + str(self.state_name) +
+                             ' for ' + str(unique_id) + ' s')
+            departures = rows.index.get_level_values(-1)
+            for departure, label in zip(departures, rows.to_numpy()):
+                lines.append(str(self.section_name) + ' ' + str(self.section_category_name) + ' currently has an average ' +
+                             str(departure) + ' ' + wording[label] + ' ' + str(self.larger_group_name) + ' ' +
+                             str(self.larger_group_category_name) + ' average in years queried')
+        return lines
+
+    def narrate(self, level = logging.INFO):
+        """
+        Sends the findings to the JUSTFAIR_Tools.ComparisonResult logger.  To see them in a notebook, turn logging on,
+        for example logging.basicConfig(level = logging.INFO).
+
+        Parameters
+        ----------
+        level : int, optional
+            the logging level. The default is logging.INFO.
+
+        Returns
+        -------
+        None.
+
+        """
+        if not logger.isEnabledFor(level):
+            return
+        for line in self.messages():
+            logger.log(level, line)
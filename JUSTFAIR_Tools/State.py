@@ -5,13 +5,25 @@ Created on Mon Feb 27 14:19:24 2023
 
 @author: MSU QSIDE JUSTFAIR 2023 Team
 """
+import glob
+import hashlib
+import itertools
+import os
+import pickle
+import tempfile
+
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 
-from JUSTFAIR_Tools.toolbox import subset_data_multi_level_summary, filter_years, tb_compare_section_to_larger_group
+from JUSTFAIR_Tools.toolbox import subset_data_multi_level_summary, summary_from_counts, filter_years, tb_compare_section_to_larger_group, tb_compare_all_sections, add_year_counts, plot_summary, years_key, select_rows, compile_filter, plain_levels
+from JUSTFAIR_Tools.significance import tb_test_all_sections
+from JUSTFAIR_Tools.plotting import new_figure
+from JUSTFAIR_Tools.cache import load_cached_csv, load_cached_arrow, read_columnar, write_columnar, columnar_format, source_fingerprint, source_signature, QueryCache, DiskQueryCache
 #from JUSTFAIR_Tools.plotting import plot_section_vs_state, plot_section_vs_state_trends, plot_section_and_rest_data
 
+SNAPSHOT_VERSION = 1  # bump when the snapshot layout written by State.save changes
+SNAPSHOT_ARRAYS = ['years', 'year_departure_counts']  # numpy attributes saved as .npy files, so they can be memory-mapped
+
 ### State class
 class State:
     
@@ -19,7 +31,11 @@ class State:
                  order_of_outputs = ['Above Departure', 'Within Range', 'Below Range', 
                                         'Missing, Indeterminable, or Inapplicable'], 
                  colors = ['lightcoral', 'lightgrey', 'cornflowerblue', 'turquoise'],
-                 using_url = True):
+                 using_url = True, cache_dir = None, cache_max_age = None, refresh_cache = False,
+                 prune_columns = False, chunksize = None, spill_dir = None, lazy = False,
+                 backend = 'pandas', arrow_path = None, index_paths = None, partition_by_year = False,
+                 summary_cube_depth = None, query_cache_size = 128, query_cache_dir = None, 
+                 query_cache_max_bytes = 256 * 2**20, aggregation = 'pandas'):
         """
         Constructor for the state class.  State objects are how you call analysis functions for a state's judicial data.
 
@@ -43,6 +59,66 @@ class State:
             he default is ['lightcoral', 'lightgrey', 'cornflowerblue', 'turquoise'].
         using_url : bool, optional
             If true, load assuming a url is given.  If false, assumes loading from local file. The default is True.
+        cache_dir : str, optional
+            directory for a columnar (parquet) copy of the state's data.  The first load parses the csv and writes the copy,
+            later loads read the copy instead, which is much faster for big states.  If the local file changes, the copy is rebuilt.
+            The default is None, which always reads the csv.
+        cache_max_age : float, optional
+            rebuild the cached copy if it is older than this many seconds.  Useful for urls, where we can't tell if the 
+            file changed.  The default is None, which never expires the copy by age.
+        refresh_cache : bool, optional
+            if True, rebuild the cached copy even if it looks fresh. The default is False.
+        prune_columns : bool, optional
+            if True, only load the columns our paths point to, and store them with compact dtypes 
+            (categoricals for columns like judge, county, race, sex and departure, small ints for numbers).  
+            On wide state datasets this uses a fraction of the memory and speeds up every groupby. The default is False.
+        chunksize : int, optional
+            if given, build the state in one pass over the csv, this many rows at a time, so the csv never has to fit in memory.  
+            The yearly averages are added up chunk by chunk, and each chunk is pruned (see prune_columns) and spilled to disk, 
+            then read back into a compact copy, which becomes the state's data.  With cache_dir, the compact copy is cached 
+            there (like the parquet copy), so later loads don't read the csv. The default is None, which reads the whole csv at once.
+        spill_dir : str, optional
+            where the chunks are spilled when chunksize is given.  They are deleted once they are read back.  
+            The default is None, which uses cache_dir if given, otherwise a temporary directory.
+        lazy : bool, optional
+            if True, don't load anything yet.  data, years, average_percents and yearly_average_percents are loaded / computed 
+            the first time they are used, and then kept.  This makes building many states up front cheap, as we only pay 
+            for the ones we query. The default is False.
+        backend : str, optional
+            'pandas' keeps the data in a pandas DataFrame in this process.  'arrow' keeps it in a memory-mapped Arrow IPC file 
+            (needs pyarrow), available as table.  Processes on one machine that load the same state map the same file, so 
+            they share a single physical copy of the data.  filter_years and tb_compare_section_to_larger_group filter the 
+            table and only copy out the rows they need; using data directly copies the whole table. The default is 'pandas'.
+        arrow_path : str, optional
+            the Arrow IPC file for the arrow backend.  The default is None, which puts it in cache_dir, spill_dir or the 
+            system's temporary directory, named after the data's url or file path.
+        index_paths : list, optional
+            path names (ex: ['judge', 'county']) to keep an index for.  An index maps each value in the path's column to the 
+            rows that have it, so finding a judge's rows is a lookup instead of a comparison over every row.  
+            Indexes are built the first time they are used. The default is None, no indexes.
+        partition_by_year : bool, optional
+            if True, store the data sorted by year, and keep where each year's rows start and stop.  
+            Filtering for years is then a slice of the data (a zero copy slice of the table with the arrow backend), 
+            rather than a comparison over every row. The default is False.
+        summary_cube_depth : int, optional
+            if given, generalizable_multi_level_summary is answered from a summary cube (see build_summary_cube) holding 
+            the counts for every combination of up to this many paths, by year and departure.  The cube is built the first 
+            time it is needed. The default is None, no cube.
+        query_cache_size : int, optional
+            how many results of generalizable_multi_level_summary and the compare functions to remember, so asking 
+            the same question twice doesn't redo the work.  The cache is cleared when the data changes.
+            0 turns it off. The default is 128.
+        query_cache_dir : str, optional
+            directory for a query cache on disk (see DiskQueryCache), so results are remembered across sessions.  
+            Results are keyed by dataset_fingerprint and the query, and expire after cache_max_age seconds if it is set.  
+            The default is None, results are only remembered in memory.
+        query_cache_max_bytes : int, optional
+            the most bytes of results to keep in query_cache_dir, the results used longest ago are deleted first. 
+            The default is 256 MB.
+        aggregation : str, optional
+            how summaries count the people in each group.  'pandas' uses a groupby, 'bincount' encodes the groups as 
+            integer codes and counts them all with one np.bincount (see bincount_group_counts), which is usually faster.
+            Both give the same results, and benchmark_aggregation compares them on your data. The default is 'pandas'.
 
         Returns
         -------
@@ -51,71 +127,1019 @@ class State:
         """
         self.name = inp_name  # set the name
         
-        if using_url:  
-            url=inp_data_url
-            url='https://drive.google.com/uc?id=' + url.split('/')[-2]  # convert url to correct format
-            self.data = pd.read_csv(url, low_memory = False)  # pandas dataframe object
-        else:
-            file_path = inp_data_url
-            self.data = pd.read_csv(file_path, low_memory = False)  # just reading from a file
-        
         self.paths = inp_paths  # dictionary object.  
         # Always follows the format useful_id --> (name_in_data, dict(levels)).
         # Levels doesn't always exist, but is needed for variables like departure
         #path pairs are always (name_in_data, dict(levels)) or (name_in_data, None)
-        
+
         self.order_of_outputs = order_of_outputs
         #this is how you want to arrange your output on graphs
         #is basically the order of the levels in paths[departure][1]
         
         self.colors = colors  # assign colors here.  remember this dictates what graphs will look like
-        
-        self.average_percents= []  #list, for all years, state averages for all people
+
+        # everything we need to load the data later.  Loading happens in _load_data, either now or on first use if lazy
+        self._source = {'inp_data_url': inp_data_url, 'using_url': using_url, 'cache_dir': cache_dir, 
+                        'cache_max_age': cache_max_age, 'refresh_cache': refresh_cache, 'prune_columns': prune_columns, 
+                        'chunksize': chunksize, 'spill_dir': spill_dir, 'arrow_path': arrow_path}
+        self.backend = backend
+        self.index_paths = list(index_paths) if index_paths is not None else []
+        self.partition_by_year = partition_by_year
+        self.summary_cube_depth = summary_cube_depth
+        self.aggregation = aggregation
+        disk_cache = None
+        if query_cache_dir is not None:
+            disk_cache = DiskQueryCache(query_cache_dir, query_cache_max_bytes, cache_max_age)
+        self.query_cache = QueryCache(query_cache_size, disk_cache)  # query parameters --> result, see generalizable_multi_level_summary
+        self._data_replaced = False  # True once data is set by hand, see dataset_fingerprint
+        self._clear_loaded()
+        self.query_cache.fingerprint = self.dataset_fingerprint()
+        if not lazy:
+            self._load_data()
+            self._aggregate()
+
+    def _clear_loaded(self):
+        """
+        Forgets the data and everything computed from it, so the next access to data, years, average_percents, 
+        yearly_average_percents or year_departure_counts loads / computes them again.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._data = None
+        self._table = None  # pyarrow Table, only used by the arrow backend
+        self._years = None
+        self._year_departure_counts = None
+        self._average_percents = None
+        self._yearly_average_percents = None
+        self.indexes = {}  # column name --> {value: row positions}, see get_index
+        self._year_bounds = None  # where each year's rows start and stop when partition_by_year, see year_ranges
+        self.summary_cube = None  # frozenset of column names --> counts, see build_summary_cube
+        self.query_cache.clear()
+
+    def _load_data(self):
+        """
+        Loads the state's data.  With the pandas backend this sets data, with the arrow backend it maps table 
+        (writing the Arrow file from _read_data first if it is missing or stale).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.query_cache.fingerprint = self.dataset_fingerprint()  # the source may have changed since the constructor
+        if self.backend != 'arrow':
+            self._data = self._partition(self._read_data())
+            return
+
+        source = self._source
+        if 'snapshot' in source:  # the snapshot's data file is the source
+            signature_source, using_url = os.path.join(source['snapshot'], source['profile']['data_file']), False
+            default_dir, variant = source['snapshot'], 'snapshot'
+        else:
+            signature_source, using_url = source['inp_data_url'], source['using_url']
+            default_dir = source['cache_dir'] if source['cache_dir'] is not None else source['spill_dir']
+            variant = 'pruned' if source['prune_columns'] or source['chunksize'] is not None else 'full'
+        if self.partition_by_year:
+            variant += ' partitioned'
+        arrow_path = source.get('arrow_path')
+        if arrow_path is None:  # the same default for every process, so they all map the same file
+            if default_dir is None:
+                default_dir = tempfile.gettempdir()
+            arrow_path = os.path.join(default_dir, source_fingerprint(signature_source, using_url) + '.arrow')
+        self._table = load_cached_arrow(signature_source, arrow_path, lambda: self._partition(self._read_data()), using_url, 
+                                        max_age = source.get('cache_max_age'), refresh = source.get('refresh_cache', False), 
+                                        variant = variant)
+
+    def _read_data(self):
+        """
+        Reads the state's data from wherever self._source points: a csv (possibly through the cache or in chunks) 
+        or a snapshot directory written by save.
+
+        Returns
+        -------
+        data : pandas DataFrame
+            the state's data.
+
+        """
+        source = self._source
+        if 'snapshot' in source:
+            return self._read_snapshot_data(source['snapshot'], source['profile'])
+
+        inp_data_url, using_url, cache_dir = source['inp_data_url'], source['using_url'], source['cache_dir']
+        if source['chunksize'] is not None:  # one pass over the csv, we get the data and the year x departure counts together
+            spill_dir = source['spill_dir'] if source['spill_dir'] is not None else cache_dir
+            streamed = {}
+
+            def stream():
+                data, streamed['years'], streamed['counts'] = self._stream_csv(inp_data_url, using_url, 
+                                                                              source['chunksize'], spill_dir)
+                return data
+
+            if cache_dir is None:
+                data = stream()
+            else:  # keep the compact copy, so later loads skip the csv entirely
+                data = load_cached_csv(inp_data_url, cache_dir, stream, using_url, max_age = source['cache_max_age'], 
+                                       refresh = source['refresh_cache'], variant = 'pruned ' + ','.join(self._path_columns()))
+            if 'years' in streamed:
+                self._years, self._year_departure_counts = streamed['years'], streamed['counts']
+            else:  # read from the cache.  Parquet can drop some compact dtypes, and we count it up again (one bincount)
+                data = self._compact_dtypes(data)
+                self._years, self._year_departure_counts = self._count_year_departures(data)
+            return data
+
+        columns = None  # None means load every column
+        if source['prune_columns']:
+            columns = self._path_columns()
+        if cache_dir is None:
+            data = self._read_csv(inp_data_url, using_url, columns)  # pandas dataframe object
+        else:  # the cache always holds every column, so a pruned and an unpruned state can share it
+            data = load_cached_csv(inp_data_url, cache_dir, lambda: self._read_csv(inp_data_url, using_url),
+                                   using_url, max_age = source['cache_max_age'], refresh = source['refresh_cache'], 
+                                   columns = columns)
+        if source['prune_columns']:  # usecols keeps the csv's order, the cache and chunked reads give the paths' order
+            data = self._compact_dtypes(data[columns])
+        return data
+
+    def _columns(self, columns):
+        """
+        Gets some columns of the state's data as a pandas DataFrame.  
+        With the arrow backend only these columns are copied out of the table.
+
+        Parameters
+        ----------
+        columns : list
+            column names.
+
+        Returns
+        -------
+        pandas DataFrame
+            the columns.
+
+        """
+        if self.backend == 'arrow' and self._data is None:
+            return self.table.select(columns).to_pandas()
+        return self.data[columns]
+
+    def __getstate__(self):
+        """
+        Pickling support (ex: sending a state to a StateCollection worker).  An arrow backed state is pickled without
+        its table, and maps the Arrow file again on the other side, so processes share the file instead of copies.
+        Once rows are appended the table no longer matches the file, so it is pickled with the state.
+        """
+        state = self.__dict__.copy()
+        if self.backend == 'arrow' and not self._data_replaced:
+            state['_table'] = None
+            state['_data'] = None
+        return state
+
+    def _aggregate(self):
+        """
+        Gets the year x departure count cube (from the data if we don't have it yet), and the averages from it.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self._year_departure_counts is None:
+            year_departure = [self.paths['year'].df_colname, self.paths['departure'].df_colname]
+            self._years, self._year_departure_counts = self._count_year_departures(self._columns(year_departure))
+        if self._average_percents is None:
+            self._set_averages_from_counts()
+
+    def dataset_fingerprint(self):
+        """
+        Builds a key identifying the state's data and how it is read: a hash of the source (url, local file or snapshot), 
+        its signature (size and modification time for files, see source_signature), the paths and order_of_outputs.
+        Two sessions loading the same unchanged file get the same fingerprint, so they can share cached query results.
+
+        Returns
+        -------
+        str or None
+            hex digest, or None if the data was set by hand and we can't tell where it came from.
+
+        """
+        if self._data_replaced:
+            return None
+        source = self._source
+        try:
+            if 'snapshot' in source:
+                signature = source_signature(os.path.join(source['snapshot'], source['profile']['data_file']), False)
+            else:
+                signature = source_signature(source['inp_data_url'], source['using_url'])
+        except OSError:  # the file is gone
+            return None
+        paths = sorted((name, path.df_colname, path.levels) for name, path in self.paths.items())
+        described = repr((signature, paths, list(self.order_of_outputs)))
+        return hashlib.sha1(described.encode('utf-8')).hexdigest()
+
+### Indexes
+
+    def build_index(self, path_name):
+        """
+        Builds (or rebuilds) the index for a path, and keeps it for later lookups.  See get_index.
+
+        Parameters
+        ----------
+        path_name : str
+            the name of the path to index, ex: 'judge'.
+
+        Returns
+        -------
+        dict
+            the index, value --> sorted numpy array of row positions.
+
+        """
+        if path_name not in self.index_paths:
+            self.index_paths.append(path_name)
+        colname = self.paths[path_name].df_colname
+        column = self._columns([colname])[colname].reset_index(drop = True)
+        self.indexes[colname] = column.groupby(column, observed = True, sort = False).indices  # NaN values aren't indexed
+        return self.indexes[colname]
+
+    def get_index(self, colname):
+        """
+        Gets the index for a column of the state's data, building it if its path is in index_paths and it hasn't been built.
+
+        Parameters
+        ----------
+        colname : str
+            the column name in the state's data.
+
+        Returns
+        -------
+        dict
+            value --> sorted numpy array of the positions of the rows with that value.  None if the column isn't indexed.
+
+        """
+        if colname not in self.indexes:
+            for path_name in self.index_paths:
+                if self.paths[path_name].df_colname == colname:
+                    return self.build_index(path_name)
+            return None
+        return self.indexes[colname]
+
+### Year Partitions
+
+    def _partition(self, data):
+        """
+        Sorts the data by year if partition_by_year (rows with no year go last), keeping rows in the same order within a year.
+
+        Parameters
+        ----------
+        data : pandas DataFrame
+            the state's data.
+
+        Returns
+        -------
+        pandas DataFrame
+            the data, sorted by year if partition_by_year.
+
+        """
+        if not self.partition_by_year:
+            return data
+        year_colname = self.paths['year'].df_colname
+        if not data[year_colname].is_monotonic_increasing:
+            data = data.sort_values(year_colname, kind = 'stable', na_position = 'last')
+        return data.reset_index(drop = True)
+
+    def year_ranges(self, years):
+        """
+        Finds the rows holding a set of years, for a state using partition_by_year.  
+        Years next to each other are merged into one range, so a span of years is a single slice.
+
+        Parameters
+        ----------
+        years : list
+            the years to find.  Years with no data are skipped.
+
+        Returns
+        -------
+        list
+            list of (start, stop) row positions, in order.
+
+        """
+        if self._year_bounds is None:
+            year_colname = self.paths['year'].df_colname
+            year_values = self._columns([year_colname])[year_colname].to_numpy()
+            self._year_bounds = (np.searchsorted(year_values, self.years, 'left'), 
+                                 np.searchsorted(year_values, self.years, 'right'))
+        starts, stops = self._year_bounds
+
+        year_positions = np.unique(np.searchsorted(self.years, years))
+        year_positions = year_positions[year_positions < len(self.years)]
+        year_positions = year_positions[np.isin(self.years[year_positions], years)]
+        ranges = []
+        for pos in year_positions:
+            if len(ranges) > 0 and ranges[-1][1] == starts[pos]:  # continues the last range
+                ranges[-1] = (ranges[-1][0], int(stops[pos]))
+            else:
+                ranges.append((int(starts[pos]), int(stops[pos])))
+        return ranges
+
+### Summary Cube
+
+    def build_summary_cube(self, max_depth = 2, path_names = None):
+        """
+        Builds the summary cube: the number of people for every combination of up to max_depth paths, crossed with year 
+        and departure.  Any generalizable_multi_level_summary grouping by at most max_depth of these paths (plus year) 
+        is then answered by adding up the cube rather than grouping the raw data.
+        The combinations with max_depth paths are counted from the data, smaller ones are summed out of them.
+
+        Parameters
+        ----------
+        max_depth : int, optional
+            the most paths (other than year and departure) in a combination. The default is 2.
+        path_names : list, optional
+            the paths to combine.  The default is None, which uses every path but year and departure.
+
+        Returns
+        -------
+        dict
+            frozenset of column names --> pandas Series of counts, indexed by (year, the columns..., departure).  
+            Missing values are kept in the index, so the counts add up the same way a groupby of the data would.
+
+        """
+        year_colname = self.paths['year'].df_colname
+        departure_colname = self.paths['departure'].df_colname
+        if path_names is None:
+            path_names = [name for name in self.paths if name not in ('year', 'departure')]
+        dims = []  # column names
+        for name in path_names:
+            colname = self.paths[name].df_colname
+            if colname not in dims and colname not in (year_colname, departure_colname):
+                dims.append(colname)
+
+        depth = min(max_depth, len(dims))
+        data = self._columns([year_colname] + dims + [departure_colname])
+        self.summary_cube = self._count_summary_cube(data, dims, depth)
+        self.summary_cube_depth = max_depth
+        return self.summary_cube
+
+    def _count_summary_cube(self, data, dims, depth):
+        """
+        Counts a summary cube from some data, see build_summary_cube.
+
+        Parameters
+        ----------
+        data : pandas DataFrame
+            the data to count, with the year, departure and dims columns.
+        dims : list
+            column names to combine.
+        depth : int
+            the most columns in a combination.
+
+        Returns
+        -------
+        dict
+            frozenset of column names --> pandas Series of counts, indexed by (year, the columns..., departure).
+
+        """
+        year_colname = self.paths['year'].df_colname
+        departure_colname = self.paths['departure'].df_colname
+        largest = list(itertools.combinations(dims, depth))
+        cube = {}
+        for combo in largest:
+            cube[frozenset(combo)] = data.groupby([year_colname] + list(combo) + [departure_colname], 
+                                                  dropna = False, observed = True).size()
+        for size in range(depth - 1, -1, -1):
+            for combo in itertools.combinations(dims, size):
+                parent = next(c for c in largest if set(combo) <= set(c))  # a cube that has all of combo's columns
+                cube[frozenset(combo)] = cube[frozenset(parent)].groupby(level = [year_colname] + list(combo) + [departure_colname], 
+                                                                         dropna = False, observed = True).sum()
+        return cube
+
+    def _summary_counts_from_cube(self, inp_list_of_groups, years):
+        """
+        Gets the counts and totals subset_data_multi_level_summary would compute for this grouping and year filter, 
+        from the summary cube.
+
+        Parameters
+        ----------
+        inp_list_of_groups : list
+            the list of groups to group by, ending with 'departure'.
+        years : list
+            years to filter for, or None for all years.
+
+        Returns
+        -------
+        tuple
+            (counts, totals) to pass to summary_from_counts, or None if the cube can't answer this query.
+
+        """
+        if self.summary_cube is None:
+            if self.summary_cube_depth is None:
+                return None
+            self.build_summary_cube(self.summary_cube_depth)
+        if inp_list_of_groups[-1] != 'departure':
+            return None
+        year_colname = self.paths['year'].df_colname
+        colnames = [self.paths[group].df_colname for group in inp_list_of_groups]
+        if len(set(colnames)) != len(colnames):
+            return None
+        cube = self.summary_cube.get(frozenset(colnames[:-1]) - {year_colname})
+        if cube is None:
+            return None
+
+        if years is not None:
+            cube = cube[cube.index.get_level_values(year_colname).isin(years)]
+        has_groups = np.ones(len(cube), dtype = bool)  # a groupby of the data drops rows missing any of its groups
+        for colname in colnames[:-1]:
+            has_groups &= cube.index.get_level_values(colname).notna()
+        has_departure = cube.index.get_level_values(colnames[-1]).notna()
+        counts = plain_levels(cube[has_groups & has_departure].groupby(level = colnames, observed = True).sum())
+        if len(colnames) > 1:
+            totals = plain_levels(cube[has_groups].groupby(level = colnames[:-1], observed = True).sum())
+        else:
+            totals = cube.sum()
+        return counts, totals
+
+### Append
+
+    def append(self, new_rows):
+        """
+        Adds new sentencing records (ex: a newly published year) to the state, without rebuilding it.
+        Everything computed from the data is updated from the new rows alone:
+            years, year_departure_counts, average_percents and yearly_average_percents: the new rows' year x departure 
+                counts are added to the count cube, and the averages are recomputed from the cube (one row per year)
+            indexes: the new rows' positions are added to each value's positions
+            year partitions: if the new rows are all in or after the last year, they go on the end and only the 
+                new years' bounds are added.  Otherwise the data is re-sorted and the partitions rebuilt.
+            summary cube: the new rows are counted into a small cube, which is added to the old one
+        Cached query results are dropped, and the state stops using the disk query cache, since its data no longer 
+        matches its source.  The new rows are only kept in memory, save a snapshot to keep them.
+
+        Parameters
+        ----------
+        new_rows : pandas DataFrame
+            the new records, with (at least) the same columns as the state's data.  Values are encoded like the 
+            original data (ex: departure codes, not names).
+
+        Returns
+        -------
+        None.
+
+        """
+        columns = list(self.table.column_names) if self.backend == 'arrow' else list(self.data.columns)
+        missing = [col for col in columns if col not in new_rows.columns]
+        if len(missing) > 0:
+            raise ValueError('new rows are missing the columns ' + str(missing))
+        new_rows = self._partition(new_rows[columns].reset_index(drop = True))  # sorted by year, if partitioned
+        n_old = self.table.num_rows if self.backend == 'arrow' else self.data.shape[0]
+        year_colname = self.paths['year'].df_colname
+
+        # 1. the count cube and averages
+        new_years, new_counts = self._count_year_departures(new_rows)
+        old_years = self.years
+        in_order = True  # are the rows still sorted by year with the new rows on the end?
+        if self.partition_by_year and len(new_years) > 0 and len(old_years) > 0:
+            in_order = new_years[0] >= old_years[-1] and new_rows[year_colname].notna().all()
+            if in_order and self._year_bounds is None:
+                self.year_ranges([])  # bounds of the old rows, before the new ones are added
+        self._years, self._year_departure_counts = add_year_counts(old_years, self.year_departure_counts, new_years, new_counts)
+        self._set_averages_from_counts()
+
+        # 2. the data
+        if self.backend == 'arrow':
+            self._table = self._append_table(new_rows)
+            self._data = None
+        else:
+            self._data = pd.concat([self.data, self._match_dtypes(new_rows)], ignore_index = True)
+        if not in_order:  
+            self.data = self.data  # the setter re-sorts it and drops everything that depends on row positions
+        else:
+            # 3. the indexes
+            for colname, index in self.indexes.items():
+                column = new_rows[colname]
+                for value, positions in column.groupby(column, observed = True, sort = False).indices.items():
+                    positions = positions + n_old
+                    index[value] = np.concatenate([index[value], positions]) if value in index else positions
+            # 4. the year partitions
+            if self.partition_by_year and self._year_bounds is not None:
+                new_year_values = new_rows[year_colname].to_numpy()
+                old_starts, old_stops = self._year_bounds
+                starts = np.zeros(len(self._years), dtype = np.int64)
+                stops = np.zeros(len(self._years), dtype = np.int64)
+                in_old = np.isin(self._years, old_years)
+                in_new = np.isin(self._years, new_years)
+                old_positions = np.searchsorted(old_years, self._years[in_old])
+                starts[in_old] = old_starts[old_positions]
+                stops[in_old] = old_stops[old_positions]
+                new_only = in_new & ~in_old
+                starts[new_only] = n_old + np.searchsorted(new_year_values, self._years[new_only], 'left')
+                stops[in_new] = n_old + np.searchsorted(new_year_values, self._years[in_new], 'right')
+                self._year_bounds = (starts, stops)
+            # 5. the summary cube
+            if self.summary_cube is not None:
+                largest = max(self.summary_cube, key = len)
+                depth = len(largest)
+                dims = sorted(set().union(*self.summary_cube.keys()))
+                new_cube = self._count_summary_cube(new_rows[[year_colname] + dims + [self.paths['departure'].df_colname]], 
+                                                    dims, depth)
+                for combo, counts in self.summary_cube.items():
+                    added = new_cube[combo].reorder_levels(counts.index.names)  # dims may be in another order
+                    self.summary_cube[combo] = pd.concat([counts, added]).groupby(
+                        level = list(range(counts.index.nlevels)), dropna = False, observed = True).sum()
+
+        # 6. the query caches
+        self.query_cache.clear()
+        self._data_replaced = True
+        self.query_cache.fingerprint = None
+
+    def _match_dtypes(self, new_rows):
+        """
+        Gives new rows the same categorical columns as the state's data, so concatenating them keeps the compact dtypes.
+        New values are added to the categories (kept sorted, like _compact_dtypes), which recodes the old column.
+
+        Returns
+        -------
+        pandas DataFrame
+            the new rows.
+
+        """
+        matched = {}
+        for col in new_rows.columns:
+            dtype = self._data[col].dtype
+            if isinstance(dtype, pd.CategoricalDtype):
+                categories = list(dtype.categories)
+                added = [value for value in new_rows[col].dropna().unique().tolist() if value not in dtype.categories]
+                if len(added) > 0:
+                    try:
+                        categories = sorted(categories + added)
+                    except TypeError:  # mixed types can't be sorted
+                        categories = categories + added
+                    self._data[col] = self._data[col].cat.set_categories(categories)
+                matched[col] = pd.Categorical(new_rows[col], categories = categories)
+            else:
+                matched[col] = new_rows[col]
+        return pd.DataFrame(matched, index = new_rows.index)
+
+    def _append_table(self, new_rows):
+        """
+        Adds new rows to the state's Arrow table, for the arrow backend.  The new rows get the table's schema.
+        Dictionary encoded (categorical) columns encode the new rows with the table's dictionary.  If there are new 
+        values, they're added to the dictionary (kept sorted, like _compact_dtypes) and the column is recoded.
+
+        Returns
+        -------
+        pyarrow Table
+            the old rows followed by the new rows.  The old rows' buffers aren't copied, unless a column was recoded.
+
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        table = self.table.unify_dictionaries()  # every chunk of a column shares one dictionary
+        new_table = pa.Table.from_pandas(new_rows, preserve_index = False)
+        old_columns, new_columns, fields = [], [], []
+        for field in table.schema:
+            old_column = table.column(field.name)
+            new_column = new_table.column(field.name)
+            if not pa.types.is_dictionary(field.type):
+                old_columns.append(old_column)
+                new_columns.append(new_column.cast(field.type))
+                fields.append(field)
+                continue
+            value_type = field.type.value_type
+            new_column = new_column.cast(value_type)
+            dictionary = old_column.chunk(0).dictionary if old_column.num_chunks > 0 else pa.array([], type = value_type)
+            new_values = pc.unique(new_column.drop_null())
+            new_values = pc.filter(new_values, pc.invert(pc.is_in(new_values, value_set = dictionary)))
+            index_type = field.type.index_type
+            if len(new_values) > 0:
+                values = dictionary.to_pylist() + new_values.to_pylist()
+                try:
+                    values = sorted(values)
+                except TypeError:  # mixed types can't be sorted
+                    pass
+                dictionary = pa.array(values, type = value_type)
+                if len(dictionary) > np.iinfo(index_type.to_pandas_dtype()).max:
+                    index_type = pa.int32()
+                old_column = pa.chunked_array([pa.DictionaryArray.from_arrays(
+                    pc.index_in(chunk.cast(value_type), value_set = dictionary).cast(index_type), dictionary) 
+                    for chunk in old_column.chunks], type = pa.dictionary(index_type, value_type))
+            new_column = pa.chunked_array([pa.DictionaryArray.from_arrays(
+                pc.index_in(chunk, value_set = dictionary).cast(index_type), dictionary) 
+                for chunk in new_column.chunks], type = pa.dictionary(index_type, value_type))
+            old_columns.append(old_column)
+            new_columns.append(new_column)
+            fields.append(pa.field(field.name, pa.dictionary(index_type, value_type), field.nullable))
+        schema = pa.schema(fields, metadata = table.schema.metadata)
+        return pa.concat_tables([pa.Table.from_arrays(old_columns, schema = schema), 
+                                 pa.Table.from_arrays(new_columns, schema = schema)])
+
+### Lazily Loaded Attributes
+    # these are computed on first access when the state is lazy, and are then kept
+
+    @property
+    def data(self):
+        if self._data is None:
+            if self.backend == 'arrow':  # copies the whole table into pandas, the toolbox functions avoid this
+                self._data = self.table.to_pandas()
+            else:
+                self._load_data()
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = self._partition(value) if value is not None else None
+        if self.backend == 'arrow':  # the toolbox functions read the table, so it has to match
+            import pyarrow as pa
+
+            self._table = pa.Table.from_pandas(self._data, preserve_index = False) if self._data is not None else None
+        self.indexes = {}  # row positions point into the old data
+        self._year_bounds = None
+        self.summary_cube = None
+        self.query_cache.clear()  # cached results are for the old data
+        self._data_replaced = True
+        self.query_cache.fingerprint = None  # we can't tell what this data is, so it stays out of the disk cache
+
+    @property
+    def table(self):
+        if self.backend == 'arrow' and self._table is None:
+            self._load_data()
+        return self._table
+
+    @property
+    def years(self):
+        if self._years is None:
+            self._aggregate()
+        return self._years
+
+    @years.setter
+    def years(self, value):
+        self._years = value
+
+    @property
+    def year_departure_counts(self):
+        if self._year_departure_counts is None:
+            self._aggregate()
+        return self._year_departure_counts
+
+    @year_departure_counts.setter
+    def year_departure_counts(self, value):
+        self._year_departure_counts = value
+
+    @property
+    def average_percents(self):
+        if self._average_percents is None:
+            self._aggregate()
+        return self._average_percents
+
+    @average_percents.setter
+    def average_percents(self, value):
+        self._average_percents = value
+
+    @property
+    def yearly_average_percents(self):
+        if self._yearly_average_percents is None:
+            self._aggregate()
+        return self._yearly_average_percents
+
+    @yearly_average_percents.setter
+    def yearly_average_percents(self, value):
+        self._yearly_average_percents = value
+
+    def _stream_csv(self, inp_data_url, using_url, chunksize, spill_dir):
+        """
+        Reads the state's csv in chunks, in a single pass.  For every chunk we:
+            1. keep only the columns our paths point to
+            2. add its year x departure counts to a running total
+            3. spill it to spill_dir in a columnar format
+        Once every chunk is spilled, the columns are read back one at a time and given compact dtypes, 
+        so we never hold more than one uncompacted column in memory.
+
+        Parameters
+        ----------
+        inp_data_url : str
+            url or local file path for the state's data.
+        using_url : bool
+            If true, load assuming a url is given.  If false, assumes loading from local file.
+        chunksize : int
+            number of rows to read at a time.
+        spill_dir : str
+            directory the chunks are written to, or None for a temporary directory.  The chunks are deleted at the end.
+
+        Returns
+        -------
+        data : pandas DataFrame
+            the state's pruned, compacted data.
+        years : numpy array
+            sorted years in the data.
+        year_departure_counts : numpy array
+            the year x departure count cube, see _count_year_departures.
+
+        """
+        if spill_dir is None:
+            with tempfile.TemporaryDirectory(prefix = 'justfair_') as temp_dir:
+                return self._stream_csv(inp_data_url, using_url, chunksize, temp_dir)
+        os.makedirs(spill_dir, exist_ok = True)
+        prefix = os.path.join(spill_dir, source_fingerprint(inp_data_url, using_url) + '-part')
+        for old_part in glob.glob(prefix + '*'):  # clear out parts from an earlier run, they might have more chunks than this one
+            os.remove(old_part)
+        file_format = columnar_format()
+        extension = '.parquet' if file_format == 'parquet' else '.pkl'
+
+        columns = self._path_columns()
+        years = np.array([])
+        year_departure_counts = np.zeros((0, len(self.order_of_outputs) + 1), dtype = np.int64)
+        parts = []
+        for chunk in self._read_csv(inp_data_url, using_url, columns, chunksize = chunksize):
+            chunk_years, chunk_counts = self._count_year_departures(chunk)
+            years, year_departure_counts = add_year_counts(years, year_departure_counts, chunk_years, chunk_counts)
+            part = prefix + str(len(parts)).zfill(5) + extension
+            write_columnar(chunk, part, file_format)
+            parts.append(part)
+
+        data = {}
+        for col in columns:  # parts may disagree on dtype (ints in one, floats with NaN in another), concat sorts it out
+            data[col] = pd.concat([read_columnar(part, [col], file_format)[col] for part in parts], ignore_index = True)
+            data[col] = self._compact_dtypes(data[col].to_frame())[col]
+        for part in parts:  # they are only needed to build the compact copy
+            os.remove(part)
+        return pd.DataFrame(data), years, year_departure_counts
+
+    def _count_year_departures(self, df):
+        """
+        Counts the rows for every year and departure type in one vectorized pass, with a single np.bincount.
+        Rows are counted under the position of their (decoded) departure in order_of_outputs.  
+        Rows whose departure is missing, or isn't in order_of_outputs, go in an extra last column,
+        as they still count towards the year's total.  Rows with a missing year are not counted.
+
+        Parameters
+        ----------
+        df : pandas DataFrame
+            the state's data, or a piece of it.
+
+        Returns
+        -------
+        years : numpy array
+            sorted years in df.
+        counts : numpy array
+            integer array in the shape of (len(years), len(order_of_outputs) + 1).  
+            counts[i, j] is the number of rows in years[i] with departure order_of_outputs[j].
+
+        """
+        year_values = df[self.paths['year'].df_colname]
+        departures = df[self.paths['departure'].df_colname]
+        if self.paths['departure'].levels is not None:
+            departures = departures.map(self.paths['departure'].levels)  # decode, for categoricals this only maps the categories
+
+        has_year = year_values.notna().to_numpy()
+        year_values = year_values.to_numpy()[has_year]
+        years = np.unique(year_values)  # sorted
+        year_codes = np.searchsorted(years, year_values)
+        departure_codes = pd.Index(self.order_of_outputs).get_indexer(departures)[has_year].astype(np.int64)
+        departure_codes[departure_codes < 0] = len(self.order_of_outputs)  # missing or unknown departure
+
+        width = len(self.order_of_outputs) + 1
+        counts = np.bincount(year_codes * width + departure_codes, minlength = len(years) * width)
+        return years, counts.reshape(len(years), width).astype(np.int64)
+
+    def _set_averages_from_counts(self):
+        """
+        Sets average_percents and yearly_average_percents from the year x departure count cube.
+        Percents are out of every row for the year (or the whole state), including rows with a missing departure.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.average_percents = list(self.calc_state_avg_for_yearspan(self.years, weighted = True))  #list, for all years, state averages for all people
         self.yearly_average_percents = {}  # dictionary, state averages for all people for each year
                                              # format of: year (int) --> [averages_list]
-        
-        self.years = np.sort(self.data[self.paths['year'].df_colname].unique())  # generate a sorted list of years for data
+        yearly_percents = self._yearly_percents()
+        for year in range(len(self.years)):
+            self.yearly_average_percents[self.years[year]] = list(yearly_percents[year])
 
+    def _yearly_percents(self):
+        """
+        The percent of each year's rows for each departure type, from the year x departure count cube.
 
+        Returns
+        -------
+        numpy array
+            in the shape of (len(years), len(order_of_outputs)), rounded to 2 decimal places.
 
-        ###  get average_percents
-        
-        counts = self.data.groupby(self.paths['departure'].df_colname).count()  # group by each departure type
-        counts = counts.rename(self.paths['departure'].levels)  # rename departure to match the levels dictionary
-        counts = counts.iloc[:,0]  # pull the counts
+        """
+        year_totals = self.year_departure_counts.sum(axis = 1)
+        return np.round(100 * self.year_departure_counts[:, :-1] / year_totals[:, None], 2)
 
-        for item in self.order_of_outputs:
-            self.average_percents.append(round((100 * counts.loc[item]  /  self.data.shape[0]),2))  # calculate the percent by dividing each subtotal by the total
-        
-        ### get yearly_average_percents
-        for year in self.years:
-            subset_dat = self.data[ self.data[self.paths['year'].df_colname ] == year]  # filter for the year
-            counts = subset_dat.groupby(self.paths['departure'].df_colname).count()  # group by departure type
-            counts = counts.rename(self.paths['departure'].levels)  # rename departure to match the levels dictionary 
-            counts = counts.iloc[:,0]  # pull the counts
-            
-            percentages = []
-            for item in self.order_of_outputs:
-                percentages.append(round((100 * counts.loc[item]  /  subset_dat.shape[0]),2))  # calcualte percents
-            self.yearly_average_percents[year] = percentages  # add the value to the dictionary
+    def _read_csv(self, inp_data_url, using_url, columns = None, chunksize = None):
+        """
+        Reads the state's csv, either from JUSTFAIR's google drive or a local file.
+
+        Parameters
+        ----------
+        inp_data_url : str
+            url or local file path for the state's data.
+        using_url : bool
+            If true, load assuming a url is given.  If false, assumes loading from local file.
+        columns : list, optional
+            only read these columns. The default is None, which reads every column.
+        chunksize : int, optional
+            if given, return an iterator over chunks of this many rows instead. The default is None.
+
+        Returns
+        -------
+        pandas DataFrame
+            the state's data.
 
-    def save():
         """
-        Saves a state's profile to a file.  Probably a .json
+        if using_url:  
+            url=inp_data_url
+            url='https://drive.google.com/uc?id=' + url.split('/')[-2]  # convert url to correct format
+            return pd.read_csv(url, low_memory = False, usecols = columns, chunksize = chunksize)  # pandas dataframe object
+        else:
+            file_path = inp_data_url
+            return pd.read_csv(file_path, low_memory = False, usecols = columns, chunksize = chunksize)  # just reading from a file
+
+    def _path_columns(self):
+        """
+        Lists the columns in the state's data that our paths point to, in the order they are first used.
 
         Returns
         -------
-        .json file.
+        list
+            column names.
+
         """
-        
-    def load():
+        columns = []
+        for path in self.paths.values():
+            if path.df_colname not in columns:
+                columns.append(path.df_colname)
+        return columns
+
+    def _compact_dtypes(self, df):
+        """
+        Converts the state's data to smaller dtypes.
+        Low cardinality columns (judge, county, race, sex, departure...) become categoricals, which store each value once 
+        and a small integer code per row.  If a path has levels, every level is made a category even if it never shows up.
+        The year column and any other numbers are downcast to the smallest integer type that holds them.
+
+        Parameters
+        ----------
+        df : pandas DataFrame
+            the state's data.
+
+        Returns
+        -------
+        pandas DataFrame
+            the state's data with compact dtypes.
+
+        """
+        levels = {}  # column name --> levels dictionary
+        for path in self.paths.values():
+            if path.levels is not None:
+                levels[path.df_colname] = path.levels
+        year_col = self.paths['year'].df_colname if 'year' in self.paths else None
+
+        compact = {}  # column name --> compacted column
+        for col in df.columns:
+            if col != year_col and (col in levels or df[col].dtype == object or 
+                                    df[col].nunique() <= 0.5 * len(df)):  # low cardinality
+                values = df[col].dropna().unique().tolist()
+                if col in levels:
+                    values += [key for key in levels[col].keys() if key not in values]
+                try:
+                    values = sorted(values)  # keeps groupby output in the same order as before
+                except TypeError:  # mixed types can't be sorted, leave as is
+                    pass
+                compact[col] = pd.Categorical(df[col], categories = values)
+            elif pd.api.types.is_integer_dtype(df[col]):
+                compact[col] = pd.to_numeric(df[col], downcast = 'integer')
+            elif pd.api.types.is_float_dtype(df[col]):
+                compact[col] = pd.to_numeric(df[col], downcast = 'float')
+            else:
+                compact[col] = df[col]
+        return pd.DataFrame(compact, index = df.index)
+
+    def save(self, directory):
         """
-        Loads a state's profile from a file.  Probably a .json
+        Saves a state's profile to a snapshot directory, so it can be reopened with State.load without re-reading the csv 
+        or redoing the constructor's work.  The directory holds:
+            data.parquet (or data.pkl without pyarrow): the state's data, in a columnar format
+            *.npy: the numeric aggregates (years, year x departure counts), which load memory-mapped
+            state.pkl: name, paths (with their levels), order_of_outputs, colors, the average percents and the summary cube
+
+        Parameters
+        ----------
+        directory : str
+            the directory to write the snapshot to.  Created if it doesn't exist, and overwritten if it does.
 
         Returns
         -------
         None.
         """
+        os.makedirs(directory, exist_ok = True)
+        file_format = columnar_format()
+        data_file = 'data.parquet' if file_format == 'parquet' else 'data.pkl'
+        try:
+            write_columnar(self.data, os.path.join(directory, data_file), file_format)
+        except Exception:  # columns with mixed types can't be written to parquet
+            file_format, data_file = 'pickle', 'data.pkl'
+            write_columnar(self.data, os.path.join(directory, data_file), file_format)
+
+        for array_name in SNAPSHOT_ARRAYS:
+            np.save(os.path.join(directory, array_name + '.npy'), np.asarray(getattr(self, array_name)))
+
+        profile = {'snapshot_version': SNAPSHOT_VERSION, 'data_file': data_file, 'data_format': file_format, 
+                   'data_dtypes': self.data.dtypes.to_dict(),
+                   'name': self.name, 'paths': self.paths, 'index_paths': self.index_paths, 
+                   'partition_by_year': self.partition_by_year, 'summary_cube_depth': self.summary_cube_depth,
+                   'query_cache_size': self.query_cache.max_size, 'aggregation': self.aggregation,
+                   'summary_cube': self.summary_cube, 'order_of_outputs': self.order_of_outputs, 'colors': self.colors,
+                   'average_percents': self.average_percents, 'yearly_average_percents': self.yearly_average_percents}
+        with open(os.path.join(directory, 'state.pkl'), 'wb') as f:
+            pickle.dump(profile, f, protocol = pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, directory, mmap = True, lazy = False, backend = 'pandas', arrow_path = None, 
+             query_cache_dir = None, query_cache_max_bytes = 256 * 2**20):
+        """
+        Loads a state's profile from a snapshot directory written by save.
+
+        Parameters
+        ----------
+        directory : str
+            the snapshot directory.
+        mmap : bool, optional
+            if True, the numeric aggregates are memory-mapped rather than read into memory. The default is True.
+        lazy : bool, optional
+            if True, the data is read the first time it is used rather than now. The default is False.
+        backend : str, optional
+            'pandas' or 'arrow', see the constructor.  With 'arrow' the data is converted to an Arrow file in the snapshot 
+            directory the first time, and memory-mapped from then on. The default is 'pandas'.
+        arrow_path : str, optional
+            the Arrow IPC file for the arrow backend.  The default is None, which puts it in the snapshot directory.
+        query_cache_dir : str, optional
+            directory for a query cache on disk, see the constructor. The default is None.
+        query_cache_max_bytes : int, optional
+            the most bytes of results to keep in query_cache_dir. The default is 256 MB.
+
+        Returns
+        -------
+        State
+            the saved state.
+        """
+        with open(os.path.join(directory, 'state.pkl'), 'rb') as f:
+            profile = pickle.load(f)
+        if profile['snapshot_version'] != SNAPSHOT_VERSION:
+            raise ValueError('snapshot version ' + str(profile['snapshot_version']) + ' can not be loaded, expected ' + str(SNAPSHOT_VERSION))
+
+        state = cls.__new__(cls)  # skip the constructor, everything it would compute is in the snapshot
+        state.name = profile['name']
+        state.paths = profile['paths']
+        state.order_of_outputs = profile['order_of_outputs']
+        state.colors = profile['colors']
+        state._source = {'snapshot': directory, 'profile': profile, 'arrow_path': arrow_path}
+        state.backend = backend
+        state.index_paths = profile.get('index_paths', [])
+        state.partition_by_year = profile.get('partition_by_year', False)
+        state.summary_cube_depth = profile.get('summary_cube_depth')
+        state.aggregation = profile.get('aggregation', 'pandas')
+        disk_cache = None
+        if query_cache_dir is not None:
+            disk_cache = DiskQueryCache(query_cache_dir, query_cache_max_bytes)
+        state.query_cache = QueryCache(profile.get('query_cache_size', 128), disk_cache)
+        state._data_replaced = False
+        state._clear_loaded()
+        state.query_cache.fingerprint = state.dataset_fingerprint()
+        state.summary_cube = profile.get('summary_cube')
+        state.average_percents = profile['average_percents']
+        state.yearly_average_percents = profile['yearly_average_percents']
+        for array_name in SNAPSHOT_ARRAYS:
+            setattr(state, array_name, np.load(os.path.join(directory, array_name + '.npy'), mmap_mode = 'r' if mmap else None))
+        if not lazy:
+            state._load_data()
+        return state
+
+    def _read_snapshot_data(self, directory, profile):
+        """
+        Reads the data of a snapshot written by save.
+
+        Parameters
+        ----------
+        directory : str
+            the snapshot directory.
+        profile : dict
+            the snapshot's state.pkl contents.
+
+        Returns
+        -------
+        data : pandas DataFrame
+            the state's data.
+
+        """
+        data = read_columnar(os.path.join(directory, profile['data_file']), file_format = profile['data_format'])
+        for col, dtype in profile['data_dtypes'].items():
+            if data[col].dtype != dtype:  # parquet only round trips categoricals of strings, put the rest back
+                data[col] = data[col].astype(dtype)
+        return data
 
 ### List Paths
     def list_paths(self):
@@ -133,7 +1157,8 @@ class State:
              
 ### Generalizable Multi-Level Summary
 
-    def generalizable_multi_level_summary(self, inp_list_of_groups = ['departure'], years = None, plot = 'stacked bar'):
+    def generalizable_multi_level_summary(self, inp_list_of_groups = ['departure'], years = None, plot = 'stacked bar',
+                                          confidence = None, n_resamples = 1000, seed = None, plot_options = None):
         """
         Note, all the heavy lifting is done by subset_data_multi_level_summary, this function just does some simple filtering and passes the information along.
         
@@ -158,7 +1183,17 @@ class State:
         years : TYPE, optional
             enter a range of years you with to filter for.  If none, looks at all years. The default is None.
         plot : string, optional
-            specifys the plot type.  If not 'bar', 'stacked bar', or 'pie', will not plot.  reccomend entering None if not plotting. The default is 'stacked bar'.
+            specifys the plot type.  If not 'bar', 'stacked bar', 'pie', 'faceted bar' or 'faceted pie', will not plot.  reccomend entering None if not plotting. The default is 'stacked bar'.
+        confidence : float, optional
+            if given (ex: 0.95), add percent_low and percent_high columns with bootstrap confidence intervals for the percents. 
+            The default is None.
+        n_resamples : int, optional
+            number of bootstrap resamples. The default is 1000.
+        seed : int, optional
+            seed for the bootstrap, so the intervals come out the same every time. The default is None.
+        plot_options : dict, optional
+            options for big stacked bar graphs: sort_by (a departure), ascending, top_k and page_size, 
+            ex: {'sort_by': 'Above Departure', 'top_k': 50}.  See plot_departures_stacked_pages. The default is None.
 
         Returns
         -------
@@ -167,57 +1202,110 @@ class State:
 
         """
         # we should have a subplots vs stacked parameter here maybe?  either do lots of individual graphs or stacked
-        subset_dat = filter_years(self, years)  #first, filter for the years we are looking for
-        return subset_data_multi_level_summary(self, subset_dat, self.name, inp_list_of_groups, plot)
+        key = ('generalizable_multi_level_summary', tuple(inp_list_of_groups), years_key(years))
+        if confidence is not None:
+            key += (confidence, n_resamples, seed)
+        comb_df = self.query_cache.get(key) if confidence is None or seed is not None else None  # unseeded intervals are redrawn
+        if comb_df is None:  # not asked before, compute it without plotting, we plot below either way
+            cube_counts = self._summary_counts_from_cube(inp_list_of_groups, years)
+            if cube_counts is not None:  # the summary cube has everything we need, no need to look at the data
+                comb_df = summary_from_counts(self, cube_counts[0], cube_counts[1], self.name, inp_list_of_groups, plot = None,
+                                              confidence = confidence, n_resamples = n_resamples, seed = seed)
+            else:
+                subset_dat = filter_years(self, years)  #first, filter for the years we are looking for
+                comb_df = subset_data_multi_level_summary(self, subset_dat, self.name, inp_list_of_groups, plot = None,
+                                                          confidence = confidence, n_resamples = n_resamples, seed = seed)
+            if confidence is None or seed is not None:
+                self.query_cache.put(key, comb_df)
+        plot_summary(self, comb_df, self.name, inp_list_of_groups, plot, plot_options)
+        return comb_df
     
     
  ### Generalizable Multi-Level Summary   
     
-    def specific_subset_summary(self, tuples_to_filter_by_list, inp_list_of_groups = ['departure'], plot = 'stacked bar'):
+    def specific_subset_summary(self, tuples_to_filter_by_list, inp_list_of_groups = ['departure'], plot = 'stacked bar',
+                                confidence = None, n_resamples = 1000, seed = None, plot_options = None):
         """
         Filters the state's data for a specific subset and then calls subset_data_multi_level_summary on it
         Parameters
         ----------
         tuples_to_filter_by_list : list
             list of tuples to filter by.  in the form of (path_name, [values to filter for]).
+            Values can be the readable names from the path's levels or the values in the data.  
+            A row has to match every tuple.
         inp_list_of_groups : list, optional
             the list of groups to group by.  Remember, keep the last values as 'departure', but you can add values from your paths object before it.. The default is ['departure'].
         plot : string, optional
-            specifys the plot type.  If not 'bar', 'stacked bar', or 'pie', will not plot.  reccomend entering None if not plotting. The default is 'stacked bar'.
+            specifys the plot type.  If not 'bar', 'stacked bar', 'pie', 'faceted bar' or 'faceted pie', will not plot.  reccomend entering None if not plotting. The default is 'stacked bar'.
+        confidence : float, optional
+            if given (ex: 0.95), add bootstrap confidence intervals for the percents, see generalizable_multi_level_summary. 
+            The default is None.
+        n_resamples : int, optional
+            number of bootstrap resamples. The default is 1000.
+        seed : int, optional
+            seed for the bootstrap. The default is None.
+        plot_options : dict, optional
+            options for big stacked bar graphs, see generalizable_multi_level_summary. The default is None.
 
         Returns
         -------
         Pandas DataFrame
             returns a DataFrame that has allthe counts and percentages associated with the charts. 
 
+        Example
+        -------
+        mn.specific_subset_summary([('county', ['Hennepin', 'Ramsey']), ('year', [2015, 2016]), ('sex', ['Female'])], 
+                                   ['race', 'departure'])
+
         """
-        pass
+        key = ('specific_subset_summary', tuple((path_name, tuple(values) if isinstance(values, (list, tuple, set)) else values)
+                                                for path_name, values in tuples_to_filter_by_list), tuple(inp_list_of_groups))
+        if confidence is not None:
+            key += (confidence, n_resamples, seed)
+        comb_df = self.query_cache.get(key) if confidence is None or seed is not None else None  # unseeded intervals are redrawn
+        if comb_df is None:
+            subset_dat = select_rows(self, compile_filter(self, tuples_to_filter_by_list))  # one pass over the data
+            comb_df = subset_data_multi_level_summary(self, subset_dat, self.name, inp_list_of_groups, plot = None,
+                                                      confidence = confidence, n_resamples = n_resamples, seed = seed)
+            if confidence is None or seed is not None:
+                self.query_cache.put(key, comb_df)
+        plot_summary(self, comb_df, self.name, inp_list_of_groups, plot, plot_options)
+        return comb_df
 
 
 
 ### Average from Filter Years
 
-    def calc_state_avg_for_yearspan(self, years):
+    def calc_state_avg_for_yearspan(self, years, weighted = False):
         """
-        Calculates the state's averages for a select span of years.  It uses the state's yearly_average_percents 
+        Calculates the state's averages for a select span of years.  It uses the state's year x departure counts 
         and calculates the mean for the selected years by using the second parameter 'years'.
         
         Parameters
         ----------
         years : list
             the specified years to get the average of.
+        weighted : bool, optional
+            if False, take the mean of each year's percentages, so every year counts the same.  
+            If True, add up the counts for all the years and take the percentages of that, 
+            so years with more sentences count for more.  This is the exact average over everyone sentenced in those years.
+            The default is False.
 
         Returns
         -------
-        rounded : float
+        rounded : numpy array
             returns the average sentencing proportions (percentages) per year, rounded to 2 decimal places.
 
         """
-        avg_for_yearspan = []
-        for year in years:
-            avg_for_yearspan.append(self.yearly_average_percents[year])
-        avg_for_yearspan = np.array(avg_for_yearspan)
-        means = np.mean(avg_for_yearspan, axis = 0)  # take the average of each column.  Gives the average for each departure type
+        year_positions = np.searchsorted(self.years, years)
+        year_positions = np.minimum(year_positions, len(self.years) - 1)
+        missing = self.years[year_positions] != np.asarray(years)
+        if np.any(missing):
+            raise KeyError('no data for years ' + str(np.asarray(years)[missing].tolist()))
+        if weighted:
+            counts = self.year_departure_counts[year_positions].sum(axis = 0)
+            return np.round(100 * counts[:-1] / counts.sum(), 2)
+        means = np.mean(self._yearly_percents()[year_positions], axis = 0)  # take the average of each column.  Gives the average for each departure type
         rounded = means.round(2)
         return rounded
 
@@ -238,15 +1326,14 @@ class State:
 
         Returns
         -------
-        None.
+        matplotlib Figure or list
+            the figure if compressed, otherwise a list of the figures, one per departure.
 
         """
-        state_data_y = np.zeros((len(self.years), len(self.order_of_outputs)))
-        for year in range(len(self.years)):
-            state_data_y[year] = self.yearly_average_percents[self.years[year]]
+        state_data_y = self._yearly_percents()
 
         if compressed:
-            fig, ax = plt.subplots(figsize=(10, 7))  # create figure
+            fig, ax = new_figure(figsize=(10, 7))  # create figure
             for col in range(len(self.order_of_outputs)):  # plot each line on the same figure
                 ax.plot(self.years, state_data_y[:,col], '-o', label=self.order_of_outputs[col], color = self.colors[col])
             # add title, axis, labels, legend
@@ -255,21 +1342,25 @@ class State:
             ax.set_title(ttl)
             ax.set_xlabel('year')
             ax.set_ylabel('percentage (%)')
+            return fig
         else:
+            figures = []
             for col in range(len(self.order_of_outputs)):  # create a graph for each depatrure type
-                fig, ax = plt.subplots(figsize=(10, 4))
+                fig, ax = new_figure(figsize=(10, 4))
                 ax.plot(self.years, state_data_y[:,col], '-o', color = self.colors[col])
                 ttl = self.name + ' ' + self.order_of_outputs[col] + ' over time.'
                 ax.set_title(ttl)
                 ax.set_xlabel('year')
                 ax.set_ylabel('percentage (%)')
-
+                figures.append(fig)
+            return figures
 
 
     ### compare_section_to_larger_group
     def compare_section_to_larger_group(self, section_category_name, section_name,
                                         larger_group_category_name, larger_group_name,
-                                        inp_list_of_groups = ['departure'], years=None, plot=True):
+                                        inp_list_of_groups = ['departure'], years=None, plot=True,
+                                        narrate = True, threshold = 0.05, as_result = False):
         """
         Compare a subsection to its larger whole.  Note, the larger group must have 
     
@@ -291,21 +1382,106 @@ class State:
             is specified, it will pull all eyars where data is available.
         plot : bool, optional
             flag for if the function should generate graphs. The default is True.
+        narrate : bool, optional
+            if True, the findings are sent to the logging module (nothing is printed). The default is True.
+        threshold : float or tuple, optional
+            how far off the larger group's rate counts as above or below, see classify_rates. The default is 0.05.
+        as_result : bool, optional
+            if True, returns a ComparisonResult instead. The default is False.
     
         Returns
         a pandas datraframe of the following format:
             df[year][section] = section data for that yeat, has percent and count
             df[year][rest] = data for the year ofr the larger section
+        or a ComparisonResult, if as_result is True.
     
         """
         return tb_compare_section_to_larger_group(self, section_category_name, section_name,
                                             larger_group_category_name, larger_group_name,
-                                            inp_list_of_groups, years, plot)
+                                            inp_list_of_groups, years, plot, narrate, threshold, as_result)
                 
  
+    ### compare_all_sections
+    def compare_all_sections(self, section_category_name = 'judge', larger_group_category_name = 'county',
+                             inp_list_of_groups = ['departure'], years = None, by_year = True, threshold = 0.05):
+        """
+        Compare every section (ex: every judge) to the rest of its larger group (ex: its county) in one pass.  
+        Much faster than calling compare_section_to_larger_group for each section when auditing a whole state.  
+        No prints or plots, see tb_compare_all_sections for the details.
+
+        Parameters
+        ----------
+        section_category_name : str, optional
+            the paths name of the sections. The default is 'judge'.
+        larger_group_category_name : str, optional
+            the paths name of the larger groups, or 'state' to compare to the rest of the state. The default is 'county'.
+        inp_list_of_groups : list, optional
+            list paths names you wish to group by. The default is ['departure'].
+        years : list, optional
+            specify a range of years to look at. The default is None, all years.
+        by_year : bool, optional
+            if True, compare each year separately. The default is True.
+        threshold : float or tuple, optional
+            how far off the rest's rate counts as above or below, see classify_rates. The default is 0.05.
+
+        Returns
+        -------
+        pandas DataFrame
+            one row per larger group, section, year, subgroup and departure, with the counts, totals and percents of 
+            the section and the rest, their difference and an above / about / below label.
+
+        """
+        key = ('compare_all_sections', section_category_name, larger_group_category_name, tuple(inp_list_of_groups), 
+               years_key(years), by_year, threshold)
+        comparison = self.query_cache.get(key)
+        if comparison is None:
+            comparison = tb_compare_all_sections(self, section_category_name, larger_group_category_name, 
+                                                 inp_list_of_groups, years, by_year, threshold)
+            self.query_cache.put(key, comparison)
+        return comparison
+
+
+    ### test_all_sections
+    def test_all_sections(self, section_category_name = 'judge', larger_group_category_name = 'county',
+                          inp_list_of_groups = ['departure'], years = None, by_year = False,
+                          test = 'proportions', correction = 'fdr_bh', alpha = 0.05):
+        """
+        Test every section (ex: every judge) against the rest of its larger group (ex: its county) for significant 
+        differences in sentencing, with a correction for running so many tests.  See tb_test_all_sections.
+
+        Parameters
+        ----------
+        section_category_name : str, optional
+            the paths name of the sections. The default is 'judge'.
+        larger_group_category_name : str, optional
+            the paths name of the larger groups, or 'state' to compare to the rest of the state. The default is 'county'.
+        inp_list_of_groups : list, optional
+            list paths names you wish to group by. The default is ['departure'].
+        years : list, optional
+            specify a range of years to look at. The default is None, all years.
+        by_year : bool, optional
+            if True, test each year separately. The default is False.
+        test : str, optional
+            'proportions' (a test per departure) or 'chi squared' (a test per breakdown of departures). The default is 'proportions'.
+        correction : str, optional
+            'fdr_bh', 'holm', 'bonferroni' or None. The default is 'fdr_bh'.
+        alpha : float, optional
+            significance level. The default is 0.05.
+
+        Returns
+        -------
+        pandas DataFrame
+            the tests, with p values, adjusted p values and if they are significant.
+
+        """
+        return tb_test_all_sections(self, section_category_name, larger_group_category_name, inp_list_of_groups, 
+                                    years, by_year, test, correction, alpha)
+
+
     ### compare_judge_to_county
     def compare_judge_to_county(self, judge_name, county_name,
-                                        inp_list_of_groups = ['departure'], years=None, plot=True):
+                                        inp_list_of_groups = ['departure'], years=None, plot=True,
+                                        narrate = True, threshold = 0.05, as_result = False):
         """
         Compare a judge to a county they operate in. A shell function on tb_compare_section_to_larger_group, but fills in some inputs for you
     
@@ -322,20 +1498,28 @@ class State:
             is specified, it will pull all eyars where data is available.
         plot : bool, optional
             flag for if the function should generate graphs. The default is True.
+        narrate : bool, optional
+            if True, the findings are sent to the logging module (nothing is printed). The default is True.
+        threshold : float or tuple, optional
+            how far off the larger group's rate counts as above or below, see classify_rates. The default is 0.05.
+        as_result : bool, optional
+            if True, returns a ComparisonResult instead. The default is False.
     
         Returns
         a pandas datraframe of the following format:
             df[year][section] = section data for that yeat, has percent and count
             df[year][rest] = data for the year ofr the larger section
+        or a ComparisonResult, if as_result is True.
     
         """
         return tb_compare_section_to_larger_group(self, 'judge', judge_name,
                                             'county', county_name,
-                                            inp_list_of_groups, years, plot)
+                                            inp_list_of_groups, years, plot, narrate, threshold, as_result)
  
     
     ### compare_judge_to_state 
-    def compare_judge_to_state(self, judge_name, inp_list_of_groups = ['departure'], years=None, plot=True):
+    def compare_judge_to_state(self, judge_name, inp_list_of_groups = ['departure'], years=None, plot=True,
+                               narrate = True, threshold = 0.05, as_result = False):
         """
         Compare a judge to a state they operate in. A shell function on tb_compare_section_to_larger_group, but fills in some inputs for you
     
@@ -350,16 +1534,23 @@ class State:
             is specified, it will pull all eyars where data is available.
         plot : bool, optional
             flag for if the function should generate graphs. The default is True.
+        narrate : bool, optional
+            if True, the findings are sent to the logging module (nothing is printed). The default is True.
+        threshold : float or tuple, optional
+            how far off the larger group's rate counts as above or below, see classify_rates. The default is 0.05.
+        as_result : bool, optional
+            if True, returns a ComparisonResult instead. The default is False.
     
         Returns
         a pandas datraframe of the following format:
             df[year][section] = section data for that yeat, has percent and count
             df[year][rest] = data for the year ofr the larger section
+        or a ComparisonResult, if as_result is True.
     
         """
         return tb_compare_section_to_larger_group(self, 'judge', judge_name,
                                             'state', self.name,
-                                            inp_list_of_groups, years, plot)
+                                            inp_list_of_groups, years, plot, narrate, threshold, as_result)
 
 ### compare a county's sentencing to its census data
     def compare_county_to_census():
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 16 15:02:11 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from JUSTFAIR_Tools.State import State
+
+
+### Workers
+# these run in the process pool, so they have to be module level functions
+
+def _build_state(name, source):
+    """
+    Builds a state from its source.
+
+    Parameters
+    ----------
+    name : str
+        the name of the state.
+    source : str, dict or State
+        a snapshot directory written by State.save, a dictionary of State constructor arguments
+        (everything but inp_name), or an already loaded State.
+
+    Returns
+    -------
+    State
+        the state.
+
+    """
+    if isinstance(source, State):
+        return source
+    if isinstance(source, str):
+        return State.load(source)
+    return State(name, **source)
+
+
+def _load_state(name, source, snapshot_dir):
+    """
+    Builds a state (loading it fully, even if it is lazy), and if snapshot_dir is given saves a snapshot of it there.
+
+    Returns
+    -------
+    state : State
+        the state.
+    snapshot : str
+        the directory of the state's snapshot, or None if it wasn't saved.
+
+    """
+    state = _build_state(name, source)
+    state._aggregate()  # loads the data too
+    snapshot = None
+    if snapshot_dir is not None and not isinstance(source, str):
+        snapshot = os.path.join(snapshot_dir, name)
+        state.save(snapshot)
+    return state, snapshot
+
+
+def _run_summary(name, source, inp_list_of_groups, years):
+    """
+    Builds a state and runs generalizable_multi_level_summary on it, without plotting.
+
+    Returns
+    -------
+    pandas DataFrame
+        the summary for the state.
+
+    """
+    state = _build_state(name, source)
+    return state.generalizable_multi_level_summary(list(inp_list_of_groups), years = years, plot = None)
+
+
+### StateCollection class
+class StateCollection:
+
+    def __init__(self, sources, max_workers = None):
+        """
+        A collection of states that are loaded and queried together, in parallel, using a pool of processes.
+
+        Parameters
+        ----------
+        sources : dict
+            state name --> where to get the state from.  Either:
+                a snapshot directory written by State.save (cheapest, see load's snapshot_dir)
+                a dictionary of State constructor arguments, everything but inp_name.
+                    example: {'inp_data_url': 'mn.csv', 'inp_paths': mn_paths, 'using_url': False}
+                a State that is already loaded
+        max_workers : int, optional
+            the number of processes to use.  1 runs everything in this process, which is handy for debugging.
+            The default is None, which uses one process per cpu.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.sources = dict(sources)
+        self.max_workers = max_workers
+        self.states = {}  # state name --> loaded State
+        for name, source in self.sources.items():
+            if isinstance(source, State):
+                self.states[name] = source
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def __getitem__(self, name):
+        """
+        Gets a state, loading it in this process if it hasn't been loaded yet.
+        """
+        if name not in self.states:
+            self.states[name] = _build_state(name, self.sources[name])
+        return self.states[name]
+
+    def _map(self, function, arguments):
+        """
+        Calls function on each tuple in arguments, in the process pool (or in this process if max_workers is 1).
+
+        Returns
+        -------
+        list
+            the results, in the same order as arguments.
+
+        """
+        if self.max_workers == 1:
+            return [function(*args) for args in arguments]
+        with ProcessPoolExecutor(max_workers = self.max_workers) as pool:
+            futures = [pool.submit(function, *args) for args in arguments]
+            return [future.result() for future in futures]
+
+    def load(self, snapshot_dir = None):
+        """
+        Loads every state that hasn't been loaded yet, concurrently.
+
+        Parameters
+        ----------
+        snapshot_dir : str, optional
+            if given, each state built from a csv is saved as a snapshot in snapshot_dir/state name,
+            and its source is switched to that snapshot.  Later queries then reopen the snapshot in the workers
+            instead of rebuilding the state. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        names = [name for name in self.sources if name not in self.states]
+        results = self._map(_load_state, [(name, self.sources[name], snapshot_dir) for name in names])
+        for name, (state, snapshot) in zip(names, results):
+            self.states[name] = state
+            if snapshot is not None:
+                self.sources[name] = snapshot
+
+    def generalizable_multi_level_summary(self, inp_list_of_groups = ['departure'], years = None):
+        """
+        Runs State.generalizable_multi_level_summary on every state in parallel and combines the results.
+        States with a snapshot are reopened in the workers, states that are loaded are sent to the workers,
+        and anything else is built in the workers.  No plots are made.
+
+        Parameters
+        ----------
+        inp_list_of_groups : list, optional
+            the list of groups to group by.  Remember, keep the last values as 'departure'.
+            Every state must have these paths. The default is ['departure'].
+        years : list, optional
+            years to filter for.  If None, looks at all years. The default is None.
+
+        Returns
+        -------
+        pandas DataFrame
+            the counts and percents for every state, with the state name as the outer level of the index.
+
+        """
+        names = list(self.sources)
+        arguments = []
+        for name in names:
+            source = self.sources[name]
+            if not isinstance(source, str) and name in self.states:  # loaded, and cheaper to send than to rebuild
+                source = self.states[name]
+            arguments.append((name, source, list(inp_list_of_groups), years))
+        results = self._map(_run_summary, arguments)
+        return pd.concat(results, keys = names, names = ['state'])
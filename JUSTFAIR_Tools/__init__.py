@@ -12,4 +12,8 @@ from JUSTFAIR_Tools.toolbox import *
 from JUSTFAIR_Tools.Path import *
 from JUSTFAIR_Tools.State import *
 from JUSTFAIR_Tools.plotting import *
-from JUSTFAIR_Tools.ACS import *
\ No newline at end of file
+from JUSTFAIR_Tools.ACS import *
+from JUSTFAIR_Tools.StateCollection import *
+from JUSTFAIR_Tools.ComparisonResult import *
+from JUSTFAIR_Tools.significance import *
+from JUSTFAIR_Tools.render import *
@@ -0,0 +1,610 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 16 10:12:40 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+"""
+import copy
+import hashlib
+import json
+import os
+import pickle
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+### Columnar Storage
+
+def columnar_format():
+    """
+    Picks the on disk format used for cached state data.
+    Parquet is columnar and much faster to read than a csv, but needs pyarrow (or fastparquet) installed.
+    If neither is installed we fall back to pickle, which is still a lot faster than re-parsing the csv.
+
+    Returns
+    -------
+    str
+        either 'parquet' or 'pickle'.
+
+    """
+    for engine in ('pyarrow', 'fastparquet'):
+        try:
+            __import__(engine)
+            return 'parquet'
+        except ImportError:
+            pass
+    return 'pickle'
+
+
+def write_columnar(df, file_path, file_format = None):
+    """
+    Writes a dataframe to disk in a columnar format.  The file is written to a temporary name first and then
+    moved into place, so a crash half way through never leaves a broken cache file behind.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        the data to write.
+    file_path : str
+        where to write the data.
+    file_format : str, optional
+        'parquet' or 'pickle'.  The default is None, which uses columnar_format().
+
+    Returns
+    -------
+    None.
+
+    """
+    if file_format is None:
+        file_format = columnar_format()
+    tmp_path = file_path + '.tmp'
+    try:
+        if file_format == 'parquet':
+            df.to_parquet(tmp_path, index = False)
+        else:
+            df.to_pickle(tmp_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, file_path)
+
+
+def read_columnar(file_path, columns = None, file_format = None):
+    """
+    Reads a file written by write_columnar.
+
+    Parameters
+    ----------
+    file_path : str
+        the file to read.
+    columns : list, optional
+        only read these columns.  Parquet only reads these columns off the disk, pickle has to read everything.
+        The default is None, which reads all columns.
+    file_format : str, optional
+        'parquet' or 'pickle'.  The default is None, which guesses from the file extension.
+
+    Returns
+    -------
+    pandas DataFrame
+        the stored data.
+
+    """
+    if file_format is None:
+        file_format = 'parquet' if file_path.endswith('.parquet') else 'pickle'
+    if file_format == 'parquet':
+        return pd.read_parquet(file_path, columns = columns)
+    df = pd.read_pickle(file_path)
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
+### Source Fingerprints
+
+def source_fingerprint(source, using_url = True):
+    """
+    Builds the key a state's data is cached under.  This is a hash of the url or of the absolute local file path,
+    so the same dataset always lands in the same cache file.
+
+    Parameters
+    ----------
+    source : str
+        url or local file path of the state's data.
+    using_url : bool, optional
+        if False, source is treated as a local file path. The default is True.
+
+    Returns
+    -------
+    str
+        hex digest identifying the source.
+
+    """
+    if not using_url:
+        source = os.path.abspath(source)
+    return hashlib.sha1(str(source).encode('utf-8')).hexdigest()
+
+
+def source_signature(source, using_url = True):
+    """
+    Describes the current version of a source so we can tell when a cache entry is stale.
+    For local files this is the size and modification time.  A url gives us nothing cheap to check,
+    so urls only go stale by age (see load_cached_csv).
+
+    Parameters
+    ----------
+    source : str
+        url or local file path of the state's data.
+    using_url : bool, optional
+        if False, source is treated as a local file path. The default is True.
+
+    Returns
+    -------
+    dict
+        the signature of the source.
+
+    """
+    if using_url:
+        return {'source': source}
+    stat = os.stat(source)
+    return {'source': os.path.abspath(source), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+### Arrow IPC Files
+
+def write_arrow(df, file_path):
+    """
+    Writes a dataframe to an Arrow IPC file, which can be memory-mapped by open_arrow.  Needs pyarrow.
+    Like write_columnar, the file is written to a temporary name and then moved into place.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        the data to write.
+    file_path : str
+        where to write the data.
+
+    Returns
+    -------
+    None.
+
+    """
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index = False)
+    tmp_path = file_path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, file_path)
+
+
+def open_arrow(file_path):
+    """
+    Opens an Arrow IPC file memory-mapped.  The table's buffers point straight into the mapped file, so nothing is 
+    copied into this process, and every process that opens the same file shares one physical copy in the page cache.
+
+    Parameters
+    ----------
+    file_path : str
+        the file written by write_arrow.
+
+    Returns
+    -------
+    pyarrow Table
+        the memory-mapped table.
+
+    """
+    import pyarrow as pa
+
+    return pa.ipc.open_file(pa.memory_map(file_path, 'r')).read_all()
+
+
+### Cached CSV Loading
+
+def _entry_is_fresh(meta, signature, max_age):
+    """
+    Checks a cache entry's metadata against the current signature of its source, and its age.
+
+    Returns
+    -------
+    bool
+        True if the entry can be used.
+
+    """
+    if meta.get('signature') != signature:
+        return False
+    if max_age is not None and time.time() - meta.get('created', 0) > max_age:
+        return False
+    return True
+
+
+def load_cached_csv(source, cache_dir, read_csv, using_url = True, max_age = None, refresh = False, columns = None,
+                    variant = None):
+    """
+    Loads a state's csv through an on disk columnar cache.
+    The first load parses the csv with read_csv and writes a columnar copy to cache_dir.  Later loads read that copy back,
+    unless the entry is stale, in which case it is rebuilt.  An entry is stale if:
+        1. the local file changed size or modification time
+        2. the entry is older than max_age seconds
+        3. the cached file is parquet but parquet can't be read in this environment
+
+    Parameters
+    ----------
+    source : str
+        url or local file path of the state's data.
+    cache_dir : str
+        directory holding the cache.  Created if it doesn't exist.
+    read_csv : function
+        called with no arguments to parse the csv when the cache misses.  Must return a pandas DataFrame.
+    using_url : bool, optional
+        if False, source is treated as a local file path. The default is True.
+    max_age : float, optional
+        rebuild entries older than this many seconds. The default is None, entries never expire by age.
+    refresh : bool, optional
+        if True, always rebuild the entry. The default is False.
+    columns : list, optional
+        only return these columns.  The cache still stores every column. The default is None, which returns all columns.
+    variant : str, optional
+        anything else that changes what read_csv returns (ex: which columns were pruned).  Each variant is cached 
+        in its own file, next to the full copy. The default is None, the full csv.
+
+    Returns
+    -------
+    pandas DataFrame
+        the state's data.
+
+    """
+    os.makedirs(cache_dir, exist_ok = True)
+    key = source_fingerprint(source, using_url)
+    signature = source_signature(source, using_url)
+    if variant is not None:
+        key += '-' + hashlib.sha1(str(variant).encode('utf-8')).hexdigest()[:12]
+        signature['variant'] = variant
+    meta_path = os.path.join(cache_dir, key + '.json')
+
+    if not refresh and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        data_path = os.path.join(cache_dir, meta.get('file', ''))
+        fresh = _entry_is_fresh(meta, signature, max_age) and os.path.isfile(data_path)
+        if meta.get('format') == 'parquet' and columnar_format() != 'parquet':
+            fresh = False  # written by an environment that had pyarrow, we can't read it here
+        if fresh:
+            return read_columnar(data_path, columns = columns, file_format = meta['format'])
+
+    data = read_csv()
+    file_format = columnar_format()
+    if file_format == 'parquet':
+        try:
+            write_columnar(data, os.path.join(cache_dir, key + '.parquet'), 'parquet')
+        except Exception:  # columns with mixed types can't be written to parquet, pickle handles anything
+            file_format = 'pickle'
+    if file_format == 'pickle':
+        write_columnar(data, os.path.join(cache_dir, key + '.pkl'), 'pickle')
+    with open(meta_path, 'w') as f:
+        json.dump({'signature': signature, 'format': file_format, 'created': time.time(),
+                   'file': key + ('.parquet' if file_format == 'parquet' else '.pkl')}, f)
+    if columns is not None:
+        data = data[columns]
+    return data
+
+
+def load_cached_arrow(source, arrow_path, build_df, using_url = True, max_age = None, refresh = False, variant = None):
+    """
+    Opens a state's data as a memory-mapped Arrow IPC file, writing the file first if it is missing or stale.
+    Staleness works like load_cached_csv.  The first process to load a state writes the file, 
+    every later process (on the same machine) maps the same file.
+
+    Parameters
+    ----------
+    source : str
+        url or local file path of the state's data.
+    arrow_path : str
+        the Arrow IPC file.  A .json file next to it records what it was built from.
+    build_df : function
+        called with no arguments to build the data when the file is missing or stale.  Must return a pandas DataFrame.
+    using_url : bool, optional
+        if False, source is treated as a local file path. The default is True.
+    max_age : float, optional
+        rebuild the file if it is older than this many seconds. The default is None, never expires by age.
+    refresh : bool, optional
+        if True, always rebuild the file. The default is False.
+    variant : str, optional
+        anything else that changes what build_df returns (ex: if columns were pruned).  
+        A file built for a different variant is rebuilt. The default is None.
+
+    Returns
+    -------
+    pyarrow Table
+        the memory-mapped table.
+
+    """
+    meta_path = arrow_path + '.json'
+    signature = source_signature(source, using_url)
+    signature['variant'] = variant
+    if not refresh and os.path.isfile(arrow_path) and os.path.isfile(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if _entry_is_fresh(meta, signature, max_age):
+            return open_arrow(arrow_path)
+
+    os.makedirs(os.path.dirname(os.path.abspath(arrow_path)), exist_ok = True)
+    write_arrow(build_df(), arrow_path)
+    with open(meta_path, 'w') as f:
+        json.dump({'signature': signature, 'created': time.time()}, f)
+    return open_arrow(arrow_path)
+
+
+### Query Results
+
+class QueryCache:
+
+    def __init__(self, max_size = 128, disk = None, fingerprint = None):
+        """
+        An in memory least recently used cache of query results (summaries and comparisons) for one state.
+        Results are copied on the way in and out, so editing a returned dataframe never changes what is cached.
+        The state clears the cache whenever its data changes.
+        Optionally backed by a DiskQueryCache, so results outlive the session.
+
+        Parameters
+        ----------
+        max_size : int, optional
+            the most results to keep.  When full, the result used longest ago is dropped.
+            0 turns caching off. The default is 128.
+        disk : DiskQueryCache, optional
+            a cache on disk to check when a result isn't in memory, and to write every new result to.  The default is None.
+        fingerprint : str, optional
+            identifies the state's data (see State.dataset_fingerprint), and is part of every key on disk.  
+            While it is None the disk isn't used, since we can't tell which data a result belongs to. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key --> result, least recently used first
+        self.disk = disk
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        Looks up a result.
+
+        Parameters
+        ----------
+        key : tuple
+            the query's name and its parameters, all hashable.
+
+        Returns
+        -------
+        a copy of the cached result, or None if it isn't cached.
+
+        """
+        if key not in self._entries:
+            value = None
+            if self.disk is not None and self.fingerprint is not None:
+                value = self.disk.get((self.fingerprint,) + tuple(key))
+            if value is None:
+                self.misses += 1
+                return None
+            self._remember(key, value)  # keep it in memory for next time
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return copy.deepcopy(self._entries[key])
+
+    def put(self, key, value):
+        """
+        Stores a result, dropping the least recently used results if the cache is full.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.disk is not None and self.fingerprint is not None:
+            self.disk.put((self.fingerprint,) + tuple(key), value)
+        self._remember(key, copy.deepcopy(value))
+
+    def _remember(self, key, value):
+        """
+        Stores a result in memory without copying it.
+        """
+        if self.max_size <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last = False)
+
+    def clear(self):
+        """
+        Forgets every result in memory.  The hit and miss counts are kept, and the disk cache is left alone
+        (the state changes fingerprint when its data changes, so old results on disk are never matched).
+
+        Returns
+        -------
+        None.
+
+        """
+        self._entries.clear()
+
+    def info(self):
+        """
+        Returns
+        -------
+        dict
+            hits, misses, size and max_size of the cache.
+
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'max_size': self.max_size}
+
+
+class DiskQueryCache:
+
+    def __init__(self, cache_dir, max_bytes = 256 * 2**20, max_age = None):
+        """
+        A cache of query results on disk, shared by every session (and process) pointed at the same directory.
+        A batch job can warm it overnight by running the queries, and notebooks get the results instantly the next day.
+        Each result is a pickle file named after a hash of its key.  Reading a result marks it as used, and when
+        the directory grows past max_bytes the results used longest ago are deleted.
+
+        Parameters
+        ----------
+        cache_dir : str
+            directory holding the results.  Created if it doesn't exist.
+        max_bytes : int, optional
+            the most bytes of results to keep. The default is 256 MB.
+        max_age : float, optional
+            results older than this many seconds are ignored and deleted.  Useful for states loaded from a url, 
+            where we can't tell when the data changes. The default is None, results never expire by age.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(cache_dir, exist_ok = True)
+
+    def _path(self, key):
+        """
+        The file a key's result is stored in.
+        """
+        return os.path.join(self.cache_dir, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.result.pkl')
+
+    def get(self, key):
+        """
+        Looks up a result.
+
+        Parameters
+        ----------
+        key : tuple
+            the dataset fingerprint, the query's name and its parameters.  Its repr must be the same every session.
+
+        Returns
+        -------
+        the cached result, or None if it isn't cached.
+
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                created, stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):  # missing, or being written by someone else
+            return None
+        except (AttributeError, ImportError):  # written by an older version, its classes were renamed or moved
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        if stored_key != key:  # hash collision
+            return None
+        if self.max_age is not None and time.time() - created > self.max_age:
+            try:
+                os.remove(path)
+            except OSError:  # someone else already removed (or replaced) it
+                pass
+            return None
+        try:
+            os.utime(path)  # the modification time is when it was last used, see evict
+        except OSError:  # evicted by someone else since we read it, the result is still good
+            pass
+        return value
+
+    def put(self, key, value):
+        """
+        Stores a result, then evicts the least recently used results if the cache is over max_bytes.
+
+        Returns
+        -------
+        None.
+
+        """
+        path = self._path(key)
+        tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((time.time(), key, value), f, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def _entries(self):
+        """
+        Returns
+        -------
+        list
+            (last used time, size in bytes, path) for every stored result, least recently used first.
+
+        """
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith('.result.pkl'):
+                path = os.path.join(self.cache_dir, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:  # deleted by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """
+        Deletes the least recently used results until the cache fits in max_bytes.
+
+        Returns
+        -------
+        None.
+
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Deletes every stored result.
+
+        Returns
+        -------
+        None.
+
+        """
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def info(self):
+        """
+        Returns
+        -------
+        dict
+            number of results, bytes used and max_bytes of the cache.
+
+        """
+        entries = self._entries()
+        return {'size': len(entries), 'bytes': sum(size for _, size, _ in entries), 'max_bytes': self.max_bytes}
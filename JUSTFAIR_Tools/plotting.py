@@ -5,8 +5,84 @@ Created on Thu Mar 16 17:39:23 2023
 @author: MSU QSIDE JUSTFAIR 2023 Team
 """
 
+from contextlib import contextmanager
+
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.collections import PolyCollection
+
+### Figure Lifecycle
+# every plotting function gets its figures from new_figure, so the number of open figures can be capped
+_max_open_figures = None
+
+
+def set_max_open_figures(n):
+    """
+    Caps how many figures pyplot keeps open.  When a plotting function needs a new figure and n are already open, 
+    the oldest are closed first, so long sessions (or loops making thousands of plots) use a flat amount of memory.
+
+    Parameters
+    ----------
+    n : int
+        the most figures to keep open, or None for no cap (pyplot's normal behaviour, the default).
+
+    Returns
+    -------
+    None.
+
+    """
+    global _max_open_figures
+    _max_open_figures = n
+
+
+def new_figure(nrows = 1, ncols = 1, **kwargs):
+    """
+    plt.subplots, but first closes the oldest figures if that would go over the cap from set_max_open_figures.
+
+    Returns
+    -------
+    fig, ax
+        same as plt.subplots.
+
+    """
+    if _max_open_figures is not None:
+        numbers = plt.get_fignums()
+        for number in numbers[:max(0, len(numbers) - _max_open_figures + 1)]:
+            plt.close(number)
+    return plt.subplots(nrows, ncols, **kwargs)
+
+
+@contextmanager
+def managed_figures(close = True):
+    """
+    Keeps track of the figures made inside a with block, and closes them when the block ends.
+
+        with managed_figures() as figures:
+            state.generalizable_multi_level_summary(['race', 'departure'], plot = 'bar')
+            for fig in ...  # figures is filled in when the block ends
+
+    Parameters
+    ----------
+    close : bool, optional
+        if True, the figures are closed at the end of the block. The default is True.
+
+    Yields
+    ------
+    list
+        empty inside the block, afterwards the figures that were made, in order.
+
+    """
+    already_open = set(plt.get_fignums())
+    figures = []
+    try:
+        yield figures
+    finally:
+        for number in plt.get_fignums():
+            if number not in already_open:
+                figures.append(plt.figure(number))
+        if close:
+            for figure in figures:
+                plt.close(figure)
 
 ### Bar Plot
 
@@ -21,7 +97,7 @@ def plot_departures_bar(departure_labels, departure_porportions, colors, base_gr
         s: for formatting, adds an s to the end of the title string
 
     Returns:
-        A bar plot based on the input of the parameters
+        the Figure of a bar plot based on the input of the parameters
     '''
     subgroup_str = ''
     for item in subgroup:
@@ -30,7 +106,7 @@ def plot_departures_bar(departure_labels, departure_porportions, colors, base_gr
         subgroup_str = subgroup_str[:-1]
         subgroup_str+='s'
 
-    fig, ax = plt.subplots(figsize = (10,7))
+    fig, ax = new_figure(figsize = (10,7))
 
     barh = ax.barh(departure_labels, departure_porportions, color=colors)
     ax.invert_yaxis()  # labels read top-to-bottom
@@ -41,6 +117,7 @@ def plot_departures_bar(departure_labels, departure_porportions, colors, base_gr
 
     ttl = 'Proportional sentences for '+ base_group_str + ' ' + subgroup_str
     ax.set_title(ttl)
+    return fig
 
 ### Pie Chart
 
@@ -55,7 +132,7 @@ def plot_departures_pie(departure_labels, departure_porportions, colors, base_gr
         s: for formatting, adds an s to the end of the title string
 
     Returns:
-        Pie chart based off the given input information
+        the Figure of a pie chart based off the given input information
     '''
     subgroup_str = ''
     for item in subgroup:
@@ -64,29 +141,104 @@ def plot_departures_pie(departure_labels, departure_porportions, colors, base_gr
         subgroup_str = subgroup_str[:-1]
         subgroup_str+='s'
 
-    fig, ax = plt.subplots(figsize = (10,7))
+    fig, ax = new_figure(figsize = (10,7))
 
     ax.pie(departure_porportions, labels=departure_labels, autopct='%1.1f%%', colors = colors)
 
 
     ttl = 'Proportional sentences for '+ base_group_str + ' ' + subgroup_str
     ax.set_title(ttl)
+    return fig
+
+### Faceted Bar and Pie Charts
+
+def plot_departures_faceted(departure_labels, porportions, colors, base_group_str, subgroup, facet_titles,
+                            kind = 'bar', s = True):
+    '''
+    Used to plot the bar graphs or pie charts of many subgroups as small multiples: one figure, a grid of subplots
+    (sharing their axes for bar graphs) and a single legend, rather than a full size figure per subgroup.
+
+    Parameters:
+        departure_labels: the labels on our departure variable.  Shown in the legend.
+        porportions: the porportions (or counts, for pie charts) in the format of (number of subgroups) x (number of departure labels)
+        base_group_str: this is the beginning of the plot title string, some examples could be the state name, or a county or Judge name
+        subgroup: what the subgroups are (used in the title), ex: ['race', 'sex']
+        facet_titles: the title of each subplot, one per subgroup (ex: 'White Female')
+        kind: 'bar' or 'pie'
+        s: for formatting, adds an s to the end of the title string
+
+    Returns:
+        the Figure holding the grid, or an empty list if there are no subgroups to plot
+    '''
+    subgroup_str = ''
+    for item in subgroup:
+        subgroup_str += str(item) + ' '
+    if s:
+        subgroup_str = subgroup_str[:-1]
+        subgroup_str+='s'
+
+    porportions = np.atleast_2d(np.asarray(porportions, dtype = float))
+    if porportions.size == 0:  # nothing to plot
+        return []
+    n_facets = porportions.shape[0]
+    ncols = int(np.ceil(np.sqrt(n_facets)))
+    nrows = int(np.ceil(n_facets / ncols))
+    colors = colors[:len(departure_labels)]
+    if kind == 'bar':
+        fig, axes = new_figure(nrows, ncols, sharex = True, sharey = True, squeeze = False,
+                               figsize = (3.5 * ncols + 2, 2.5 * nrows + 1))
+    else:  # pie
+        fig, axes = new_figure(nrows, ncols, squeeze = False, figsize = (3 * ncols + 2, 3 * nrows + 1))
+    axes = axes.ravel()
+
+    positions = np.arange(len(departure_labels))
+    for i in range(n_facets):
+        ax = axes[i]
+        if kind == 'bar':
+            barh = ax.barh(positions, porportions[i], color = colors)
+            ax.bar_label(barh, fmt = '%.1f%%', fontsize = 8)
+        elif np.nansum(porportions[i]) > 0:  # pie
+            ax.pie(np.nan_to_num(porportions[i]), autopct = '%1.1f%%', colors = colors, textprops = {'fontsize': 8})
+        else:  # a pie chart of nothing can't be drawn
+            ax.text(0.5, 0.5, 'no data', ha = 'center', va = 'center', transform = ax.transAxes)
+            ax.axis('off')
+        ax.set_title(facet_titles[i], fontsize = 10)
+    for ax in axes[n_facets:]:  # the grid can have a few more spots than subgroups
+        ax.set_visible(False)
+    if kind == 'bar':
+        axes[0].set_yticks(positions, [])
+        axes[0].invert_yaxis()  # labels read top-to-bottom, same as plot_departures_bar
+        axes[0].set_xlim(0, 110)  # room for the labels
+        for ax in axes[(nrows - 1) * ncols:]:
+            ax.set_xlabel('Percentage')
+
+    handles = [plt.Rectangle((0, 0), 1, 1, color = color) for color in colors]
+    fig.legend(handles, departure_labels, loc = 'center left', bbox_to_anchor = (1, 0.5))
+    ttl = 'Proportional sentences for '+ base_group_str + ' ' + subgroup_str
+    fig.suptitle(ttl)
+    fig.tight_layout()
+    return fig
 
 ### Stacked Bar Plot
 
-def plot_departures_stacked(x_values_list, y_values_list, colors, base_group_str, subgroup, legend, s = True):
+def plot_departures_stacked(x_values_list, y_values_list, colors, base_group_str, subgroup, legend, s = True,
+                            max_height = 20, min_label_width = 3):
     '''
-    Used to plot a stacked horizontal bar graph to view results.
+    Used to plot a stacked horizontal bar graph to view results.  Each departure level is drawn (and labeled) for every
+    bar at once, so this stays quick with hundreds of bars, and any number of departure levels works.
 
     Parameters:
         x_values_list: the labels on our departure variable.  This is the x labels.  in the format of an 1 x number of subgroups
-        y_values_list: the porportions for each label.  This is the y label.  In the format of (number of subgroups) x (number of items in the state's order of outouts)
+        y_values_list: the porportions for each label.  This is the y label.  In the format of (number of items in the state's order of outouts) x (number of subgroups)
         base_group_str: this is the beginning of the plot title string, some examples could be the state name, or a county or Judge name
         subgroup: the subgroup that this bar graph corrosponds to (used in the title).  Only used when looking at more than one level.
         s: for formatting, adds an s to the end of the title string
+        max_height: the tallest the figure can get, in inches.  Bars get thinner past that.
+        min_label_width: pieces of a bar narrower than this (in percent) aren't labeled, so the labels don't pile up.
+            Labels are also left off when the bars get too thin to hold them.
 
     Returns:
-        Stacked bar graph based off the given input information
+        the Figure of a stacked bar graph based off the given input information
     '''
     subgroup_str = ''
     for item in subgroup:
@@ -95,64 +247,81 @@ def plot_departures_stacked(x_values_list, y_values_list, colors, base_group_str
         subgroup_str = subgroup_str[:-1]
         subgroup_str+='s'
 
-    fig, ax = plt.subplots(figsize = (12, 1 * len(x_values_list)))
-
-
-    b = np.zeros(len(x_values_list))
-    for i in range(len(y_values_list)):
-        ax.barh(x_values_list, y_values_list[i], left = b, color = colors[i], label = legend[i], edgecolor='black')
-        b += y_values_list[i]
+    # one row per departure level, one column per bar.  A single bar can come in as a list of floats
+    y_values = np.asarray(y_values_list, dtype = float).reshape(len(y_values_list), -1)
+    n_bars = y_values.shape[1]
+    height = min(max(1 * n_bars, 3), max_height)
+    fig, ax = new_figure(figsize = (12, height))
+
+    positions = np.arange(n_bars)
+    show_labels = n_bars > 0 and height / n_bars >= 0.25  # inches per bar
+    dense = n_bars > 200  # thousands of separate rectangles are slow, draw each departure level as one shape instead
+    b = np.zeros(n_bars)
+    for i in range(y_values.shape[0]):
+        color = colors[i] if i < len(colors) else plt.cm.tab20(i % 20)
+        widths = np.nan_to_num(y_values[i])
+        if dense:
+            bottom, top = positions - 0.4, positions + 0.4
+            corners = np.stack([np.stack([b, bottom], axis = 1), np.stack([b, top], axis = 1),
+                                np.stack([b + widths, top], axis = 1), np.stack([b + widths, bottom], axis = 1)], axis = 1)
+            ax.add_collection(PolyCollection(corners, facecolors = color, edgecolors = 'black', linewidths = 0.2, label = legend[i]))
+        else:
+            bars = ax.barh(positions, widths, left = b, color = color, label = legend[i], edgecolor='black')
+            if show_labels:
+                labels = [str(round(width, 2)) + '%' if width >= min_label_width else '' for width in widths]
+                ax.bar_label(bars, labels = labels, label_type = 'center', weight = 'bold', size = 11 if n_bars <= 30 else 8)
+        b += widths
+    step = max(1, int(np.ceil(n_bars / (height * 8))))  # at most 8 names per inch, so they stay readable
+    ax.set_yticks(positions[::step], [str(x) for x in x_values_list][::step], fontsize = 10 if n_bars <= 60 else 6)
+    ax.set_ylim(-0.5, n_bars - 0.5)
     ax.set_xlabel('Percentage')
     ax.set_xlim((-5,105))
     ttl = 'Proportional sentences for '+ base_group_str + ' ' + subgroup_str
     ax.set_title(ttl)
     ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+    return fig
 
 
-    # For each patch (basically each rectangle within the bar), add a label.
-    #we are 
-    len_to_beat = 0
-    if isinstance(y_values_list[0], float):
-        len_to_beat = 1
-    else:
-        len_to_beat = len(y_values_list[0])
-
-    for i in range(len(ax.patches)):
-        bar = ax.patches[i]
-        if i < len_to_beat:  # above departure / first bar
-            ax.text(
-              bar.get_x() + bar.get_width()/2,
-              bar.get_y() + bar.get_height() / 2,
-              # This is actual value we'll show.
-              str(round(bar.get_width(),2)) + '%',
-              # Center the labels and style them a bit.
-              ha='right',
-              weight='bold',
-              size=11)
-        elif i < 3 * len_to_beat:  # second and third bars (in range, below range)
-            ax.text(
-              bar.get_x() + bar.get_width()/2,
-              bar.get_y() + bar.get_height() / 2,
-              # This is actual value we'll show.
-              str(round(bar.get_width(),2)) + '%',
-              # Center the labels and style them a bit.
-              ha='center',
-              weight='bold',
-              size=11)
-        else: # i % 4 == 3  last bar (missing, indeterminable, inapplicable)
-            ax.text(
-              bar.get_x() + bar.get_width()/2,
-              bar.get_y() + bar.get_height() / 2,
-              # This is actual value we'll show.
-              str(round(bar.get_width(),2)) + '%',
-              # Center the labels and style them a bit.
-              ha='left',
-              weight='bold',
-              size=11)
+def plot_departures_stacked_pages(x_values_list, y_values_list, colors, base_group_str, subgroup, legend, s = True,
+                                  sort_by = None, ascending = False, top_k = None, page_size = None, **kwargs):
+    '''
+    Stacked horizontal bar graphs for a lot of bars: sorts them, keeps the top k and / or splits them over several
+    figures, then draws each figure with plot_departures_stacked.
+
+    Parameters:
+        x_values_list, y_values_list, colors, base_group_str, subgroup, legend, s: same as plot_departures_stacked
+        sort_by: a departure label (from legend) to sort the bars by, ex: 'Above Departure'.  None keeps the order given.
+        ascending: sort smallest first instead of largest first
+        top_k: only keep the first top_k bars (after sorting)
+        page_size: the most bars per figure.  None puts every bar in one figure.
+        kwargs: passed on to plot_departures_stacked (max_height, min_label_width)
+
+    Returns:
+        a list of the Figures, one per page
+    '''
+    y_values = np.asarray(y_values_list, dtype = float).reshape(len(y_values_list), -1)
+    x_values = np.asarray([str(x) for x in x_values_list], dtype = object)
+    order = np.arange(y_values.shape[1])
+    if sort_by is not None:
+        key = y_values[list(legend).index(sort_by)]
+        order = np.argsort(key if ascending else -key, kind = 'stable')
+    if top_k is not None:
+        order = order[:top_k]
+    page_size = max(len(order), 1) if page_size is None else page_size
+    pages = [order[start:start + page_size] for start in range(0, len(order), page_size)] or [order]
+
+    figures = []
+    for page_number, page in enumerate(pages):
+        if sort_by is not None:  # barh puts the first bar at the bottom, flip so the first is on top
+            page = page[::-1]
+        fig = plot_departures_stacked(list(x_values[page]), y_values[:, page], colors, base_group_str, subgroup, legend, s, **kwargs)
+        if len(pages) > 1:
+            ax = fig.axes[0]
+            ax.set_title(ax.get_title() + ' (page ' + str(page_number + 1) + ' of ' + str(len(pages)) + ')')
+        figures.append(fig)
+    return figures
 
-    
 
-    
 def section_and_rest_data_plot_broken_axis_line_graph(x_data,section_y_data, rest_y_data, count, 
                                                       colors,population_subset, order_of_outputs, 
                                                       section_name, section_category_name,
@@ -194,7 +363,8 @@ def section_and_rest_data_plot_broken_axis_line_graph(x_data,section_y_data, res
 
     Returns
     -------
-    None.
+    fig, diff_fig : matplotlib Figures
+        the trends figure and the differences figure.
 
     """
     
@@ -215,7 +385,7 @@ def section_and_rest_data_plot_broken_axis_line_graph(x_data,section_y_data, res
     
     # source: https://matplotlib.org/stable/gallery/subplots_axes_and_figures/broken_axis.html
     
-    fig, (top, bot) = plt.subplots(2, 1, sharex=True, figsize = (10,8))
+    fig, (top, bot) = new_figure(2, 1, sharex=True, figsize = (10,8))
     fig.subplots_adjust(hspace=0.05)  # adjust space between axes
     
     #plot the top
@@ -267,15 +437,16 @@ def section_and_rest_data_plot_broken_axis_line_graph(x_data,section_y_data, res
     
     
     #second graph, differences (section data - rest of data, so if judge is higher we see a positive number)
-    plt.figure(figsize = (10,4))
+    diff_fig, ax = new_figure(figsize = (10,4))
     diffs = section_y_data - rest_y_data
     for dep_type in range(len(order_of_outputs)):
-        plt.plot(x_data, diffs[dep_type], '-o',
+        ax.plot(x_data, diffs[dep_type], '-o',
             color = colors[dep_type], label = order_of_outputs[dep_type])
-    plt.axhline(y=0, color = 'black')
+    ax.axhline(y=0, color = 'black')
     ttl = section_name +' vs ' + larger_group_name + ' differences on ' + population_subset + ' sentencing'
-    plt.title(ttl)
-    plt.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+    ax.set_title(ttl)
+    ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+    return fig, diff_fig
         
 
 def section_and_rest_data_plot_line_graph(x_data,section_y_data,rest_y_data, count, 
@@ -319,32 +490,34 @@ def section_and_rest_data_plot_line_graph(x_data,section_y_data,rest_y_data, cou
 
     Returns
     -------
-    None.
+    fig, diff_fig : matplotlib Figures
+        the trends figure and the differences figure.
 
     """
-    plt.figure()
+    fig, ax = new_figure()
     for dep_type in range(len(order_of_outputs)):
         lab = section_name + ' ' + order_of_outputs[dep_type]
-        plt.plot(x_data, section_y_data[dep_type], '-o',
+        ax.plot(x_data, section_y_data[dep_type], '-o',
                  color = colors[dep_type], label = lab)
         
         lab = larger_group_name + ' ' + order_of_outputs[dep_type]
-        plt.plot(x_data, rest_y_data[dep_type], '--o',
+        ax.plot(x_data, rest_y_data[dep_type], '--o',
                  color = colors[dep_type], label = lab)
     
     ttl = section_name +' vs ' + larger_group_name + ' on ' + population_subset + ' sentencing' +'.  N=' + str(count)
-    plt.title(ttl)
-    plt.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+    ax.set_title(ttl)
+    ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
     
-    plt.figure()
+    diff_fig, ax = new_figure()
     diffs = section_y_data - rest_y_data
     for dep_type in range(len(order_of_outputs)):
-        plt.plot(x_data, diffs[dep_type], '-o',
+        ax.plot(x_data, diffs[dep_type], '-o',
             color = colors[dep_type], label = order_of_outputs[dep_type])
-    plt.axhline(y=0, color = 'black')
+    ax.axhline(y=0, color = 'black')
     ttl = section_name +' vs ' + larger_group_name + ' ' +  ' differences on ' + population_subset + ' sentencing'
-    plt.title(ttl)
-    plt.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+    ax.set_title(ttl)
+    ax.legend(loc='center left', bbox_to_anchor=(1, 0.5))
+    return fig, diff_fig
     
 
 def plot_section_and_rest_data(x_data, section_y_data, rest_y_data, count, 
@@ -388,7 +561,8 @@ def plot_section_and_rest_data(x_data, section_y_data, rest_y_data, count,
 
     Returns
     -------
-    None.
+    fig, diff_fig : matplotlib Figures
+        the trends figure and the differences figure, from whichever function was called.
 
     """
     
@@ -399,11 +573,11 @@ def plot_section_and_rest_data(x_data, section_y_data, rest_y_data, count,
     comb_min = np.min([np.min(section_y_data_medians), np.min(rest_y_data_medians)])
     
     if comb_max-comb_min > 0.5: # difference is big enought ot warrent a split axis graph
-        section_and_rest_data_plot_broken_axis_line_graph(x_data,section_y_data, rest_y_data,count,  colors,
+        return section_and_rest_data_plot_broken_axis_line_graph(x_data,section_y_data, rest_y_data,count,  colors,
                                        population_subset, order_of_outputs, section_name, section_category_name,
                                        larger_group_name, larger_group_category_name)
     else:
-        section_and_rest_data_plot_line_graph(x_data,section_y_data,rest_y_data, count, colors,
+        return section_and_rest_data_plot_line_graph(x_data,section_y_data,rest_y_data, count, colors,
                                        population_subset,order_of_outputs, section_name, section_category_name,
                                        larger_group_name, larger_group_category_name)
     
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 13:52:08 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from JUSTFAIR_Tools.plotting import managed_figures
+from JUSTFAIR_Tools.StateCollection import _build_state
+from JUSTFAIR_Tools.toolbox import filter_years, group_counts
+
+
+### Headless Rendering
+
+def headless():
+    """
+    Switches pyplot to the Agg backend, which draws straight to image files and never opens a window.
+    Use it at the top of scripts that run without a notebook or a display (ex: overnight on a server).
+
+    Returns
+    -------
+    None.
+
+    """
+    plt.switch_backend('Agg')
+
+
+def file_safe(name):
+    """
+    Turns a name (ex: a judge's name) into something that can be used in a file name.
+    """
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(name)).strip('_') or 'unnamed'
+
+
+def render_figures(plot_function, *args, directory = '.', name = 'figure', formats = ('png',), dpi = 100, **kwargs):
+    """
+    Calls a plotting function (or anything that plots, like State.generalizable_multi_level_summary) and writes
+    every figure it opens to disk, instead of showing it.  The figures are closed afterwards, so nothing builds up.
+
+    Parameters
+    ----------
+    plot_function : function
+        the function to call, with *args and **kwargs.
+    directory : str, optional
+        the folder to write to, made if it doesn't exist. The default is '.'.
+    name : str, optional
+        the start of the file names.  Files are named name_1.png, name_2.png, ... in the order the figures were made.
+        The default is 'figure'.
+    formats : tuple, optional
+        the file formats to write each figure in, any of 'png', 'svg' and 'pdf'. The default is ('png',).
+    dpi : int, optional
+        resolution of the png files. The default is 100.
+
+    Returns
+    -------
+    result :
+        whatever plot_function returned.
+    paths : list
+        the files that were written.
+
+    """
+    os.makedirs(directory, exist_ok = True)
+    with managed_figures() as figures:
+        result = plot_function(*args, **kwargs)
+    paths = []
+    for i, figure in enumerate(figures):
+        for file_format in formats:
+            path = os.path.join(directory, file_safe(name) + '_' + str(i + 1) + '.' + file_format)
+            figure.savefig(path, format = file_format, dpi = dpi, bbox_inches = 'tight')
+            paths.append(path)
+    return result, paths
+
+
+### Batch Reports
+
+def _render_sections(name, source, tasks, section_category_name, larger_group_category_name,
+                     inp_list_of_groups, years, directory, formats, dpi, summary_plot):
+    """
+    Renders the figure pack of a few sections.  Runs in the process pool (which is started headless), so it 
+    builds (or opens) its own state once and then works through its share of the sections.
+
+    Parameters
+    ----------
+    tasks : list
+        tuples of (section name, [larger group names]).
+
+    Returns
+    -------
+    dict
+        section name --> list of files written.
+
+    """
+    state = _build_state(name, source)
+    year_filter = [] if years is None else [('year', list(years))]
+    written = {}
+    for section_name, larger_group_names in tasks:
+        section_directory = os.path.join(directory, file_safe(section_name))
+        paths = []
+        if summary_plot is not None:
+            paths += render_figures(state.specific_subset_summary, [(section_category_name, section_name)] + year_filter,
+                                    list(inp_list_of_groups), plot = summary_plot,
+                                    directory = section_directory, name = 'summary', formats = formats, dpi = dpi)[1]
+        for larger_group_name in larger_group_names:
+            paths += render_figures(state.compare_section_to_larger_group, section_category_name, section_name,
+                                    larger_group_category_name, larger_group_name, list(inp_list_of_groups), years,
+                                    plot = True, narrate = False, directory = section_directory,
+                                    name = 'vs_' + str(larger_group_name), formats = formats, dpi = dpi)[1]
+        written[section_name] = paths
+    return written
+
+
+def render_section_reports(stateobj, directory, section_category_name = 'judge', larger_group_category_name = 'county',
+                           sections = None, inp_list_of_groups = ['departure'], years = None, formats = ('png',),
+                           dpi = 100, summary_plot = 'stacked bar', source = None, max_workers = None):
+    """
+    Writes a pack of figures for every section of a state (ex: every judge) to disk, with the work spread over a
+    pool of processes.  Each section gets its own folder in directory, holding its summary figures
+    (specific_subset_summary) and the figures comparing it to each larger group it is active in
+    (compare_section_to_larger_group).  The workers draw on the Agg backend, so no notebook or display is needed, 
+    and every figure is closed once it is written.
+
+    Parameters
+    ----------
+    stateobj : State
+        the state to make figures for.
+    directory : str
+        the folder to write to.
+    section_category_name : str, optional
+        the paths name of the sections. The default is 'judge'.
+    larger_group_category_name : str, optional
+        the paths name of the larger groups, or 'state' to compare each section to the rest of the state.
+        The default is 'county'.
+    sections : list, optional
+        the sections to make figures for. The default is None, every section.
+    inp_list_of_groups : list, optional
+        list paths names you wish to group by.  Remember, keep the last value as 'departure'. The default is ['departure'].
+    years : list, optional
+        years to look at. The default is None, all years.
+    formats : tuple, optional
+        the file formats to write, any of 'png', 'svg' and 'pdf'. The default is ('png',).
+    dpi : int, optional
+        resolution of the png files. The default is 100.
+    summary_plot : str, optional
+        plot type for the summary figures ('stacked bar', 'bar', 'pie', 'faceted bar' or 'faceted pie'), or None to skip them.
+        The default is 'stacked bar'.
+    source : str or dict, optional
+        how the workers should get the state, like a StateCollection source: a snapshot directory written by
+        State.save (cheapest), or a dictionary of State constructor arguments.  The default is None, which sends
+        stateobj itself to each worker.
+    max_workers : int, optional
+        the number of processes to use.  1 renders everything in this process, with whatever backend it is using
+        (call headless first in scripts). The default is None, one per cpu.
+
+    Returns
+    -------
+    dict
+        section name --> list of files written for it.
+
+    """
+    ### 1. find the sections and the larger groups they are active in
+    section_colname = stateobj.paths[section_category_name].df_colname
+    if larger_group_category_name in stateobj.paths.keys():
+        pairs = group_counts(filter_years(stateobj, years),
+                             [section_colname, stateobj.paths[larger_group_category_name].df_colname]).index
+        larger_groups = {}
+        for section_name, larger_group_name in pairs:
+            larger_groups.setdefault(section_name, []).append(larger_group_name)
+    else:  # compare to the rest of the state
+        larger_groups = {section_name: [stateobj.name] for section_name in
+                         group_counts(filter_years(stateobj, years), [section_colname]).index}
+    if sections is not None:
+        larger_groups = {section_name: larger_groups.get(section_name, []) for section_name in sections}
+    tasks = list(larger_groups.items())
+    if len(tasks) == 0:
+        return {}
+
+    ### 2. split them up between the workers, each worker builds its state once
+    n_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+    chunks = [list(chunk) for chunk in np.array_split(np.arange(len(tasks)), min(n_workers, len(tasks)))]
+    source = stateobj if source is None else source
+    arguments = [(stateobj.name, source, [tasks[i] for i in chunk], section_category_name, larger_group_category_name,
+                  list(inp_list_of_groups), years, directory, tuple(formats), dpi, summary_plot) for chunk in chunks]
+    if max_workers == 1:
+        results = [_render_sections(*args) for args in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers = max_workers, initializer = headless) as pool:
+            futures = [pool.submit(_render_sections, *args) for args in arguments]
+            results = [future.result() for future in futures]
+
+    written = {}
+    for result in results:
+        written.update(result)
+    return written
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 09:41:26 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+"""
+import math
+
+import numpy as np
+
+from JUSTFAIR_Tools.toolbox import _compare_all_sections
+
+
+### Distributions
+# scipy is used if it is installed.  Without it we fall back to exact formulas,
+# which only cost a python call per value for erfc.
+
+def _erfc(x):
+    """
+    Complementary error function, elementwise.
+    """
+    try:
+        from scipy.special import erfc
+        return erfc(x)
+    except ImportError:
+        return np.frompyfunc(math.erfc, 1, 1)(np.asarray(x, dtype = float)).astype(float)
+
+
+def _chi2_sf(x, dof):
+    """
+    Survival function (1 - cdf) of the chi squared distribution, elementwise.  dof has to be whole numbers.
+    Without scipy this uses the closed forms of the upper incomplete gamma function for whole and half integers.
+    """
+    x = np.asarray(x, dtype = float)
+    dof = np.asarray(dof, dtype = float)
+    try:
+        from scipy.stats import chi2
+        return chi2.sf(x, dof)
+    except ImportError:
+        pass
+    x, dof = np.broadcast_arrays(x, dof)
+    sf = np.full(x.shape, np.nan)
+    half = x / 2
+    for k in np.unique(dof[np.isfinite(dof) & (dof > 0)]):  # only a few different dofs, each one is vectorized
+        at = (dof == k) & np.isfinite(x)
+        h = half[at]
+        m = int(k) // 2
+        if int(k) % 2 == 0:  # sf = e^-h * sum of h^i / i! for i < k / 2
+            total = np.zeros(h.shape)
+            term = np.ones(h.shape)
+            for i in range(m):
+                total += term
+                term = term * h / (i + 1)
+            sf[at] = np.exp(-h) * total
+        else:  # sf = erfc(sqrt(h)) + e^-h * sum of h^(i + 1/2) / gamma(i + 3/2) for i < (k - 1) / 2
+            total = np.zeros(h.shape)
+            for i in range(m):
+                total += h ** (i + 0.5) / math.gamma(i + 1.5)
+            sf[at] = _erfc(np.sqrt(h)) + np.exp(-h) * total
+    return sf
+
+
+### Tests
+
+def two_proportion_test(count_a, total_a, count_b, total_b):
+    """
+    Two sided two proportion z tests, for any number of pairs at once.
+    Tests if count_a / total_a and count_b / total_b are different, using the pooled proportion.
+
+    Parameters
+    ----------
+    count_a, total_a : numpy arrays
+        the number of people with the outcome (ex: a departure) and the number of people, in the first group.
+    count_b, total_b : numpy arrays
+        the same for the second group.
+
+    Returns
+    -------
+    z : numpy array
+        the z statistics.  Positive means the first group has the higher proportion.
+    p_values : numpy array
+        the two sided p values.  NaN where either group has nobody.
+
+    """
+    count_a, total_a, count_b, total_b = (np.asarray(values, dtype = float) for values in (count_a, total_a, count_b, total_b))
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        pooled = (count_a + count_b) / (total_a + total_b)
+        standard_error = np.sqrt(pooled * (1 - pooled) * (1 / total_a + 1 / total_b))
+        z = (count_a / total_a - count_b / total_b) / standard_error
+    has_people = (total_a > 0) & (total_b > 0)
+    z = np.where(has_people & (standard_error == 0), 0.0, z)  # everyone or nobody in both groups: no difference
+    z = np.where(has_people, z, np.nan)
+    p_values = _erfc(np.abs(z) / np.sqrt(2))
+    return z, p_values
+
+
+def chi_squared_test(counts_a, counts_b):
+    """
+    Chi squared tests of independence for any number of 2 x k tables at once:
+    is the breakdown of outcomes (ex: departures) different between two groups?
+    Outcomes nobody in either group had are left out of that table's test.
+
+    Parameters
+    ----------
+    counts_a : numpy array
+        in the shape of (number of tables, number of outcomes), the counts for the first group.
+    counts_b : numpy array
+        the same for the second group.
+
+    Returns
+    -------
+    chi_squared : numpy array
+        the chi squared statistic of each table.
+    dof : numpy array
+        the degrees of freedom of each table (outcomes anybody had - 1).
+    p_values : numpy array
+        the p value of each table.  NaN where either group has nobody, or only one outcome shows up.
+
+    """
+    counts_a = np.asarray(counts_a, dtype = float)
+    counts_b = np.asarray(counts_b, dtype = float)
+    total_a = counts_a.sum(axis = 1, keepdims = True)
+    total_b = counts_b.sum(axis = 1, keepdims = True)
+    outcome_totals = counts_a + counts_b
+    grand_total = total_a + total_b
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        expected_a = total_a * outcome_totals / grand_total
+        expected_b = total_b * outcome_totals / grand_total
+        cells = (counts_a - expected_a) ** 2 / expected_a + (counts_b - expected_b) ** 2 / expected_b
+    cells[outcome_totals == 0] = 0  # outcomes nobody had
+    chi_squared = cells.sum(axis = 1)
+    dof = (outcome_totals > 0).sum(axis = 1) - 1.0
+    valid = (total_a[:, 0] > 0) & (total_b[:, 0] > 0) & (dof > 0)
+    chi_squared = np.where(valid, chi_squared, np.nan)
+    dof = np.where(valid, dof, np.nan)
+    return chi_squared, dof, _chi2_sf(chi_squared, dof)
+
+
+### Multiple Comparisons
+
+def adjust_p_values(p_values, method = 'fdr_bh'):
+    """
+    Corrects p values for running many tests at once, so scanning thousands of judges doesn't flag
+    dozens of them by chance alone.  NaN p values are ignored (and stay NaN).
+
+    Parameters
+    ----------
+    p_values : numpy array
+        the p values.
+    method : str, optional
+        'bonferroni': multiply by the number of tests.  Controls the chance of any false positive, very strict.
+        'holm': Holm's step down version of bonferroni.  Same guarantee, a bit less strict.
+        'fdr_bh': Benjamini-Hochberg.  Controls the expected share of false positives among the flagged results.
+        None: no correction.
+        The default is 'fdr_bh'.
+
+    Returns
+    -------
+    numpy array
+        the adjusted p values, capped at 1.
+
+    """
+    p_values = np.asarray(p_values, dtype = float)
+    adjusted = np.full(p_values.shape, np.nan)
+    valid = ~np.isnan(p_values)
+    p = p_values[valid]
+    n = len(p)
+    if n == 0 or method is None:
+        adjusted[valid] = p
+        return adjusted
+    order = np.argsort(p)
+    ranked = p[order]
+    if method == 'bonferroni':
+        corrected = ranked * n
+    elif method == 'holm':
+        corrected = np.maximum.accumulate(ranked * (n - np.arange(n)))
+    elif method == 'fdr_bh':
+        corrected = np.minimum.accumulate((ranked * n / np.arange(1, n + 1))[::-1])[::-1]
+    else:
+        raise ValueError("method must be 'bonferroni', 'holm', 'fdr_bh' or None, not " + str(method))
+    result = np.empty(n)
+    result[order] = np.minimum(corrected, 1)
+    adjusted[valid] = result
+    return adjusted
+
+
+### Testing Every Section
+
+def tb_test_all_sections(stateobj, section_category_name = 'judge', larger_group_category_name = 'county',
+                         inp_list_of_groups = ['departure'], years = None, by_year = False,
+                         test = 'proportions', correction = 'fdr_bh', alpha = 0.05):
+    """
+    Tests every section (ex: every judge) against the rest of its larger group (ex: the other judges in its county)
+    for significant differences in sentencing, all at once.  The counts come from tb_compare_all_sections,
+    and every test is run on the count arrays in one go, then corrected for the number of tests.
+
+    Parameters
+    ----------
+    stateobj : State
+        the state we are pulling data from.
+    section_category_name : string, optional
+        the category of the sections, must be in stateobj.paths. The default is 'judge'.
+    larger_group_category_name : string, optional
+        the category of the larger groups, or 'state' to compare to the rest of the state. The default is 'county'.
+    inp_list_of_groups : list, optional
+        factors / paths to break the sections into.  Remember, keep the last value as 'departure'. The default is ['departure'].
+    years : list, optional
+        years to look at.  The default is None, all years.
+    by_year : bool, optional
+        if True, test each year separately.  Counts in a single year are often too small to say much. The default is False.
+    test : str, optional
+        'proportions': a two proportion z test for every section, subgroup and departure (ex: is this judge's
+            rate of above departure sentences for women different from the rest of the county's?)
+        'chi squared': a chi squared test for every section and subgroup (ex: is this judge's breakdown of departures
+            for women different from the rest of the county's?)
+        The default is 'proportions'.
+    correction : str, optional
+        multiple comparison correction, see adjust_p_values. The default is 'fdr_bh'.
+    alpha : float, optional
+        significance level for the adjusted p values. The default is 0.05.
+
+    Returns
+    -------
+    pandas DataFrame
+        for 'proportions', tb_compare_all_sections' dataframe with the columns z, p_value, p_adjusted and significant.
+        for 'chi squared', one row per larger group, section, year (if by_year) and subgroup, with the columns
+        section_total, rest_total, chi_squared, dof, p_value, p_adjusted and significant.
+
+    """
+    comparison, n_departures = _compare_all_sections(stateobj, section_category_name, larger_group_category_name,
+                                                     inp_list_of_groups, years, by_year, 0.05)
+    if test == 'proportions':
+        z, p_values = two_proportion_test(comparison['section_count'], comparison['section_total'],
+                                          comparison['rest_count'], comparison['rest_total'])
+        results = comparison
+        results['z'] = z
+    elif test == 'chi squared':
+        # tb_compare_all_sections gives every departure for each group, one after the other.  n_departures is
+        # counted before the departures are decoded, two codes can share a label (ex: several kinds of missing)
+        section_counts = comparison['section_count'].to_numpy().reshape(-1, n_departures)
+        rest_counts = comparison['rest_count'].to_numpy().reshape(-1, n_departures)
+        chi_squared, dof, p_values = chi_squared_test(section_counts, rest_counts)
+        group_columns = list(comparison.columns[:comparison.columns.get_loc('section_count') - 1])  # all but departure
+        results = comparison.iloc[::n_departures][group_columns + ['section_total', 'rest_total']].reset_index(drop = True)
+        results['chi_squared'] = chi_squared
+        results['dof'] = dof
+    else:
+        raise ValueError("test must be 'proportions' or 'chi squared', not " + str(test))
+    results['p_value'] = p_values
+    results['p_adjusted'] = adjust_p_values(p_values, correction)
+    results['significant'] = results['p_adjusted'] < alpha
+    return results
+
+
+### Confidence Intervals
+
+def _bootstrap_block(counts, totals, n_resamples, quantiles, seed):
+    """
+    Resamples one block of groups, see percent_confidence_intervals.  Module level so it can run in a process pool.
+
+    Returns
+    -------
+    numpy array
+        in the shape of (len(quantiles), groups in the block, outcomes), the percents at each quantile.
+
+    """
+    rng = np.random.default_rng(seed)
+    # a multinomial draw is a chain of binomial draws: each outcome takes its share of the people the earlier outcomes 
+    # didn't take.  Unlike rng.multinomial, every binomial draw is vectorized over all resamples and groups at once.
+    # People counted in the total with none of the outcomes (ex: missing departure) are whoever is left at the end.
+    remaining_people = np.broadcast_to(totals, (n_resamples, len(totals))).astype(np.int64)
+    remaining_share = np.ones(len(totals))
+    percents = np.empty((n_resamples,) + counts.shape)
+    for outcome in range(counts.shape[1]):
+        share = counts[:, outcome] / np.maximum(totals, 1)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            p = np.where(remaining_share > 0, np.clip(share / remaining_share, 0, 1), 0)
+        draws = rng.binomial(remaining_people, p)
+        percents[:, :, outcome] = 100 * draws / np.maximum(totals, 1)
+        remaining_people = remaining_people - draws
+        remaining_share = remaining_share - share
+    return np.quantile(percents, quantiles, axis = 0)
+
+
+def percent_confidence_intervals(counts, totals, confidence = 0.95, n_resamples = 1000, seed = None,
+                                 max_workers = None, block_size = 256, parallel_threshold = 10**7):
+    """
+    Bootstrap confidence intervals for percents of counts out of totals, for every cell at once.
+    Resampling a group's people with replacement is the same as drawing its counts from a multinomial distribution
+    with the observed proportions, so each resample is one multinomial draw per group, vectorized over all groups.
+    The intervals are the percentiles of the resampled percents.
+
+    Groups are split into blocks of block_size, each with its own random stream spawned from seed, so the
+    results are the same however many processes are used.  When there's a lot of resampling to do the blocks
+    are spread over a process pool.
+
+    Parameters
+    ----------
+    counts : numpy array
+        in the shape of (groups, outcomes), ex: the number of people in each subgroup with each departure.
+    totals : numpy array
+        the number of people in each group.  Can be more than the sum of the counts (ex: people with a missing departure).
+    confidence : float, optional
+        the confidence level of the intervals. The default is 0.95.
+    n_resamples : int, optional
+        number of resamples. The default is 1000.
+    seed : int, optional
+        seed for the random numbers, to get the same intervals every time. The default is None.
+    max_workers : int, optional
+        number of processes.  1 never uses a pool. The default is None, which uses a pool (with a process per cpu)
+        only if n_resamples x cells is over parallel_threshold.
+    block_size : int, optional
+        number of groups resampled together. The default is 256.
+    parallel_threshold : int, optional
+        see max_workers. The default is 10**7.
+
+    Returns
+    -------
+    low, high : numpy arrays
+        in the shape of (groups, outcomes), the lower and upper ends of the intervals, in percent.
+        A group with nobody in it has an interval of 0 to 0.
+
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    counts = np.atleast_2d(np.asarray(counts, dtype = np.int64))
+    totals = np.asarray(totals, dtype = np.int64).reshape(-1)
+    quantiles = [(1 - confidence) / 2, 1 - (1 - confidence) / 2]
+    starts = list(range(0, len(totals), block_size))
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    blocks = [(counts[start:start + block_size], totals[start:start + block_size], n_resamples, quantiles, block_seed)
+              for start, block_seed in zip(starts, seeds)]
+
+    if max_workers is None and n_resamples * counts.size < parallel_threshold:
+        max_workers = 1
+    if max_workers == 1 or len(blocks) <= 1:
+        results = [_bootstrap_block(*block) for block in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers = max_workers) as pool:
+            results = list(pool.map(_bootstrap_block, *zip(*blocks)))
+    if len(results) == 0:
+        return np.zeros(counts.shape), np.zeros(counts.shape)
+    intervals = np.concatenate(results, axis = 1)
+    return intervals[0], intervals[1]
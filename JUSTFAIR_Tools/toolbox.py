@@ -5,11 +5,142 @@ Created on Mon Feb 27 14:20:21 2023
 
 @author: MSU QSIDE JUSTFAIR 2023 Team
 """
+import time
+
 import numpy as np
 import pandas as pd
-from JUSTFAIR_Tools.plotting import plot_departures_bar, plot_departures_stacked, plot_departures_pie, plot_section_and_rest_data
+from JUSTFAIR_Tools.plotting import plot_departures_bar, plot_departures_stacked_pages, plot_departures_pie, plot_departures_faceted, plot_section_and_rest_data
+from JUSTFAIR_Tools.ComparisonResult import ComparisonResult, classify_rates
+
+
+
+### Select Rows
+
+def select_rows(stateobj, conditions):
+    """
+    Selects the rows of a state's data that meet every condition.  
+    Conditions on indexed paths (see State.get_index) are looked up in the index and combined as sets of row positions, 
+    the other conditions are then only checked on those rows.  Without any indexed conditions, one combined mask is built 
+    over the whole data.  For a state using the arrow backend the work is done on the memory-mapped table, 
+    and only the rows that are selected are copied into pandas.
+
+    Parameters
+    ----------
+    stateobj : State
+        state object who's data we are returning a subset of.
+    conditions : list
+        list of tuples in the form of (column name, [values], exclude).  
+        A row meets the condition if its value in the column is one of values, or, if exclude is True, if it isn't.
+
+    Returns
+    -------
+    pandas DataFrame
+        the rows of the state's data that meet every condition.
+
+    """
+    # 1. use the indexes
+    positions = None  # sorted positions of the rows meeting the indexed conditions, None means every row
+    excluded = []  # positions of rows an indexed exclude condition rules out
+    unindexed = []  # conditions we have to check row by row
+    for condition in conditions:
+        colname, values, exclude = condition
+        index = stateobj.get_index(colname)
+        if stateobj.partition_by_year and colname == stateobj.paths['year'].df_colname:  # year partitions work like an index
+            found = [np.arange(start, stop) for start, stop in stateobj.year_ranges(values)]
+        elif index is not None:
+            found = [index[value] for value in values if value in index]
+        else:
+            unindexed.append(condition)
+            continue
+        found = np.sort(np.concatenate(found)) if len(found) > 0 else np.zeros(0, dtype = np.int64)
+        if exclude:
+            excluded.append(found)
+        elif positions is None:
+            positions = found
+        else:
+            positions = np.intersect1d(positions, found, assume_unique = True)
+    if len(excluded) > 0:
+        excluded = np.concatenate(excluded)
+        if positions is None:
+            n_rows = stateobj.table.num_rows if stateobj.backend == 'arrow' else stateobj.data.shape[0]
+            keep = np.ones(n_rows, dtype = bool)
+            keep[excluded] = False
+            positions = np.flatnonzero(keep)
+        else:
+            positions = np.setdiff1d(positions, excluded, assume_unique = True)
 
+    # 2. check the rest of the conditions
+    if stateobj.backend == 'arrow':
+        import pyarrow as pa
+        import pyarrow.compute as pc
 
+        table = stateobj.table
+        if positions is not None:
+            table = table.take(pa.array(positions))
+        mask = None
+        for colname, values, exclude in unindexed:
+            column = table.column(colname)
+            value_type = column.type.value_type if pa.types.is_dictionary(column.type) else column.type
+            col_mask = pc.is_in(column, value_set = pa.array(list(values), type = value_type))
+            if exclude:
+                col_mask = pc.invert(col_mask)
+            mask = col_mask if mask is None else pc.and_(mask, col_mask)
+        if mask is not None:
+            table = table.filter(mask)
+        return table.to_pandas()
+
+    data = stateobj.data
+    if positions is not None:
+        data = data.iloc[positions]
+    if len(unindexed) == 0:
+        return data
+    mask = np.ones(data.shape[0], dtype = bool)
+    for colname, values, exclude in unindexed:
+        col_mask = data[colname].isin(list(values)).to_numpy()
+        if exclude:
+            mask &= ~col_mask
+        else:
+            mask &= col_mask
+    return data[mask]
+
+def compile_filter(stateobj, tuples_to_filter_by_list):
+    """
+    Compiles filters given with path names and readable values into conditions for select_rows.
+    Values are decoded through each path's levels (ex: 'Female' --> 2), values that are already codes are kept, 
+    and several filters on the same path are combined into one condition holding the values they share.  
+    select_rows then evaluates everything in one pass (index lookups and / or one combined mask).
+
+    Parameters
+    ----------
+    stateobj : State
+        the state the filters are for.
+    tuples_to_filter_by_list : list
+        list of tuples in the form of (path_name, [values to filter for]).  A single value doesn't need a list.
+
+    Returns
+    -------
+    conditions : list
+        list of tuples in the form of (column name, [values], False), one per column.
+
+    """
+    allowed = {}  # column name --> values, in the order the columns were first filtered on
+    for path_name, values in tuples_to_filter_by_list:
+        path = stateobj.paths[path_name]
+        if isinstance(values, str) or not hasattr(values, '__iter__'):
+            values = [values]
+        if path.levels is not None:  # labels --> codes.  Several codes can share a label
+            codes = {}
+            for code, label in path.levels.items():
+                codes.setdefault(label, []).append(code)
+            decoded = []
+            for value in values:
+                decoded += codes.get(value, [value])
+            values = decoded
+        values = list(dict.fromkeys(values))  # drop repeats, keep the order
+        if path.df_colname in allowed:  # every filter has to hold
+            values = [value for value in allowed[path.df_colname] if value in values]
+        allowed[path.df_colname] = values
+    return [(colname, values, False) for colname, values in allowed.items()]
 
 ### Filter Years
 
@@ -33,15 +164,210 @@ def filter_years(stateobj, years):
         state data filtered for al years in the years list.
 
     """
-    subset_dat = stateobj.data
+    conditions = []
     if years is not None:  # if yers is none, just return the whole set
+        if stateobj.partition_by_year:  # the years are slices of the data, no need to look at every row
+            return take_row_ranges(stateobj, stateobj.year_ranges(years))
         # if the user specifies a year range, filter the data for those years
-        subset_dat = stateobj.data[stateobj.data[stateobj.paths['year'].df_colname].isin(years)]
+        conditions.append((stateobj.paths['year'].df_colname, years, False))
+    subset_dat = select_rows(stateobj, conditions)
     return subset_dat
 
+def years_key(years):
+    """
+    Turns a years parameter into something hashable, for query cache keys.  The order years are listed in 
+    doesn't change any result, so they are sorted.
+
+    Returns
+    -------
+    tuple or None
+        the sorted years, or None if years is None (all years).
+
+    """
+    if years is None:
+        return None
+    # numpy years become python ints, so the key looks the same however the years were made (the disk cache hashes its repr)
+    return tuple(sorted(year.item() if isinstance(year, np.generic) else year for year in years))
+
+def take_row_ranges(stateobj, ranges):
+    """
+    Takes ranges of rows out of a state's data by slicing.  For a single range this is a view of the data 
+    (or a zero copy slice of the table, for the arrow backend), no rows are compared or copied.
+
+    Parameters
+    ----------
+    stateobj : State
+        state object who's data we are returning a subset of.
+    ranges : list
+        list of (start, stop) row positions.
+
+    Returns
+    -------
+    pandas DataFrame
+        the rows in the ranges.
+
+    """
+    if stateobj.backend == 'arrow':
+        import pyarrow as pa
+
+        table = stateobj.table
+        slices = [table.slice(start, stop - start) for start, stop in ranges]
+        return (pa.concat_tables(slices) if len(slices) > 0 else table.slice(0, 0)).to_pandas()
+    data = stateobj.data
+    if len(ranges) == 1:
+        return data.iloc[ranges[0][0]:ranges[0][1]]
+    if len(ranges) == 0:
+        return data.iloc[0:0]
+    return pd.concat([data.iloc[start:stop] for start, stop in ranges])
+
+### Group Counts
+
+def group_counts(subset_dat, colnames, method = 'pandas'):
+    """
+    Counts the number of rows (people sentenced) in each combination of the columns in colnames.
+    We count rows with size() rather than count(), as count() counts the non-null values of every other column 
+    just so we can keep the first one.  That is slow on wide data and breaks if every column is a grouping column, 
+    which can happen when a state is loaded with prune_columns.
+
+    Parameters
+    ----------
+    subset_dat : pandas DataFrame
+        data to count.
+    colnames : list
+        column names in subset_dat to group by.
+    method : str, optional
+        'pandas' counts with a groupby, 'bincount' with bincount_group_counts.  Both give the same counts. 
+        The default is 'pandas'.
+
+    Returns
+    -------
+    pandas Series
+        the number of rows in each group, indexed by the groups.
+
+    """
+    if method == 'bincount':
+        return bincount_group_counts(subset_dat, colnames)
+    return plain_levels(subset_dat.groupby(colnames, observed = True).size())  # observed, so categorical columns don't produce empty groups
+
+
+def plain_levels(counts):
+    """
+    Grouping by compact columns (ex: a state loaded with prune_columns) gives categorical or small integer index levels.  
+    This turns them back into what grouping the csv's columns gives (the categories' dtype, 64 bit numbers), 
+    so summaries look the same however the state was loaded.
+
+    Parameters
+    ----------
+    counts : pandas Series or DataFrame
+        grouped results.
+
+    Returns
+    -------
+    the same object, with plain index levels.
+
+    """
+    def plain(level):
+        if isinstance(level, pd.CategoricalIndex):
+            level = level.astype(level.categories.dtype)
+        if pd.api.types.is_integer_dtype(level.dtype) and level.dtype != np.int64:
+            level = level.astype(np.int64)
+        elif pd.api.types.is_float_dtype(level.dtype) and level.dtype != np.float64:
+            level = level.astype(np.float64)
+        return level
+
+    index = counts.index
+    if isinstance(index, pd.MultiIndex):
+        counts.index = index.set_levels([plain(level) for level in index.levels])
+    else:
+        counts.index = plain(index)
+    return counts
+
+def bincount_group_counts(subset_dat, colnames, max_cells = 2**26):
+    """
+    Counts the number of rows in each combination of the columns in colnames, like group_counts, using numpy.
+    Each column is encoded as integer codes (its categories for categoricals, its sorted unique values otherwise),
+    the codes are combined into one key per row, and a single np.bincount over the keys counts every group at once.
+    Rows with a missing value in any column are dropped, the same as a groupby.
+
+    Parameters
+    ----------
+    subset_dat : pandas DataFrame
+        data to count.
+    colnames : list
+        column names in subset_dat to group by.
+    max_cells : int, optional
+        the most possible combinations to count with bincount (the product of the number of values in each column).
+        More than this falls back to a groupby, so we don't allocate a huge mostly empty array. The default is 2**26.
+
+    Returns
+    -------
+    pandas Series
+        the number of rows in each group that has any, indexed by the groups in sorted order.
+
+    """
+    codes = []  # integer code of each row, per column
+    uniques = []  # the value each code stands for, per column
+    for colname in colnames:
+        column = subset_dat[colname]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            col_codes, col_uniques = column.cat.codes.to_numpy(), column.cat.categories
+        else:
+            col_codes, col_uniques = pd.factorize(column, sort = True)
+        codes.append(col_codes)
+        uniques.append(col_uniques)
+    dims = tuple(max(len(col_uniques), 1) for col_uniques in uniques)
+    if np.prod(dims, dtype = np.float64) > max_cells:  # too many combinations to hold densely
+        return plain_levels(subset_dat.groupby(colnames, observed = True).size())
+
+    keep = np.ones(len(subset_dat), dtype = bool)
+    for col_codes in codes:
+        keep &= col_codes >= 0  # -1 is a missing value
+    keys = np.ravel_multi_index([col_codes[keep] for col_codes in codes], dims)
+    bins = np.bincount(keys, minlength = int(np.prod(dims)))
+    present = np.flatnonzero(bins)
+    positions = np.unravel_index(present, dims)
+    if len(colnames) == 1:
+        index = pd.Index(uniques[0].take(positions[0]), name = colnames[0])
+    else:
+        index = pd.MultiIndex.from_arrays([uniques[i].take(positions[i]) for i in range(len(colnames))], names = colnames)
+    return plain_levels(pd.Series(bins[present], index = index))
+
+### Year Counts
+
+def add_year_counts(years_a, counts_a, years_b, counts_b):
+    """
+    Adds two year x departure count cubes (see State._count_year_departures) that may cover different years.
+
+    Parameters
+    ----------
+    years_a : numpy array
+        sorted years of the first cube.
+    counts_a : numpy array
+        the first cube, one row per year in years_a.
+    years_b : numpy array
+        sorted years of the second cube.
+    counts_b : numpy array
+        the second cube, one row per year in years_b.
+
+    Returns
+    -------
+    years : numpy array
+        sorted years in either cube.
+    counts : numpy array
+        the summed cube, one row per year in years.
+
+    """
+    if len(years_a) == 0:  # nothing to add to, also keeps the year dtype from being upcast by union1d
+        return years_b, counts_b.copy()
+    years = np.union1d(years_a, years_b)
+    counts = np.zeros((len(years), counts_b.shape[1]), dtype = np.int64)
+    counts[np.searchsorted(years, years_a)] += counts_a
+    counts[np.searchsorted(years, years_b)] += counts_b
+    return years, counts
+
 ### Plotting Data
 
-def plot_df(stateobj, df, plot_type, groups, base_group_str):
+def plot_df(stateobj, df, plot_type, groups, base_group_str, plot_options = None):
     """
     Main plotting function.  This is used by generalizable_multi_level_summary to take a dataframe and generate 
     graphs by calling plot_departures, plot_departures_pie, or plot_departures_stacked.
@@ -53,6 +379,7 @@ def plot_df(stateobj, df, plot_type, groups, base_group_str):
     4. not stacked bar, more than just departure
     5. pie chart, just departure
     6. pie chart, more than just departure
+    plus 'faceted bar' and 'faceted pie', which put every subgroup's bar graph or pie chart in one grid figure.
 
     This is the main plotting function for generalizable_multi_level_summary and subset_multi_level_summary.  
     This function takes a state, the percentages to plot, the plot type, and any subgroups to make plots for 
@@ -74,10 +401,15 @@ def plot_df(stateobj, df, plot_type, groups, base_group_str):
         GMLS, the inp_list_of_groups = ['sex','departure'], groups would just be ['sex']
     base_group_str : string
         the base group for which we are analyzing. for generalizable MLS, this is usually the state's name
+    plot_options : dict, optional
+        options for the stacked bar graph, passed to plot_departures_stacked_pages.  For charts with lots of bars, 
+        ex: {'sort_by': 'Above Departure', 'top_k': 50} or {'page_size': 40}. The default is None.
 
     Returns
     -------
-    None.
+    figures : list
+        the matplotlib Figures that were made (one for stacked bar, unless it is split into pages, and faceted plots, 
+        one per unique identifier for bar and pie).
 
     """
     #build our unique identifiers list.  FUTURE WORK: make this a function
@@ -100,25 +432,26 @@ def plot_df(stateobj, df, plot_type, groups, base_group_str):
         unique_identifier_strings = [stateobj.order_of_outputs]
 
     # plotting time.
-    if plot_type == 'stacked bar':
+    figures = []
+    if plot_type == 'stacked bar' and len(df) > 0:  # an empty summary (ex: no rows matched) has nothing to plot
+        plot_options = {} if plot_options is None else plot_options
         if len(groups) > 0:  #we're dealing with more then one grouping variable
-            porportions = np.zeros((len(stateobj.order_of_outputs), len(unique_identifiers)))
-            for dep in range(len(stateobj.order_of_outputs)):
-                for unique_id in range(len(unique_identifiers)):
-                    loc_id = unique_identifiers[unique_id] + (stateobj.order_of_outputs[dep],)
-                    if loc_id in df.index:
-                        porportions[dep, unique_id] = df.loc[loc_id,]
+            index = pd.MultiIndex.from_tuples([unique_id + (departure_type,) for unique_id in unique_identifiers 
+                                               for departure_type in stateobj.order_of_outputs], names = df.index.names)
+            porportions = df.reindex(index, fill_value = 0).to_numpy().reshape(len(unique_identifiers), len(stateobj.order_of_outputs)).T
             #plot
-            plot_departures_stacked(unique_identifier_strings, porportions, stateobj.colors, base_group_str, groups, stateobj.order_of_outputs)
+            figures += plot_departures_stacked_pages(unique_identifier_strings, porportions, stateobj.colors, base_group_str, 
+                                                     groups, stateobj.order_of_outputs, **plot_options)
         else:  # just departure
             porportions = []
             for departure_type in stateobj.order_of_outputs:
                 porportions.append(df.loc[departure_type,])
             #plot
             groups.insert(0, stateobj.name)  # we need the state name for plotting purposes
-            plot_departures_stacked([stateobj.name], porportions, stateobj.colors, base_group_str, groups, stateobj.order_of_outputs, s = False)
+            figures += plot_departures_stacked_pages([stateobj.name], porportions, stateobj.colors, base_group_str, groups, 
+                                                     stateobj.order_of_outputs, s = False, **plot_options)
 
-    if plot_type == 'bar' or plot_type == 'pie':  # not stacked bars
+    if (plot_type == 'bar' or plot_type == 'pie') and len(df) > 0:  # not stacked bars
         if len(groups) > 0:  #we're dealing with more then one grouping variable
             for unique_id in unique_identifiers:
                 porportions = [0] * len(stateobj.order_of_outputs)
@@ -131,21 +464,36 @@ def plot_df(stateobj, df, plot_type, groups, base_group_str):
 
                 unique_id = (stateobj.name,) + unique_id
                 if plot_type == 'bar':
-                    plot_departures_bar(stateobj.order_of_outputs, porportions, stateobj.colors, base_group_str, unique_id)
+                    figures.append(plot_departures_bar(stateobj.order_of_outputs, porportions, stateobj.colors, base_group_str, unique_id))
                 else:  # pie
-                    plot_departures_pie(stateobj.order_of_outputs, porportions, stateobj.colors, base_group_str, unique_id)
+                    figures.append(plot_departures_pie(stateobj.order_of_outputs, porportions, stateobj.colors, base_group_str, unique_id))
         else:
             porportions = []
             for departure_type in stateobj.order_of_outputs:
                 porportions.append(df.loc[departure_type,])
             if plot_type == 'bar':
-                plot_departures_bar(stateobj.order_of_outputs, porportions, stateobj.colors, base_group_str, [], s = False) 
+                figures.append(plot_departures_bar(stateobj.order_of_outputs, porportions, stateobj.colors, base_group_str, [], s = False))
             else:  # pie
-                plot_departures_pie(stateobj.order_of_outputs, porportions, stateobj.colors, base_group_str, [], s = False)  
+                figures.append(plot_departures_pie(stateobj.order_of_outputs, porportions, stateobj.colors, base_group_str, [], s = False))
+
+    if (plot_type == 'faceted bar' or plot_type == 'faceted pie') and len(df) > 0:  # every subgroup in one figure
+        kind = plot_type.split()[1]
+        if len(groups) > 0:
+            index = pd.MultiIndex.from_tuples([unique_id + (departure_type,) for unique_id in unique_identifiers 
+                                               for departure_type in stateobj.order_of_outputs], names = df.index.names)
+            porportions = df.reindex(index, fill_value = 0).to_numpy().reshape(len(unique_identifiers), len(stateobj.order_of_outputs))
+            figures.append(plot_departures_faceted(stateobj.order_of_outputs, porportions, stateobj.colors, base_group_str, 
+                                                   groups, unique_identifier_strings, kind))
+        else:
+            porportions = df.reindex(stateobj.order_of_outputs, fill_value = 0).to_numpy()
+            figures.append(plot_departures_faceted(stateobj.order_of_outputs, porportions, stateobj.colors, base_group_str, 
+                                                   [], [stateobj.name], kind, s = False))
+    return figures
 
 ### Filtered Multilevel Summary
 
-def subset_data_multi_level_summary(stateobj, subset_dat, base_group_str, inp_list_of_groups = ['departure'], plot = 'stacked bar'):
+def subset_data_multi_level_summary(stateobj, subset_dat, base_group_str, inp_list_of_groups = ['departure'], plot = 'stacked bar',
+                                    confidence = None, n_resamples = 1000, seed = None):
     """
     This function takes in some filtered data and performs the following operations:
         group by each grouop in inp_list_of_groups
@@ -165,7 +513,13 @@ def subset_data_multi_level_summary(stateobj, subset_dat, base_group_str, inp_li
     inp_list_of_groups : list, optional
         factors / paths we want to group by for this analysis.. The default is ['departure'].
     plot : string, optional
-        specifies plot type.  Can be 'bar', 'stacked bar', or 'pie'. The default is 'stacked bar'.
+        specifies plot type.  Can be 'bar', 'stacked bar', 'pie', 'faceted bar' or 'faceted pie'. The default is 'stacked bar'.
+    confidence : float, optional
+        if given (ex: 0.95), add bootstrap confidence intervals for the percents, see summary_from_counts. The default is None.
+    n_resamples : int, optional
+        number of bootstrap resamples. The default is 1000.
+    seed : int, optional
+        seed for the bootstrap, for reproducible intervals. The default is None.
 
     Returns
     -------
@@ -183,12 +537,118 @@ def subset_data_multi_level_summary(stateobj, subset_dat, base_group_str, inp_li
 
     #grouping by 
 
-    counts = subset_dat.groupby(groups_to_filter_by).count()
+    method = getattr(stateobj, 'aggregation', 'pandas')
+    counts = group_counts(subset_dat, groups_to_filter_by, method)
+    if len(inp_list_of_groups) > 1: # if we are grouping by more than departure
+        totals = group_counts(subset_dat, groups_to_filter_by[:-1], method)  # number of people in each subgroup
+    else:
+        totals = subset_dat.shape[0]  #if we are just grouping by departure, we divide by data frame length
+    return summary_from_counts(stateobj, counts, totals, base_group_str, inp_list_of_groups, plot, 
+                               confidence = confidence, n_resamples = n_resamples, seed = seed)
+
+
+def benchmark_aggregation(stateobj, inp_list_of_groups = ['departure'], years = None, repeats = 5, methods = ['pandas', 'bincount']):
+    """
+    Times subset_data_multi_level_summary with each aggregation method on a state's data, and checks they agree.
+    Handy for deciding which aggregation to give a state (see State's aggregation parameter).
+
+    Parameters
+    ----------
+    stateobj : State
+        the state to benchmark on.
+    inp_list_of_groups : list, optional
+        factors / paths to group by. The default is ['departure'].
+    years : list, optional
+        years to filter for first.  The default is None, all years.
+    repeats : int, optional
+        how many times to run each method.  The best time is reported. The default is 5.
+    methods : list, optional
+        aggregation methods to compare. The default is ['pandas', 'bincount'].
+
+    Returns
+    -------
+    pandas DataFrame
+        indexed by method, with the best and mean time in seconds, the speedup over the first method, 
+        and whether the summary matches the first method's.
+
+    """
+    subset_dat = filter_years(stateobj, years)
+    groups_to_filter_by = [stateobj.paths[group].df_colname for group in inp_list_of_groups]
+    original = getattr(stateobj, 'aggregation', 'pandas')
+    rows = {}
+    first = None
+    try:
+        for method in methods:
+            stateobj.aggregation = method
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                summary = subset_data_multi_level_summary(stateobj, subset_dat, stateobj.name, inp_list_of_groups, plot = None)
+                times.append(time.perf_counter() - start)
+            if first is None:
+                first = summary
+            matches = (summary.shape == first.shape 
+                       and np.array_equal(summary.values.astype(float), first.values.astype(float))
+                       and list(summary.index) == list(first.index))
+            rows[method] = {'best': min(times), 'mean': sum(times) / len(times), 'matches': matches}
+    finally:
+        stateobj.aggregation = original
+    results = pd.DataFrame.from_dict(rows, orient = 'index')
+    results['speedup'] = results['best'].iloc[0] / results['best']
+    results.attrs['rows'] = len(subset_dat)
+    results.attrs['groups'] = groups_to_filter_by
+    return results[['best', 'mean', 'speedup', 'matches']]
+
+
+def summary_from_counts(stateobj, counts, totals, base_group_str, inp_list_of_groups = ['departure'], plot = 'stacked bar', 
+                        decimals = None, confidence = None, n_resamples = 1000, seed = None):
+    """
+    Second half of subset_data_multi_level_summary: turns group counts into the counts and percents dataframe, 
+    and calls plot_df to generate plots.  Split out so counts from somewhere other than a groupby 
+    (ex: a state's summary cube) give exactly the same output.
+
+    Parameters
+    ----------
+    stateobj : State
+        the state who's data is being analyzed.  We need attributes of the state for plotting.
+    counts : pandas Series
+        number of people for each combination of inp_list_of_groups, indexed by their (undecoded) values.
+    totals : pandas Series or int
+        if grouping by more than departure, the number of people in each subgroup (every group but departure).
+        Otherwise the number of people in the data.
+    base_group_str : string
+        the name of the base group we are analyzing, used in plot titles.
+    inp_list_of_groups : list, optional
+        factors / paths we want to group by for this analysis.. The default is ['departure'].
+    plot : string, optional
+        specifies plot type.  Can be 'bar', 'stacked bar', 'pie', 'faceted bar' or 'faceted pie'. The default is 'stacked bar'.
+    decimals : int, optional
+        decimal places to round the percents to.  The default is None, which is 1 when grouping by more than departure 
+        and 2 otherwise.
+    confidence : float, optional
+        if given (ex: 0.95), add percent_low and percent_high columns: bootstrap confidence intervals for the percents 
+        at this level (see percent_confidence_intervals).  Small subgroups get wide intervals. The default is None.
+    n_resamples : int, optional
+        number of bootstrap resamples. The default is 1000.
+    seed : int, optional
+        seed for the bootstrap, for reproducible intervals. The default is None.
+
+    Returns
+    -------
+    comb_df : pandas DataFrame
+        pandas dataframe contianing the counts and percents to represent the sentencing for each subgroup.
+
+    """
     perc = None #initializing, will get value in next lines
+    if decimals is None:
+        decimals = 1 if len(inp_list_of_groups) > 1 else 2
     if len(inp_list_of_groups) > 1: # if we are grouping by more than departure
-        perc = round(100 * counts / subset_dat.groupby(groups_to_filter_by[:-1]).count(), 1)
+        perc = round(100 * counts / totals.reindex(counts.index.droplevel(-1)).values, decimals)
     else:
-        perc = round( (100 * counts/ subset_dat.shape[0]),2)  #if we are just grouping by departure, we divide by data frame length
+        perc = round( (100 * counts/ totals), decimals)
+    if confidence is not None:
+        perc_low, perc_high = bootstrap_percents(counts, totals, len(inp_list_of_groups) > 1, decimals, 
+                                                 confidence, n_resamples, seed)
 
     # renames the values that have levels
     l=0
@@ -197,26 +657,90 @@ def subset_data_multi_level_summary(stateobj, subset_dat, base_group_str, inp_li
             perc = perc.rename(stateobj.paths[group].levels, level = l)
             counts = counts.rename(stateobj.paths[group].levels, level = l)
         l += 1
-    # pull the data we need from our dataframes    
-    perc = perc.iloc[:,0]  # all columns are the same, so we pull the first one
-    counts = counts.iloc[:,0]  # all columns are the same, so we pull the first one
 
     #create an output dataframe to return
     comb_df = pd.concat([counts,perc],axis=1)  # combine our two columns into a dataframe
     comb_df.columns = ['count', 'percent']  # rename columns 
+    if confidence is not None:
+        comb_df['percent_low'] = perc_low.to_numpy()
+        comb_df['percent_high'] = perc_high.to_numpy()
+    plot_summary(stateobj, comb_df, base_group_str, inp_list_of_groups, plot)
+    return comb_df
+
+
+def bootstrap_percents(counts, totals, has_groups, decimals, confidence = 0.95, n_resamples = 1000, seed = None):
+    """
+    Lines counts and totals from summary_from_counts up into arrays, and gets bootstrap confidence intervals 
+    for their percents from percent_confidence_intervals.
+
+    Returns
+    -------
+    perc_low, perc_high : pandas Series
+        the ends of the intervals, rounded to decimals, with the same index as counts.
+
+    """
+    from JUSTFAIR_Tools.significance import percent_confidence_intervals  # significance imports this module
+
+    if has_groups:
+        table = counts.unstack(level = -1, fill_value = 0)  # (subgroups, departures)
+        group_totals = totals.reindex(table.index).to_numpy()
+    else:
+        table = counts.to_frame().T
+        group_totals = np.array([totals])
+    low, high = percent_confidence_intervals(table.to_numpy(), group_totals, confidence, n_resamples, seed)
+    low = pd.DataFrame(low, index = table.index, columns = table.columns)
+    high = pd.DataFrame(high, index = table.index, columns = table.columns)
+    if has_groups:
+        low, high = low.stack(), high.stack()
+    else:
+        low, high = low.iloc[0], high.iloc[0]
+    return round(low.reindex(counts.index), decimals), round(high.reindex(counts.index), decimals)
+
+
+def plot_summary(stateobj, comb_df, base_group_str, inp_list_of_groups = ['departure'], plot = 'stacked bar', plot_options = None):
+    """
+    Plots a counts and percents dataframe made by summary_from_counts.  Split out so a summary pulled from 
+    a state's query cache can be plotted without recomputing it.
+
+    Parameters
+    ----------
+    stateobj : State
+        the state who's data is being analyzed.  We need attributes of the state for plotting.
+    comb_df : pandas DataFrame
+        the counts and percents, as returned by summary_from_counts.
+    base_group_str : string
+        the name of the base group we are analyzing, used in plot titles.
+    inp_list_of_groups : list, optional
+        factors / paths the summary was grouped by. The default is ['departure'].
+    plot : string, optional
+        specifies plot type.  Can be 'bar', 'stacked bar', 'pie', 'faceted bar' or 'faceted pie'.  Anything else doesn't plot. 
+        The default is 'stacked bar'.
+    plot_options : dict, optional
+        options for the stacked bar graph (sorting, top k, pages), see plot_df. The default is None.
+
+    Returns
+    -------
+    list
+        the matplotlib Figures that were made, empty if nothing was plotted.
+
+    """
     if plot == 'stacked bar':
-        plot_df(stateobj, perc, 'stacked bar', inp_list_of_groups[:-1], base_group_str)  # call our plotting function
+        return plot_df(stateobj, comb_df['percent'], 'stacked bar', inp_list_of_groups[:-1], base_group_str, plot_options)  # call our plotting function
     elif plot == 'bar':
-        plot_df(stateobj, perc, 'bar', inp_list_of_groups[:-1], base_group_str)
+        return plot_df(stateobj, comb_df['percent'], 'bar', inp_list_of_groups[:-1], base_group_str)
     elif plot == 'pie':
-        plot_df(stateobj, counts, 'pie', inp_list_of_groups[:-1], base_group_str)
-        
-    return comb_df
+        return plot_df(stateobj, comb_df['count'], 'pie', inp_list_of_groups[:-1], base_group_str)
+    elif plot == 'faceted bar':
+        return plot_df(stateobj, comb_df['percent'], 'faceted bar', inp_list_of_groups[:-1], base_group_str)
+    elif plot == 'faceted pie':
+        return plot_df(stateobj, comb_df['count'], 'faceted pie', inp_list_of_groups[:-1], base_group_str)
+    return []
 
 
 def tb_compare_section_to_larger_group(stateobj, section_category_name, section_name,
                                     larger_group_category_name, larger_group_name,
-                                    inp_list_of_groups = ['departure'], years=None, plot=True):
+                                    inp_list_of_groups = ['departure'], years=None, plot=True,
+                                    narrate = True, threshold = 0.05, as_result = False):
     """
     Compares the sentencing rates of a smaller piece of a group to the rest of its cohort.
     NOTE: this only works if the section is a subsection fo the larger group.  FUTURE WORK, use a GUI to lock off options that wouldn't work
@@ -257,25 +781,78 @@ def tb_compare_section_to_larger_group(stateobj, section_category_name, section_
         overlapping years to be none.
     plot : bool, optional
         specifies if you want plots to be generated. The default is True.
+    narrate : bool, optional
+        if True, the findings (above / about / below for every rate) are sent to the logging module, see
+        ComparisonResult.narrate.  Nothing is printed. The default is True.
+    threshold : float or tuple, optional
+        how far off the rest's rate a section's rate has to be to count as above or below, see classify_rates.
+        The default is 0.05.
+    as_result : bool, optional
+        if True, return a ComparisonResult instead. The default is False.
 
     Returns
     -------
     a pandas datraframe of the following format:
         df[year]['section'] = section data for that yeat, has percent and count
         df[year]['rest'] = data for the year ofr the larger section
+    or, if as_result is True, a ComparisonResult with the rates, their differences and labels (and that data, as .data)
+
+    """
+
+    key = ('tb_compare_section_to_larger_group', section_category_name, section_name, 
+           larger_group_category_name, larger_group_name, tuple(inp_list_of_groups), years_key(years))
+    comparison = stateobj.query_cache.get(key)
+    if comparison is None:
+        comparison = compare_section_data(stateobj, section_category_name, section_name,
+                                          larger_group_category_name, larger_group_name, inp_list_of_groups, years)
+        stateobj.query_cache.put(key, comparison)
+
+    findings = comparison_result(stateobj, comparison, section_category_name, section_name,
+                                 larger_group_category_name, larger_group_name, threshold)
+    if narrate:
+        findings.narrate()
+    ### 6. plot the results and return data
+    if plot and len(comparison['overlapping_years']) > 0:  # nothing to plot for a section with no data
+        for unique_id in range(len(comparison['unique_identifier_strings'])):
+            section_count = np.sum(comparison['section_y_counts'][unique_id])
+            plot_section_and_rest_data(comparison['overlapping_years'], comparison['section_y_data'][unique_id], 
+                                       comparison['rest_y_data'][unique_id], section_count, 
+                                       stateobj.colors, comparison['unique_identifier_strings'][unique_id], stateobj.order_of_outputs, 
+                                       section_name, section_category_name,
+                                       larger_group_name, larger_group_category_name)
+    if as_result:
+        return findings
+    return comparison['result']
+
 
+def compare_section_data(stateobj, section_category_name, section_name,
+                         larger_group_category_name, larger_group_name,
+                         inp_list_of_groups = ['departure'], years=None):
     """
+    Does the number crunching for tb_compare_section_to_larger_group (steps 1-5), without printing or plotting anything.
+    See tb_compare_section_to_larger_group for the parameters.
 
+    Returns
+    -------
+    comparison : dict
+        'overlapping_years': years both the section and the rest have data for
+        'section_allyr_stats', 'rest_allyr_stats': subset_data_multi_level_summary of each side over all overlapping years
+        'unique_identifiers': list of subgroup tuples (ex: ('White', 'Female')), empty if only grouping by departure
+        'unique_identifier_strings': the subgroups as strings, used in graph titles ('all' if only grouping by departure)
+        'section_y_data', 'rest_y_data', 'section_y_counts': numpy arrays in the shape of 
+            (number of subgroups, len(order_of_outputs), len(overlapping_years)) holding the percents / counts for each year
+        'result': what tb_compare_section_to_larger_group returns
+
+    """
     ### 1. get the years where the seciton and larger group both have data.  Filter it for those years
-    section_filtered_data = stateobj.data[stateobj.data[stateobj.paths[section_category_name].df_colname] == section_name]
+    section_colname = stateobj.paths[section_category_name].df_colname
+    section_filtered_data = select_rows(stateobj, [(section_colname, [section_name], False)])
     rest_of_the_larger_section = None
     if larger_group_category_name not in stateobj.paths.keys():  # if we're dealing with 'state' or there's a typo
-        print('large group = state')
-        rest_of_the_larger_section = stateobj.data[stateobj.data[stateobj.paths[section_category_name].df_colname] != section_name]
+        rest_of_the_larger_section = select_rows(stateobj, [(section_colname, [section_name], True)])
     else:
-        print('large group =', larger_group_name, larger_group_category_name)
-        rest_of_the_larger_section = stateobj.data[stateobj.data[stateobj.paths[larger_group_category_name].df_colname] == larger_group_name]
-        rest_of_the_larger_section = rest_of_the_larger_section[rest_of_the_larger_section[stateobj.paths[section_category_name].df_colname] != section_name]
+        rest_of_the_larger_section = select_rows(stateobj, [(stateobj.paths[larger_group_category_name].df_colname, [larger_group_name], False),
+                                                            (section_colname, [section_name], True)])
 
     # get the years where the judge was active
     overlapping_years = years
@@ -283,16 +860,7 @@ def tb_compare_section_to_larger_group(stateobj, section_category_name, section_
         section_years = section_filtered_data[stateobj.paths['year'].df_colname].unique()
         larger_years = rest_of_the_larger_section[stateobj.paths['year'].df_colname].unique()
         overlapping_years = np.sort(list(set(section_years).intersection(set(larger_years))))
-    print(section_name, 'was active in the years:', overlapping_years)
 
-    groups_to_filter_by = []  # this list keeps track of the column names in our stateobj.data we are grouping by
-    # get the column names in our stateobj.data we are grouping by
-    total_number_of_subgroups = 1
-    for group in inp_list_of_groups:
-        groups_to_filter_by.append(stateobj.paths[group].df_colname)
-        total_number_of_subgroups = total_number_of_subgroups * len(stateobj.paths[group].levels)  # i.e, if race has 5 levels, sex has 2, this should be 10
-
-    
     ### 2. separate out the section  data and the larger group data.  the larger group is referred to as larger gorup or the rest
     # first, filter for the span of years we are looking at
     section_filtered_data = section_filtered_data[section_filtered_data[stateobj.paths['year'].df_colname].isin(overlapping_years)]
@@ -311,7 +879,6 @@ def tb_compare_section_to_larger_group(stateobj, section_category_name, section_
     # and a unique_identifier_string would be 'white female'
     unique_identifiers = []  # list of unique tuples in df.index we will need
     unique_identifier_strings = []  # string format of unique_identifiers, used in graph titles.
-
     if rest_allyr_stats.index.nlevels > 1:  # if we are grouping by variables other than departure
         for ind in rest_allyr_stats.index:
             if ind[:-1] not in unique_identifiers:  # we do ind[:-1] here because the last identifier is always departure, and we want our groups to be everything but departure
@@ -322,137 +889,246 @@ def tb_compare_section_to_larger_group(stateobj, section_category_name, section_
                     unique_identifier_string += str(string) + ' '
                 unique_identifier_string = unique_identifier_string[:-1]
                 unique_identifier_strings.append(unique_identifier_string)
-        ### 4. compare the rates (percentages) of sentencing for each unique identifier in our inp_list_of_groups levels (ex: males (race), white females (race, sex) )
-        for unique_id in unique_identifiers:
-            print('Looking at', section_name, 'vs', stateobj.name, 'for', unique_id, 's')
-            for departure_type in stateobj.order_of_outputs:
-                loc_id = unique_id + (departure_type,)
-                if loc_id in section_allyr_stats.index and loc_id in rest_allyr_stats.index:
-                    if section_allyr_stats.loc[loc_id, 'percent'] > 1.05 * rest_allyr_stats.loc[loc_id, 'percent']:
-                        print(section_name, section_category_name, 'currently has an average', departure_type,
-                              'rate above', larger_group_name,  larger_group_category_name,'average in years queried')
-                    elif section_allyr_stats.loc[loc_id, 'percent'] < 0.95 * rest_allyr_stats.loc[loc_id, 'percent']:
-                        print(section_name, section_category_name, 'currently has an average', departure_type,
-                              'rate below', larger_group_name,  larger_group_category_name,'average in years queried')
-                    else:
-                        print(section_name, section_category_name, 'currently has an average', departure_type,
-                              'rate about at', larger_group_name,  larger_group_category_name,'average in years queried')
-     ### 4. compare the rates (percentages) of sentencing for each level of departure (this is the scenario where just departure is selected)
     else:
-        unique_identifier_strings = [stateobj.name]
-        print('Looking at', section_name, 'vs', stateobj.name, 'all')
-        for departure_type in stateobj.order_of_outputs:
-            if departure_type in section_allyr_stats.index and departure_type in rest_allyr_stats.index:
-                if section_allyr_stats.loc[departure_type, 'percent'] > 1.05 * rest_allyr_stats.loc[
-                    departure_type, 'percent']:
-                    print(section_name, section_category_name, 'currently has an average', departure_type,
-                          'rate above', larger_group_name,  larger_group_category_name,'average in years queried')
-                elif section_allyr_stats.loc[departure_type, 'percent'] < 0.95 * rest_allyr_stats.loc[
-                    departure_type, 'percent']:
-                    print(section_name, section_category_name, 'currently has an average', departure_type,
-                          'rate below', larger_group_name,  larger_group_category_name,'average in years queried')
-                else:
-                    print(section_name, section_category_name, 'currently has an average', departure_type,
-                          'rate about at', larger_group_name,  larger_group_category_name,'average in years queried')
+        unique_identifier_strings = ['all']
 
     ### 5. collect the sentencing rates for the section and larger group, for each year
-    #  now we get the data for graphing: multiple levels in inp_list_of_groups
-    if rest_allyr_stats.index.nlevels > 1:
-        #  now we create the data for the by year graphs
-        years_lst = []  # list of lists for each year we will append a list tof [year, section_breakdown, rest_breakdown]
-        ret_pandas_data = {}  # pandas dataframe to return.  For format, see function header / documentation
+    # one summary per side, grouped by year too, then reindexed into arrays in the shape of 
+    # (unique identifiers, levels in departure, years).  Combinations nobody had are 0.
+    # addiitonally, the counts are also collected.  Potential for year by year chi squared testing, but counts may  be too low
+    # to obtain useful results
+    section_yearly = yearly_summary(stateobj, section_filtered_data, inp_list_of_groups)
+    rest_yearly = yearly_summary(stateobj, rest_of_the_larger_section, inp_list_of_groups)
+    id_tuples = unique_identifiers if len(unique_identifiers) > 0 else [()]
+    section_y_data = dense_yearly_summary(section_yearly['percent'], overlapping_years, id_tuples, stateobj.order_of_outputs)
+    rest_y_data = dense_yearly_summary(rest_yearly['percent'], overlapping_years, id_tuples, stateobj.order_of_outputs)
+    section_y_counts = dense_yearly_summary(section_yearly['count'], overlapping_years, id_tuples, stateobj.order_of_outputs)
 
+    if len(unique_identifiers) > 0:
+        result = {}  # pandas dataframes to return.  For format, see function header / documentation
         for year in overlapping_years:
-            #  first, filter our data for the year we want
-            year_section_data = section_filtered_data[section_filtered_data[stateobj.paths['year'].df_colname] == year]
-            year_rest_of_larger_data = rest_of_the_larger_section[rest_of_the_larger_section[stateobj.paths['year'].df_colname] == year]
-
-            #  now we group by to get section breakdowns
-            year_section_breakdown = subset_data_multi_level_summary(stateobj, year_section_data, section_name,
-                                                                     inp_list_of_groups, plot=None)
-            year_restof_breakdown = subset_data_multi_level_summary(stateobj, year_rest_of_larger_data, larger_group_name,
-                                                                    inp_list_of_groups, plot=None)
-            # we need an np array for bor the section and the rest for each year, in the shape of (levels in departure * number of unique identifiers)
-            # addiitonally, the counts are also collected, but currently unused.  Potential for year by year chi squared testing, but counts may  be too low
-            # to obtain useful results
-            section_data_percents = np.zeros((len(stateobj.order_of_outputs), len(unique_identifiers)))  
-            rest_of_data_percents = np.zeros((len(stateobj.order_of_outputs), len(unique_identifiers)))
-            section_data_counts = np.zeros((len(stateobj.order_of_outputs), len(unique_identifiers)))
-            rest_of_data_counts = np.zeros((len(stateobj.order_of_outputs), len(unique_identifiers)))
-
-            # use for index in range because for all arrays the percents will be matching
-            for dep in range(len(stateobj.order_of_outputs)):
-                for unique_id in range(len(unique_identifiers)):
-                    loc_id = unique_identifiers[unique_id] + (stateobj.order_of_outputs[dep],)
-                    if loc_id in year_section_breakdown.index:
-                        section_data_percents[dep, unique_id] = year_section_breakdown.loc[loc_id, 'percent']
-                        section_data_counts[dep, unique_id] = year_section_breakdown.loc[loc_id, 'count']
-                    if loc_id in year_restof_breakdown.index:
-                        rest_of_data_percents[dep, unique_id] = year_restof_breakdown.loc[loc_id, 'percent']
-                        rest_of_data_counts[dep, unique_id] = year_restof_breakdown.loc[loc_id, 'count']
-
-            years_lst.append({'section_percents': section_data_percents,
-                                     'rest_percents': rest_of_data_percents,
-                                     'section_counts': section_data_counts,
-                                     'rest_counts': rest_of_data_counts})
-
-            ret_pandas_data[year] = {'section': year_section_breakdown, 'rest': year_restof_breakdown}
-
-        #  now it's time to make graphs
-        
-        for unique_id in range(len(unique_identifiers)):
-            section_y_data = np.zeros((len(stateobj.order_of_outputs), len(overlapping_years)))
-            rest_y_data = np.zeros((len(stateobj.order_of_outputs), len(overlapping_years)))
-            section_y_counts = np.zeros((len(stateobj.order_of_outputs), len(overlapping_years)))
-
-            for year in range(len(years_lst)):
-                for departure_type in range(len(stateobj.order_of_outputs)):
-                    section_y_data[departure_type][year] = years_lst[year]['section_percents'][departure_type][unique_id]
-                    rest_y_data[departure_type][year] = years_lst[year]['rest_percents'][departure_type][unique_id]
-                    section_y_counts[departure_type][year] = years_lst[year]['section_counts'][departure_type][unique_id]
-            ### 6. plot the results and return data
-            if plot:
-                section_count = np.sum(section_y_counts)
-                plot_section_and_rest_data(overlapping_years, section_y_data, rest_y_data, section_count, 
-                                           stateobj.colors, unique_identifier_strings[unique_id], stateobj.order_of_outputs, 
-                                           section_name, section_category_name,
-                                           larger_group_name, larger_group_category_name)
-                
-        return ret_pandas_data
-    ### 5. collect the sentencing rates for the section and larger group, for each year.  This is for just departure selected
+            result[year] = {'section': yearly_summary_for(section_yearly, year), 'rest': yearly_summary_for(rest_yearly, year)}
     else:  # this is if we are only grouping by departure
-        section_y_data = np.zeros((len(stateobj.order_of_outputs), len(overlapping_years)))
-        rest_y_data = np.zeros((len(stateobj.order_of_outputs), len(overlapping_years)))
-        section_y_counts = np.zeros((len(stateobj.order_of_outputs), len(overlapping_years)))
-        section_y_counts = np.zeros((len(stateobj.order_of_outputs), len(overlapping_years)))
-        for year in range(len(overlapping_years)):
-            year_section_data = section_filtered_data[section_filtered_data[stateobj.paths['year'].df_colname] == overlapping_years[year]]
-            year_rest_of_larger_data = rest_of_the_larger_section[rest_of_the_larger_section[stateobj.paths['year'].df_colname] == overlapping_years[year]]
-
-            #  now we group by to get section breakdowns
-            year_section_breakdown = subset_data_multi_level_summary(stateobj, year_section_data, section_name,
-                                                                     inp_list_of_groups, plot=None)
-            year_restof_breakdown = subset_data_multi_level_summary(stateobj, year_rest_of_larger_data, stateobj.name,
-                                                                    inp_list_of_groups, plot=None)
-
-            for dep_type in range(len(stateobj.order_of_outputs)):  
-                if stateobj.order_of_outputs[dep_type] in year_section_breakdown.index:
-                    section_y_data[dep_type, year] = year_section_breakdown.loc[
-                        stateobj.order_of_outputs[dep_type], 'percent']
-                    section_y_counts[dep_type, year] = year_section_breakdown.loc[
-                        stateobj.order_of_outputs[dep_type], 'count']
-                if stateobj.order_of_outputs[dep_type] in year_restof_breakdown.index:
-                    rest_y_data[dep_type, year] = year_restof_breakdown.loc[stateobj.order_of_outputs[dep_type], 'percent']
-        ### 6. plot the results and return data
-        if plot:
-            section_count = np.sum(section_y_counts)
-            plot_section_and_rest_data(overlapping_years, section_y_data, rest_y_data, section_count, 
-                                       stateobj.colors,'all', stateobj.order_of_outputs, 
-                                       section_name, section_category_name,
-                                       larger_group_name, larger_group_category_name)
-            
-        return section_allyr_stats, rest_allyr_stats
-    
-    
-    
-    
\ No newline at end of file
+        result = (section_allyr_stats, rest_allyr_stats)
+
+    return {'overlapping_years': overlapping_years, 
+            'section_allyr_stats': section_allyr_stats, 'rest_allyr_stats': rest_allyr_stats,
+            'unique_identifiers': unique_identifiers, 'unique_identifier_strings': unique_identifier_strings,
+            'section_y_data': section_y_data, 'rest_y_data': rest_y_data, 'section_y_counts': section_y_counts,
+            'result': result}
+
+
+def yearly_summary(stateobj, subset_dat, inp_list_of_groups = ['departure']):
+    """
+    subset_data_multi_level_summary for every year at once: one groupby over (year, groups, departure).
+    The percents are the same as running subset_data_multi_level_summary on each year's data, 
+    they're out of the people in the same year and subgroup, and rounded the same way.
+
+    Parameters
+    ----------
+    stateobj : State
+        the state who's data is being analyzed.
+    subset_dat : pandas DataFrame
+        data to summarize.
+    inp_list_of_groups : list, optional
+        factors / paths to group by, with 'departure' last. The default is ['departure'].
+
+    Returns
+    -------
+    comb_df : pandas DataFrame
+        counts and percents, indexed by (year, groups..., departure).
+
+    """
+    groups = ['year'] + list(inp_list_of_groups)
+    colnames = [stateobj.paths[group].df_colname for group in groups]
+    method = getattr(stateobj, 'aggregation', 'pandas')
+    counts = group_counts(subset_dat, colnames, method)
+    totals = group_counts(subset_dat, colnames[:-1], method)  # people in each year (and subgroup)
+    return summary_from_counts(stateobj, counts, totals, stateobj.name, groups, plot = None, 
+                               decimals = 1 if len(inp_list_of_groups) > 1 else 2)
+
+
+def yearly_summary_for(comb_df, year):
+    """
+    Pulls one year out of a yearly_summary, giving what subset_data_multi_level_summary would for that year's data.
+
+    Returns
+    -------
+    pandas DataFrame
+        counts and percents for the year, indexed by (groups..., departure).  Empty if nobody was sentenced that year.
+
+    """
+    if year in comb_df.index.get_level_values(0):
+        return comb_df.xs(year, level = 0)
+    return comb_df.iloc[:0].droplevel(0)
+
+
+def dense_yearly_summary(column, years, unique_identifiers, order_of_outputs):
+    """
+    Reindexes a column of a yearly_summary into a dense numpy array, for plotting and testing.
+
+    Parameters
+    ----------
+    column : pandas Series
+        'count' or 'percent' from yearly_summary, indexed by (year, groups..., departure).
+    years : list
+        the years, in the order they should be in the array.
+    unique_identifiers : list
+        tuples of subgroups (ex: ('White', 'Female')), or [()] if only grouping by departure.
+    order_of_outputs : list
+        the departure levels, in the order they should be in the array.
+
+    Returns
+    -------
+    numpy array
+        in the shape of (unique identifiers, levels in departure, years), 0 where there's nothing in column.
+
+    """
+    if len(years) == 0 or len(unique_identifiers) == 0:  # ex: a section with no data, there's nothing to reindex
+        return np.zeros((len(unique_identifiers), len(order_of_outputs), len(years)))
+    full_index = pd.MultiIndex.from_tuples([(year,) + unique_id + (departure,) for year in years 
+                                            for unique_id in unique_identifiers for departure in order_of_outputs])
+    values = column.reindex(full_index, fill_value = 0).to_numpy(dtype = float)
+    values = values.reshape(len(years), len(unique_identifiers), len(order_of_outputs))
+    return values.transpose(1, 2, 0)
+
+
+def comparison_result(stateobj, comparison, section_category_name, section_name,
+                      larger_group_category_name, larger_group_name, threshold = 0.05):
+    """
+    Step 4 of tb_compare_section_to_larger_group: compare the rates (percentages) of sentencing for each unique 
+    identifier in our inp_list_of_groups levels (ex: males (race), white females (race, sex) ).  The labels are
+    worked out all at once by classify_rates.
+
+    Returns
+    -------
+    ComparisonResult
+        the findings of compare_section_data.
+
+    """
+    return ComparisonResult(comparison, stateobj.order_of_outputs, section_category_name, section_name,
+                            larger_group_category_name, larger_group_name, state_name = stateobj.name,
+                            larger_group_is_state = larger_group_category_name not in stateobj.paths.keys(),
+                            threshold = threshold)
+
+
+### Compare Every Section
+
+def tb_compare_all_sections(stateobj, section_category_name = 'judge', larger_group_category_name = 'county',
+                            inp_list_of_groups = ['departure'], years = None, by_year = True, threshold = 0.05):
+    """
+    Compares every section (ex: every judge) to the rest of its larger group (ex: the other judges in its county) at once.
+    This gives the same numbers as calling tb_compare_section_to_larger_group for each section, but the data is only 
+    grouped once: we count (larger group, section, year, subgroups, departure), add up the sections to get each 
+    larger group, and subtract each section from its larger group to get the rest.  Nothing is printed or plotted.
+
+    Parameters
+    ----------
+    stateobj : State
+        the state we are pulling data from.
+    section_category_name : string, optional
+        the category of the sections, must be in stateobj.paths. The default is 'judge'.
+    larger_group_category_name : string, optional
+        the category of the larger groups, must be in stateobj.paths.  Anything else (ex: 'state') compares each section
+        to the rest of the state.  A section active in several larger groups gets compared to each of them, using only 
+        its people in that larger group (tb_compare_section_to_larger_group uses all of the section's people). 
+        The default is 'county'.
+    inp_list_of_groups : list, optional
+        factors / paths to break the sections into.  Remember, keep the last value as 'departure'. The default is ['departure'].
+    years : list, optional
+        years to look at.  The default is None, all years.
+    by_year : bool, optional
+        if True, compare each year separately.  If False, each section is compared over all the years queried. 
+        The default is True.
+    threshold : float or tuple, optional
+        how far off the rest's rate a section's rate has to be to count as above or below, see classify_rates.
+        The default is 0.05.
+
+    Returns
+    -------
+    pandas DataFrame
+        one row per larger group, section, year (if by_year), subgroup and departure, with columns:
+            the path names for each of those (values decoded with the paths' levels)
+            section_count, section_total, section_percent: people in the section with this departure, 
+                people in the section (and subgroup), and the percent
+            rest_count, rest_total, rest_percent: the same for the rest of the larger group
+            difference: section_percent - rest_percent
+            label: 'above', 'about' or 'below', from classify_rates (None if rest_percent is NaN)
+        Percents aren't rounded.  rest_percent is NaN when the rest of the larger group has nobody in the subgroup.
+
+    """
+    return _compare_all_sections(stateobj, section_category_name, larger_group_category_name, inp_list_of_groups,
+                                 years, by_year, threshold)[0]
+
+
+def _compare_all_sections(stateobj, section_category_name, larger_group_category_name, inp_list_of_groups,
+                          years, by_year, threshold):
+    """
+    Does the work of tb_compare_all_sections.
+
+    Returns
+    -------
+    pandas DataFrame
+        what tb_compare_all_sections returns.
+    int
+        the number of departures, so the number of rows each (larger group, section, year, subgroup) gets.
+        Counted before decoding, when two codes share a label the decoded departures can't tell you this.
+
+    """
+    larger_is_state = larger_group_category_name not in stateobj.paths.keys()
+    key_names = [] if larger_is_state else [larger_group_category_name]
+    key_names.append(section_category_name)
+    if by_year:
+        key_names.append('year')
+    key_names += list(inp_list_of_groups)
+    larger_names = [name for name in key_names[:-1] if name != section_category_name]  # larger group, year, subgroups
+    method = getattr(stateobj, 'aggregation', 'pandas')
+    subset_dat = filter_years(stateobj, years)
+
+    def count(names):
+        """ counts the people in each combination of names, indexed by the path names """
+        if len(names) == 0:
+            return subset_dat.shape[0]
+        counts = group_counts(subset_dat, [stateobj.paths[name].df_colname for name in names], method)
+        counts.index.names = names  # use the path names from here on, they're what the user knows
+        return counts
+
+    def spread(larger, index):
+        """ lines up counts of the larger groups with the rows of index, which also has the section """
+        if len(larger_names) == 0:  # the whole state, all years, no subgroups: the same for every section
+            return np.broadcast_to(np.asarray(larger), (len(index),) + np.shape(larger))
+        return larger.reindex(index.droplevel(section_category_name)).to_numpy()
+
+    # one row per (larger group, section, year, subgroup), one column per departure.
+    # The larger groups are counted on their own, rather than by adding up the sections, so people with no section
+    # recorded still count towards the rest (like in tb_compare_section_to_larger_group).  Totals include people with
+    # a missing departure (like in summary_from_counts).
+    section_counts = count(key_names).unstack(level = -1, fill_value = 0)
+    larger_counts = count(larger_names + key_names[-1:])
+    larger_counts = larger_counts.unstack(level = -1, fill_value = 0) if len(larger_names) > 0 else larger_counts
+    departures = section_counts.columns.union(larger_counts.index if len(larger_names) == 0 else larger_counts.columns)
+    section_counts = section_counts.reindex(columns = departures, fill_value = 0)
+    if len(larger_names) > 0:
+        larger_counts = larger_counts.reindex(columns = departures, fill_value = 0)
+    else:
+        larger_counts = larger_counts.reindex(departures, fill_value = 0)
+    rest_counts = spread(larger_counts, section_counts.index) - section_counts
+    section_total = count(key_names[:-1]).reindex(section_counts.index).to_numpy()
+    rest_total = spread(count(larger_names), section_counts.index) - section_total
+
+    comparison = pd.DataFrame({'section_count': section_counts.stack(), 'rest_count': rest_counts.stack()})
+    comparison['section_total'] = np.repeat(section_total, len(departures))  # stack goes row by row
+    comparison['rest_total'] = np.repeat(rest_total, len(departures))
+    comparison['section_percent'] = 100 * comparison['section_count'] / comparison['section_total']
+    rest_total = comparison['rest_total'].where(comparison['rest_total'] > 0)  # NaN rather than divide by zero
+    comparison['rest_percent'] = 100 * comparison['rest_count'] / rest_total
+    comparison['difference'] = comparison['section_percent'] - comparison['rest_percent']
+    comparison['label'] = classify_rates(comparison['section_percent'], comparison['rest_percent'], threshold)
+
+    # decode values that have levels, like in summary_from_counts
+    for l, name in enumerate(key_names):
+        if stateobj.paths[name].levels is not None:
+            comparison = comparison.rename(stateobj.paths[name].levels, level = l)
+    comparison = comparison[['section_count', 'section_total', 'section_percent', 
+                             'rest_count', 'rest_total', 'rest_percent', 'difference', 'label']]
+    return comparison.reset_index(), len(departures)
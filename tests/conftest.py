@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:12:44 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Shared fixtures: a small synthetic state, written to a csv like the real data.
+"""
+import matplotlib
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+DEPARTURE_LEVELS = {0: 'Above Departure', 1: 'Within Range', 2: 'Below Range',
+                    3: 'Missing, Indeterminable, or Inapplicable'}
+JUDGES = ['J%d' % i for i in range(6)]
+YEARS = [2010, 2011, 2012]
+
+
+def synthetic_data(n = 2000, seed = 0, years = YEARS):
+    """
+    Random sentencing records.  Judge Ji sits in county C(i % 2), and notes is a column no path uses.
+    """
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({'judge': rng.choice(JUDGES, n),
+                         'year': rng.choice(years, n),
+                         'departure': rng.choice([0, 1, 2, 3], n),
+                         'race': rng.choice([1, 2, 3], n),
+                         'sex': rng.choice([1, 2], n),
+                         'notes': rng.choice(['a', 'b'], n)})
+    data['county'] = data['judge'].map({judge: 'C%d' % (i % 2) for i, judge in enumerate(JUDGES)})
+    return data
+
+
+def state_paths(departure_levels = DEPARTURE_LEVELS):
+    return {'judge': jt.Path('judge'), 'county': jt.Path('county'), 'year': jt.Path('year'),
+            'departure': jt.Path('departure', departure_levels),
+            'race': jt.Path('race', {1: 'White', 2: 'Black', 3: 'Other'}),
+            'sex': jt.Path('sex', {1: 'Male', 2: 'Female'})}
+
+
+@pytest.fixture(autouse = True)
+def close_figures():
+    yield
+    plt.close('all')
+
+
+@pytest.fixture
+def state_csv(tmp_path):
+    """ the path of a csv of synthetic_data() """
+    path = str(tmp_path / 'state.csv')
+    synthetic_data().to_csv(path, index = False)
+    return path
+
+
+@pytest.fixture
+def make_state(state_csv):
+    """
+    Builds states from state_csv.  Call it with any State keyword arguments, and departure_levels to change
+    the departure path's levels.
+    """
+    def make(departure_levels = DEPARTURE_LEVELS, **kwargs):
+        return jt.State('MN', state_csv, state_paths(departure_levels), using_url = False, **kwargs)
+    return make
+
+
+@pytest.fixture
+def state(make_state):
+    return make_state()
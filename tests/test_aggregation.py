@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:25:40 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for the ways summaries are counted: every shortcut should give the same summary as grouping the data.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+from conftest import synthetic_data, state_paths
+
+QUERIES = [(['departure'], None), (['sex', 'departure'], [2011]), (['race', 'judge', 'departure'], None),
+           (['county', 'sex', 'departure'], [2010, 2012]), (['year', 'race', 'departure'], [2012, 2011])]
+
+
+@pytest.fixture
+def gaps_csv(tmp_path):
+    """ synthetic_data with some race, sex and departure values missing """
+    data = synthetic_data()
+    rng = np.random.default_rng(1)
+    for colname in ['race', 'sex', 'departure']:
+        data.loc[rng.random(len(data)) < 0.05, colname] = np.nan
+    path = str(tmp_path / 'gaps.csv')
+    data.to_csv(path, index = False)
+    return path
+
+
+@pytest.mark.parametrize('prune_columns', [False, True])
+def test_summary_cube(gaps_csv, monkeypatch, prune_columns):
+    plain = jt.State('MN', gaps_csv, state_paths(), using_url = False, prune_columns = prune_columns)
+    cubed = jt.State('MN', gaps_csv, state_paths(), using_url = False, prune_columns = prune_columns, 
+                     summary_cube_depth = 2)
+    expected = [plain.generalizable_multi_level_summary(groups, years = years, plot = None) for groups, years in QUERIES]
+    # up to two paths besides year are answered from the cube, without grouping the data
+    state_module = sys.modules['JUSTFAIR_Tools.State']
+    summarize = state_module.subset_data_multi_level_summary
+    monkeypatch.setattr(state_module, 'subset_data_multi_level_summary', 
+                        lambda *args, **kwargs: pytest.fail('the data was grouped'))
+    for (groups, years), summary in zip(QUERIES, expected):
+        pd.testing.assert_frame_equal(cubed.generalizable_multi_level_summary(groups, years = years, plot = None), summary)
+    assert frozenset(['race', 'sex']) in cubed.summary_cube
+
+    # deeper groupings fall back to the data
+    monkeypatch.setattr(state_module, 'subset_data_multi_level_summary', summarize)
+    groups = ['county', 'race', 'sex', 'departure']
+    pd.testing.assert_frame_equal(cubed.generalizable_multi_level_summary(groups, plot = None),
+                                  plain.generalizable_multi_level_summary(groups, plot = None))
+
+
+@pytest.mark.parametrize('colnames', [['departure'], ['judge', 'departure'], ['year', 'race', 'sex', 'departure']])
+@pytest.mark.parametrize('max_cells', [2**26, 1])  # 1 falls back to a groupby
+def test_bincount_group_counts(gaps_csv, colnames, max_cells):
+    data = pd.read_csv(gaps_csv)
+    for frame in [data, data.astype({'judge': 'category', 'race': 'category'})]:
+        counts = jt.bincount_group_counts(frame, colnames, max_cells = max_cells)
+        pd.testing.assert_series_equal(counts, data.groupby(colnames).size(), check_names = False)
+        assert list(counts.index.names) == colnames
+
+
+@pytest.mark.parametrize('prune_columns', [False, True])
+def test_bincount_summaries(gaps_csv, prune_columns):
+    plain = jt.State('MN', gaps_csv, state_paths(), using_url = False, prune_columns = prune_columns)
+    counted = jt.State('MN', gaps_csv, state_paths(), using_url = False, prune_columns = prune_columns,
+                       aggregation = 'bincount')
+    for groups, years in QUERIES:
+        pd.testing.assert_frame_equal(counted.generalizable_multi_level_summary(groups, years = years, plot = None),
+                                      plain.generalizable_multi_level_summary(groups, years = years, plot = None))
+    pd.testing.assert_frame_equal(jt.tb_compare_all_sections(counted, inp_list_of_groups = ['sex', 'departure']),
+                                  jt.tb_compare_all_sections(plain, inp_list_of_groups = ['sex', 'departure']))
+    assert jt.benchmark_aggregation(plain, ['race', 'sex', 'departure'], repeats = 1)['matches'].all()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:02:35 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for State.append: a state with rows appended should answer like a state built from all the rows.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+from conftest import synthetic_data, state_paths
+
+OPTIONS = [{}, {'partition_by_year': True}, {'index_paths': ['judge', 'county']}, {'summary_cube_depth': 2},
+           {'partition_by_year': True, 'index_paths': ['judge'], 'summary_cube_depth': 2}]
+
+
+def build(data, path, **kwargs):
+    data.to_csv(path, index = False)
+    return jt.State('MN', str(path), state_paths(), using_url = False, **kwargs)
+
+
+def check_same_answers(appended, rebuilt):
+    assert np.array_equal(appended.years, rebuilt.years)
+    assert np.array_equal(appended.year_departure_counts, rebuilt.year_departure_counts)
+    for kwargs in [{}, {'years': [2012]}, {'inp_list_of_groups': ['race', 'sex', 'departure'], 'years': [2010, 2011]}]:
+        pd.testing.assert_frame_equal(appended.generalizable_multi_level_summary(plot = None, **kwargs),
+                                      rebuilt.generalizable_multi_level_summary(plot = None, **kwargs))
+    pd.testing.assert_frame_equal(appended.specific_subset_summary([('judge', 'J3')], ['sex', 'departure']),
+                                  rebuilt.specific_subset_summary([('judge', 'J3')], ['sex', 'departure']))
+    pd.testing.assert_frame_equal(appended.compare_judge_to_county('J1', 'C1', plot = False, narrate = False, 
+                                                                   as_result = True).rates,
+                                  rebuilt.compare_judge_to_county('J1', 'C1', plot = False, narrate = False, 
+                                                                  as_result = True).rates)
+
+
+@pytest.mark.parametrize('backend', ['pandas', 'arrow'])
+@pytest.mark.parametrize('options', OPTIONS)
+@pytest.mark.parametrize('in_order', [True, False])
+def test_append_matches_rebuilt_state(tmp_path, backend, options, in_order):
+    if backend == 'arrow':
+        pytest.importorskip('pyarrow')
+        options = dict(options, cache_dir = str(tmp_path / 'cache'))
+    data = synthetic_data()
+    if in_order:  # only new years
+        old, new = data[data['year'] < 2012], data[data['year'] == 2012]
+    else:
+        old, new = data.iloc[:1500], data.iloc[1500:]
+    (tmp_path / 'old').mkdir()
+    (tmp_path / 'all').mkdir()
+    appended = build(old, tmp_path / 'old' / 'state.csv', backend = backend, **options)
+    appended.generalizable_multi_level_summary(plot = None)  # so the indexes, partitions and cube exist before appending
+    appended.specific_subset_summary([('judge', 'J3')], ['departure'])
+    appended.append(new.reset_index(drop = True))
+    rebuilt = build(data, tmp_path / 'all' / 'state.csv', backend = backend, **options)
+    assert len(appended.data) == len(data)
+    check_same_answers(appended, rebuilt)
+
+
+def test_append_missing_columns(state):
+    with pytest.raises(ValueError):
+        state.append(pd.DataFrame({'judge': ['J1'], 'year': [2012]}))
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:40:17 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for the arrow backend (backend = 'arrow').
+"""
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+
+def test_arrow_matches_pandas(make_state, tmp_path):
+    arrow_state = make_state(backend = 'arrow', cache_dir = str(tmp_path / 'cache'))
+    pandas_state = make_state()
+    for kwargs in [{}, {'years': [2011]}, {'inp_list_of_groups': ['race', 'sex', 'departure'], 'years': [2010, 2012]}]:
+        pd.testing.assert_frame_equal(arrow_state.generalizable_multi_level_summary(plot = None, **kwargs),
+                                      pandas_state.generalizable_multi_level_summary(plot = None, **kwargs))
+    pd.testing.assert_frame_equal(arrow_state.specific_subset_summary([('judge', 'J2'), ('year', 2011)], ['sex', 'departure']),
+                                  pandas_state.specific_subset_summary([('judge', 'J2'), ('year', 2011)], ['sex', 'departure']))
+
+
+def test_setting_data(make_state, tmp_path):
+    arrow_state = make_state(backend = 'arrow', cache_dir = str(tmp_path / 'cache'))
+    pandas_state = make_state()
+    arrow_state.generalizable_multi_level_summary(plot = None)  # the old data was used once
+    arrow_state.data = arrow_state.data.iloc[:100]
+    pandas_state.data = pandas_state.data.iloc[:100]
+    assert arrow_state.table.num_rows == 100
+    for years in [None, [2011]]:
+        summary = arrow_state.generalizable_multi_level_summary(['sex', 'departure'], years = years, plot = None)
+        pd.testing.assert_frame_equal(summary, pandas_state.generalizable_multi_level_summary(['sex', 'departure'], 
+                                                                                             years = years, plot = None))
+    assert arrow_state.generalizable_multi_level_summary(['sex', 'departure'], plot = None)['count'].sum() == 100
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 23:05:37 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for the on-disk caches: the columnar copy of a state's csv (cache_dir), and DiskQueryCache, which is shared 
+between processes, so its files can disappear at any time.
+"""
+import os
+import sys
+import types
+
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+from JUSTFAIR_Tools.cache import DiskQueryCache, QueryCache
+
+from conftest import synthetic_data
+
+
+def test_csv_cache(make_state, state_csv, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    reference, pruned_reference = make_state(), make_state(prune_columns = True)
+    first = make_state(cache_dir = cache_dir)
+    assert len(os.listdir(cache_dir)) > 0
+    pd.testing.assert_frame_equal(first.data, reference.data)
+
+    read_csv = jt.State._read_csv
+    monkeypatch.setattr(jt.State, '_read_csv', lambda *args: pytest.fail('the csv was read again'))
+    pd.testing.assert_frame_equal(make_state(cache_dir = cache_dir).data, reference.data)
+    pd.testing.assert_frame_equal(make_state(cache_dir = cache_dir, prune_columns = True).data, pruned_reference.data)
+
+    # a changed csv, or refresh_cache, reads the csv again
+    monkeypatch.setattr(jt.State, '_read_csv', read_csv)
+    synthetic_data(n = 500, seed = 1).to_csv(state_csv, index = False)
+    assert len(make_state(cache_dir = cache_dir).data) == 500
+    monkeypatch.setattr(jt.State, '_read_csv', lambda *args: pytest.fail('the csv was read again'))
+    assert len(make_state(cache_dir = cache_dir).data) == 500
+    with pytest.raises(pytest.fail.Exception):
+        make_state(cache_dir = cache_dir, refresh_cache = True)
+
+
+def fail(*args, **kwargs):
+    raise FileNotFoundError('removed by another process')
+
+
+def test_get_when_touch_fails(tmp_path, monkeypatch):
+    cache = DiskQueryCache(str(tmp_path))
+    cache.put(('data', 'query'), [1, 2, 3])
+    monkeypatch.setattr(os, 'utime', fail)
+    assert cache.get(('data', 'query')) == [1, 2, 3]
+
+
+def test_get_expired_when_remove_fails(tmp_path, monkeypatch):
+    cache = DiskQueryCache(str(tmp_path), max_age = 0)
+    cache.put(('data', 'query'), [1, 2, 3])
+    monkeypatch.setattr(os, 'remove', fail)
+    assert cache.get(('data', 'query')) is None
+
+
+class Renamed:
+    pass
+
+
+def test_get_stale_pickle(tmp_path, monkeypatch):
+    cache = DiskQueryCache(str(tmp_path))
+    cache.put(('data', 'query'), Renamed())
+    monkeypatch.delitem(globals(), 'Renamed')  # like a class that was renamed since the result was stored
+    assert cache.get(('data', 'query')) is None
+    assert not os.path.exists(cache._path(('data', 'query')))
+
+
+def test_get_stale_module(tmp_path, monkeypatch):
+    module = types.ModuleType('justfair_moved_module')  # a module that is gone by the time the result is read
+    module.Old = type('Old', (), {'__module__': 'justfair_moved_module'})
+    monkeypatch.setitem(sys.modules, 'justfair_moved_module', module)
+    cache = DiskQueryCache(str(tmp_path))
+    cache.put(('data', 'query'), module.Old())
+    monkeypatch.delitem(sys.modules, 'justfair_moved_module')
+    assert cache.get(('data', 'query')) is None
+    assert not os.path.exists(cache._path(('data', 'query')))
+
+
+def test_query_cache_lru():
+    cache = QueryCache(max_size = 2)
+    cache.put(('a',), pd.DataFrame({'count': [1]}))
+    cache.put(('b',), 2)
+    cache.get(('a',))  # a is now used more recently than b
+    cache.put(('c',), 3)
+    assert ('a',) in cache and ('b',) not in cache and ('c',) in cache
+    result = cache.get(('a',))
+    result['count'] = 5  # results are copies
+    assert cache.get(('a',))['count'].tolist() == [1]
+    assert cache.get(('b',)) is None and cache.misses == 1
+    off = QueryCache(max_size = 0)
+    off.put(('a',), 1)
+    assert len(off) == 0
+
+
+def test_state_query_cache(state, monkeypatch):
+    expected = state.generalizable_multi_level_summary(['sex', 'departure'], years = [2011, 2012], plot = None)
+    state_module = sys.modules['JUSTFAIR_Tools.State']
+    monkeypatch.setattr(state_module, 'filter_years', lambda *args: pytest.fail('the summary was computed again'))
+    summary = state.generalizable_multi_level_summary(['sex', 'departure'], years = [2012, 2011], plot = None)
+    pd.testing.assert_frame_equal(summary, expected)
+    summary['count'] = 0  # editing a result doesn't change what's cached
+    pd.testing.assert_frame_equal(state.generalizable_multi_level_summary(['sex', 'departure'], years = [2011, 2012], 
+                                                                          plot = None), expected)
+    assert state.query_cache.hits == 2
+
+    monkeypatch.undo()
+    state.data = state.data[state.data['sex'] == 1]  # new data, so the cached results are dropped
+    assert state.generalizable_multi_level_summary(['sex', 'departure'], years = [2011, 2012], plot = None)['count'].sum() \
+        == ((state.data['year'] > 2010)).sum()
+
+
+def test_disk_query_cache_across_sessions(make_state, state_csv, tmp_path, monkeypatch):
+    query_cache_dir = str(tmp_path / 'queries')
+    expected = make_state(query_cache_dir = query_cache_dir).generalizable_multi_level_summary(['race', 'departure'], 
+                                                                                               plot = None)
+    later = make_state(query_cache_dir = query_cache_dir)  # a new session, with nothing in memory
+    state_module = sys.modules['JUSTFAIR_Tools.State']
+    monkeypatch.setattr(state_module, 'filter_years', lambda *args: pytest.fail('the summary was computed again'))
+    pd.testing.assert_frame_equal(later.generalizable_multi_level_summary(['race', 'departure'], plot = None), expected)
+
+    monkeypatch.undo()
+    synthetic_data(n = 500, seed = 1).to_csv(state_csv, index = False)  # a different file, so a different fingerprint
+    changed = make_state(query_cache_dir = query_cache_dir)
+    assert changed.generalizable_multi_level_summary(['race', 'departure'], plot = None)['count'].sum() == 500
+
+
+def test_disk_query_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskQueryCache(str(tmp_path), max_bytes = 10**6)
+    for name in ['a', 'b', 'c']:
+        cache.put((name,), os.urandom(300000))
+        os.utime(cache._path((name,)), (0, {'a': 1, 'b': 2, 'c': 3}[name]))  # so the order doesn't depend on the clock
+    assert cache.get(('a',)) is not None  # a is now the most recently used
+    cache.put(('d',), os.urandom(300000))
+    assert cache.get(('b',)) is None
+    assert all(cache.get((name,)) is not None for name in ['a', 'c', 'd'])
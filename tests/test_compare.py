@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:08:33 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for comparing sections (ex: judges) to the rest of their larger group (ex: county).
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+from conftest import JUDGES, YEARS
+
+
+def county_of(judge):
+    return 'C%d' % (JUDGES.index(judge) % 2)
+
+
+@pytest.mark.parametrize('larger_group', ['county', 'state'])
+@pytest.mark.parametrize('years', [None, [2011]])
+def test_compare_all_sections(state, larger_group, years):
+    everyone = jt.tb_compare_all_sections(state, 'judge', larger_group, ['sex', 'departure'], years = years, 
+                                          by_year = False)
+    assert len(everyone) == len(JUDGES) * 2 * len(state.order_of_outputs)
+    for judge in JUDGES:
+        larger_group_name = county_of(judge) if larger_group == 'county' else state.name
+        rates = state.compare_section_to_larger_group('judge', judge, larger_group, larger_group_name, ['sex', 'departure'],
+                                                      years = years, plot = False, narrate = False, as_result = True).rates
+        rows = everyone[everyone['judge'] == judge].set_index(['sex', 'departure']).loc[rates.index]
+        assert np.array_equal(rows['section_count'], rates['section_count'])
+        assert np.array_equal(rows['rest_count'], rates['rest_count'])
+        # the summaries round their percents, tb_compare_all_sections doesn't
+        assert np.allclose(rows['section_percent'], rates['section_percent'], atol = 0.05)
+        assert np.allclose(rows['rest_percent'], rates['rest_percent'], atol = 0.05)
+
+
+def test_compare_all_sections_by_year(state):
+    by_year = jt.tb_compare_all_sections(state, 'judge', 'county', ['departure'])
+    for year in YEARS:
+        expected = jt.tb_compare_all_sections(state, 'judge', 'county', ['departure'], years = [year], by_year = False)
+        rows = by_year[by_year['year'] == year].drop(columns = 'year').reset_index(drop = True)
+        pd.testing.assert_frame_equal(rows, expected)
+
+
+@pytest.mark.parametrize('groups', [['sex', 'departure'], ['race', 'sex', 'departure']])
+def test_yearly_breakdown(state, groups):
+    # each year's breakdown is the summary of just that year's rows, like looping over the years would give
+    data = state.data
+    result = state.compare_judge_to_county('J1', 'C1', groups, plot = False, narrate = False)
+    assert sorted(result) == YEARS
+    for year in YEARS:
+        judge_rows = data[(data['judge'] == 'J1') & (data['year'] == year)]
+        rest_rows = data[(data['county'] == 'C1') & (data['judge'] != 'J1') & (data['year'] == year)]
+        for side, rows in [('section', judge_rows), ('rest', rest_rows)]:
+            expected = jt.subset_data_multi_level_summary(state, rows, 'J1', groups, plot = None)
+            pd.testing.assert_frame_equal(result[year][side], expected, check_names = False)
+
+    # and the dense arrays the plots use: (subgroup, departure, year), with 0 for combinations nobody had
+    comparison = jt.compare_section_data(state, 'judge', 'J1', 'county', 'C1', groups)
+    for y, year in enumerate(YEARS):
+        section = result[year]['section']
+        for u, unique_id in enumerate(comparison['unique_identifiers']):
+            for d, departure in enumerate(state.order_of_outputs):
+                row = unique_id + (departure,)
+                expected = section.loc[row] if row in section.index else {'percent': 0, 'count': 0}
+                assert comparison['section_y_data'][u, d, y] == expected['percent']
+                assert comparison['section_y_counts'][u, d, y] == expected['count']
+
+
+def test_classify_rates():
+    labels = jt.classify_rates([10.6, 10.4, 9.6, 9.4, 5, np.nan], [10, 10, 10, 10, np.nan, 10])
+    assert labels.tolist() == ['above', 'about', 'about', 'below', None, None]
+    assert jt.classify_rates([10.4, 9.4], [10, 10], threshold = (0.1, 0.02)).tolist() == ['above', 'about']
+
+
+@pytest.mark.parametrize('groups', [['departure'], ['sex', 'departure']])
+def test_comparison_result(state, groups, caplog, capsys):
+    with caplog.at_level(logging.INFO, logger = 'JUSTFAIR_Tools.ComparisonResult'):
+        result = state.compare_judge_to_county('J1', 'C1', groups, plot = False, as_result = True)
+    assert capsys.readouterr().out == ''  # narrated through logging, not printed
+    assert [record.getMessage() for record in caplog.records] == result.messages()
+
+    comparison = jt.compare_section_data(state, 'judge', 'J1', 'county', 'C1', groups)
+    rates = result.rates
+    assert len(rates) == (2 if len(groups) > 1 else 1) * len(state.order_of_outputs)
+    assert np.array_equal(rates['section_count'], comparison['section_allyr_stats'].loc[rates.index, 'count'])
+    assert np.array_equal(rates['rest_percent'], comparison['rest_allyr_stats'].loc[rates.index, 'percent'])
+    assert np.allclose(rates['difference'], rates['section_percent'] - rates['rest_percent'])
+    assert rates['label'].tolist() == jt.classify_rates(rates['section_percent'], rates['rest_percent']).tolist()
+    # one sentence per rate, after the headers
+    assert sum('currently has an average' in line for line in result.messages()) == len(rates)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 18:05:12 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Regression tests for queries that select no rows (ex: a misspelled judge).  These used to come back empty.
+"""
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+
+@pytest.mark.parametrize('groups', [['departure'], ['sex', 'departure']])
+def test_compare_unknown_section(state, groups):
+    result = state.compare_judge_to_county('nobody', 'C1', groups, plot = True, as_result = True)
+    assert len(result.overlapping_years) == 0
+    assert len(result.rates) == 0
+    assert len(plt.get_fignums()) == 0
+
+
+@pytest.mark.parametrize('groups', [['departure'], ['sex', 'departure']])
+def test_empty_summary_stacked_bar(state, groups):
+    summary = state.generalizable_multi_level_summary(groups, years = [], plot = 'stacked bar')
+    assert len(summary) == 0
+    summary = state.specific_subset_summary([('judge', 'nobody')], groups, plot = 'stacked bar')
+    assert len(summary) == 0
+    assert len(plt.get_fignums()) == 0
+
+
+@pytest.mark.parametrize('plot', ['bar', 'pie', 'faceted bar', 'faceted pie'])
+@pytest.mark.parametrize('groups', [['departure'], ['sex', 'departure']])
+def test_empty_summary_other_plots(state, groups, plot):
+    summary = state.generalizable_multi_level_summary(groups, years = [], plot = plot)
+    assert len(summary) == 0
+    assert len(plt.get_fignums()) == 0
+
+
+def test_faceted_plot_without_subgroups():
+    assert jt.plot_departures_faceted(['Within Range'], np.zeros((0, 1)), ['grey'], 'MN', ['sex'], []) == []
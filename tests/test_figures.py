@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 22:48:51 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Regression tests for the cap on open figures (set_max_open_figures).
+"""
+import matplotlib.pyplot as plt
+
+import JUSTFAIR_Tools as jt
+
+
+def test_state_trends(state):
+    jt.set_max_open_figures(2)
+    try:
+        fig = state.state_trends(compressed = True)
+        assert fig.number in plt.get_fignums()
+        figures = state.state_trends()
+    finally:
+        jt.set_max_open_figures(None)
+    assert len(figures) == len(state.order_of_outputs)
+    assert len(plt.get_fignums()) <= 2
+
+
+def test_new_figure_closes_the_oldest():
+    jt.set_max_open_figures(3)
+    try:
+        figures = [jt.new_figure()[0] for _ in range(5)]
+    finally:
+        jt.set_max_open_figures(None)
+    assert plt.get_fignums() == [fig.number for fig in figures[-3:]]
+
+
+def test_managed_figures(state):
+    kept = plt.figure()
+    with jt.managed_figures() as figures:
+        state.generalizable_multi_level_summary(['sex', 'departure'], plot = 'bar')
+        assert figures == []
+    assert len(figures) == 2
+    assert [fig.axes[0].get_title().split()[-1] for fig in figures] == ['Males', 'Females']
+    assert plt.get_fignums() == [kept.number]  # only the figures made in the block are closed
+
+    with jt.managed_figures(close = False) as figures:
+        state.generalizable_multi_level_summary(['departure'], plot = 'pie')
+    assert len(figures) == 1
+    assert figures[0].number in plt.get_fignums()
+
+
+def test_summary_respects_the_cap(state):
+    jt.set_max_open_figures(2)
+    try:
+        state.generalizable_multi_level_summary(['judge', 'departure'], plot = 'bar')
+    finally:
+        jt.set_max_open_figures(None)
+    assert len(plt.get_fignums()) == 2
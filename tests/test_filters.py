@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:42:09 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for selecting rows: indexes, year partitions and compiled filters should pick the same rows as a plain mask.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+CONDITIONS = [[('judge', ['J1'], False)],
+              [('judge', ['J1', 'J4', 'nobody'], False), ('sex', [2], False)],
+              [('county', ['C0'], False), ('judge', ['J2'], True), ('year', [2010, 2012], False)],
+              [('judge', ['J0', 'J3'], True)],
+              [('judge', ['nobody'], False)]]
+
+
+def masked(data, conditions):
+    """ the rows meeting conditions, with a plain pandas mask """
+    mask = np.ones(len(data), dtype = bool)
+    for colname, values, exclude in conditions:
+        mask &= data[colname].isin(values).to_numpy() != exclude
+    return data[mask].reset_index(drop = True)
+
+
+@pytest.mark.parametrize('backend', ['pandas', 'arrow'])
+def test_index(make_state, tmp_path, backend):
+    if backend == 'arrow':
+        pytest.importorskip('pyarrow')
+    state = make_state(index_paths = ['judge', 'county'], backend = backend, cache_dir = str(tmp_path / 'cache'))
+    plain = make_state(backend = backend, cache_dir = str(tmp_path / 'cache'))
+    index = state.get_index('judge')
+    judges = state.data['judge'].to_numpy()
+    assert sorted(index) == sorted(np.unique(judges))
+    for judge, positions in index.items():
+        assert np.array_equal(positions, np.flatnonzero(judges == judge))
+    assert state.get_index('sex') is None  # not in index_paths
+    for conditions in CONDITIONS:
+        expected = masked(plain.data, conditions)
+        pd.testing.assert_frame_equal(jt.select_rows(state, conditions).reset_index(drop = True), expected)
+        pd.testing.assert_frame_equal(jt.select_rows(plain, conditions).reset_index(drop = True), expected)
+
+
+@pytest.mark.parametrize('backend', ['pandas', 'arrow'])
+def test_year_partitions(make_state, tmp_path, backend):
+    if backend == 'arrow':
+        pytest.importorskip('pyarrow')
+    state = make_state(partition_by_year = True, backend = backend, cache_dir = str(tmp_path / 'cache'))
+    # the same rows, sorted by year and otherwise in the csv's order
+    plain = make_state(backend = backend).data.sort_values('year', kind = 'stable').reset_index(drop = True)
+    pd.testing.assert_frame_equal(state.data, plain)
+    counts = plain['year'].value_counts().sort_index().to_numpy()
+    assert state.year_ranges([2010, 2012]) == [(0, counts[0]), (counts[:2].sum(), counts.sum())]
+    assert state.year_ranges([2011, 2012, 2013]) == [(counts[0], counts.sum())]  # next to each other, so one slice
+    assert state.year_ranges([2009]) == []
+    for years in [[2011], [2012, 2010], [2009]]:
+        expected = masked(plain, [('year', years, False)])
+        pd.testing.assert_frame_equal(jt.filter_years(state, years).reset_index(drop = True), expected)
+    for conditions in CONDITIONS:
+        pd.testing.assert_frame_equal(jt.select_rows(state, conditions).reset_index(drop = True), 
+                                      masked(plain, conditions))
+
+
+def test_compile_filter(state):
+    conditions = jt.compile_filter(state, [('sex', 'Female'), ('judge', ['J1', 'J2', 'J5']), ('year', [2011, 2012]),
+                                           ('judge', ['J2', 'J5', 'J0']), ('race', [3, 'Black'])])
+    # labels are decoded, codes are kept, and the two judge filters are one condition with the judges they share
+    assert conditions == [('sex', [2], False), ('judge', ['J2', 'J5'], False), ('year', [2011, 2012], False),
+                          ('race', [3, 2], False)]
+    # several codes sharing a label all match it
+    state.paths['departure'].levels = {0: 'Above Departure', 1: 'Within Range', 2: 'Missing', 3: 'Missing'}
+    assert jt.compile_filter(state, [('departure', 'Missing')]) == [('departure', [2, 3], False)]
+
+
+@pytest.mark.parametrize('options', [{}, {'index_paths': ['judge', 'county'], 'partition_by_year': True}])
+@pytest.mark.parametrize('filters', [[('county', 'C1'), ('sex', ['Female']), ('year', [2011, 2012])],
+                                     [('judge', ['J0', 'J2']), ('judge', 'J2'), ('race', ['White', 'Other'])],
+                                     [('judge', 'nobody')]])
+def test_specific_subset_summary(make_state, options, filters):
+    state = make_state(**options)
+    # the mask path: filter one tuple at a time, with the values already decoded
+    data = make_state().data
+    for path_name, values in filters:
+        values = [values] if isinstance(values, str) else values
+        levels = state.paths[path_name].levels or {}
+        codes = [code for code, label in levels.items() if label in values] + [value for value in values 
+                                                                              if value not in levels.values()]
+        data = data[data[state.paths[path_name].df_colname].isin(codes)]
+    expected = jt.subset_data_multi_level_summary(state, data, state.name, ['race', 'departure'], plot = None)
+    pd.testing.assert_frame_equal(state.specific_subset_summary(filters, ['race', 'departure'], plot = None), expected)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:05:17 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for the faceted and stacked bar renderers, checked against what ends up on the axes.
+"""
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.collections import PolyCollection
+import pytest
+
+import JUSTFAIR_Tools as jt
+from conftest import DEPARTURE_LEVELS
+
+LABELS = list(DEPARTURE_LEVELS.values())
+COLORS = ['tab:red', 'tab:green', 'tab:blue', 'tab:gray']
+
+### Faceted Bar and Pie Charts
+
+def visible_axes(fig):
+    return [ax for ax in fig.axes if ax.get_visible()]
+
+
+@pytest.mark.parametrize('kind', ['bar', 'pie'])
+def test_faceted_grid(kind):
+    porportions = np.array([[10, 40, 30, 20], [25, 25, 25, 25], [0, 0, 0, 0], [50, 50, 0, 0], [5, 90, 5, 0]], dtype = float)
+    titles = ['a', 'b', 'c', 'd', 'e']
+    fig = jt.plot_departures_faceted(LABELS, porportions, COLORS, 'MN', ['race'], titles, kind)
+    assert plt.get_fignums() == [fig.number]
+    assert len(fig.axes) == 6  # a 2 x 3 grid, the last spot hidden
+    axes = visible_axes(fig)
+    assert [ax.get_title() for ax in axes] == titles
+    assert len(fig.legends) == 1
+    assert [text.get_text() for text in fig.legends[0].get_texts()] == LABELS
+    assert fig.get_suptitle() == 'Proportional sentences for MN races'
+    if kind == 'bar':
+        for ax, row in zip(axes, porportions):
+            assert [patch.get_width() for patch in ax.patches] == list(row)
+    else:
+        assert [text.get_text() for text in axes[2].texts] == ['no data']
+        assert len(axes[0].patches) == 4
+
+
+def test_faceted_empty():
+    assert jt.plot_departures_faceted(LABELS, np.empty((0, 4)), COLORS, 'MN', ['race'], [], 'bar') == []
+
+
+@pytest.mark.parametrize('kind', ['bar', 'pie'])
+def test_faceted_summary(state, kind):
+    with jt.managed_figures() as figures:
+        summary = state.generalizable_multi_level_summary(['race', 'sex', 'departure'], plot = 'faceted ' + kind)
+        assert len(plt.get_fignums()) == 1
+    assert len(figures) == 1
+    axes = visible_axes(figures[0])
+    assert [ax.get_title() for ax in axes] == ['White Male', 'White Female', 'Black Male', 'Black Female',
+                                                'Other Male', 'Other Female']
+    if kind == 'bar':
+        percents = summary['percent'].sort_index()
+        for ax in axes:
+            race, sex = ax.get_title().split()
+            expected = percents.loc[race, sex].reindex(LABELS, fill_value = 0).to_numpy()
+            np.testing.assert_allclose([patch.get_width() for patch in ax.patches], expected)
+
+
+def test_faceted_summary_departure_only(state):
+    with jt.managed_figures() as figures:
+        state.generalizable_multi_level_summary(['departure'], plot = 'faceted bar')
+    assert len(figures) == 1
+    assert [ax.get_title() for ax in visible_axes(figures[0])] == [state.name]
+
+### Stacked Bar Plot
+
+def bar_names(fig):
+    """ the bar names from top to bottom """
+    return [label.get_text() for label in fig.axes[0].get_yticklabels()][::-1]
+
+
+def random_bars(n, seed = 0):
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(1, 50, (4, n)).astype(float)
+    return ['g%d' % i for i in range(n)], 100 * counts / counts.sum(axis = 0)
+
+
+def test_stacked_pages():
+    names, porportions = random_bars(25)
+    figures = jt.plot_departures_stacked_pages(names, porportions, COLORS, 'MN', ['judge'], LABELS,
+                                               sort_by = 'Above Departure', top_k = 22, page_size = 10)
+    assert len(figures) == 3
+    assert [fig.axes[0].get_title() for fig in figures] == ['Proportional sentences for MN judges (page %d of 3)' % i
+                                                             for i in (1, 2, 3)]
+    expected = [names[i] for i in np.argsort(-porportions[0], kind = 'stable')[:22]]
+    assert sum((bar_names(fig) for fig in figures), []) == expected
+
+    figures = jt.plot_departures_stacked_pages(names, porportions, COLORS, 'MN', ['judge'], LABELS,
+                                               sort_by = 'Below Range', ascending = True, top_k = 5)
+    assert len(figures) == 1
+    assert figures[0].axes[0].get_title() == 'Proportional sentences for MN judges'
+    assert bar_names(figures[0]) == [names[i] for i in np.argsort(porportions[2], kind = 'stable')[:5]]
+
+
+def test_stacked_keeps_order_unsorted():
+    names, porportions = random_bars(5)
+    fig, = jt.plot_departures_stacked_pages(names, porportions, COLORS, 'MN', ['judge'], LABELS)
+    assert bar_names(fig) == names[::-1]  # barh draws the first bar at the bottom
+    ax = fig.axes[0]
+    widths = np.array([patch.get_width() for patch in ax.patches]).reshape(4, 5)
+    np.testing.assert_allclose(widths, porportions)
+
+
+def test_stacked_dense():
+    names, porportions = random_bars(300)
+    fig = jt.plot_departures_stacked(names, porportions, COLORS, 'MN', ['judge'], LABELS, max_height = 15)
+    ax = fig.axes[0]
+    assert fig.get_size_inches()[1] == 15
+    collections = [collection for collection in ax.collections if isinstance(collection, PolyCollection)]
+    assert len(collections) == 4
+    assert len(ax.patches) == 0
+    assert [text.get_text() for text in ax.get_legend().get_texts()] == LABELS
+    # every level starts where the one before it ended, and the bars add up to 100
+    corners = np.stack([collection.get_paths()[0].vertices[:4] for collection in collections])
+    np.testing.assert_allclose(corners[-1, 2, 0], 100)
+    np.testing.assert_allclose(corners[1:, 0, 0], corners[:-1, 2, 0])
+
+
+def test_stacked_summary_plot_options(state):
+    with jt.managed_figures() as figures:
+        summary = state.generalizable_multi_level_summary(['judge', 'departure'], plot = 'stacked bar',
+                                                          plot_options = {'sort_by': 'Within Range', 'page_size': 4})
+    assert len(figures) == 2
+    within = summary['percent'].xs('Within Range', level = 'departure')
+    expected = list(within.sort_values(ascending = False, kind = 'stable').index)
+    assert sum((bar_names(fig) for fig in figures), []) == expected
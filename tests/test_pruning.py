@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:20:48 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for prune_columns: a pruned state keeps less, but answers exactly like an unpruned one, dtypes included.
+"""
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+
+def answers(state):
+    return [state.generalizable_multi_level_summary(plot = None),
+            state.generalizable_multi_level_summary(['race', 'judge', 'departure'], plot = None),
+            state.generalizable_multi_level_summary(['year', 'sex', 'departure'], years = [2010, 2012], plot = None),
+            state.specific_subset_summary([('county', 'C1')], ['sex', 'departure']),
+            state.compare_judge_to_county('J3', 'C1', ['race', 'departure'], plot = False, narrate = False, 
+                                          as_result = True).rates,
+            jt.tb_compare_all_sections(state, inp_list_of_groups = ['sex', 'departure'])]
+
+
+def test_pruned_columns(make_state):
+    pruned = make_state(prune_columns = True)
+    assert set(pruned.data.columns) == {'judge', 'county', 'year', 'departure', 'race', 'sex'}  # not notes
+    assert isinstance(pruned.data['judge'].dtype, pd.CategoricalDtype)
+    assert pruned.data.memory_usage(deep = True).sum() < make_state().data.memory_usage(deep = True).sum()
+
+
+@pytest.mark.parametrize('options', [{}, {'aggregation': 'bincount'}, {'summary_cube_depth': 2}])
+def test_pruned_answers_match(make_state, options):
+    for pruned_answer, answer in zip(answers(make_state(prune_columns = True, **options)), answers(make_state())):
+        pd.testing.assert_frame_equal(pruned_answer, answer, check_index_type = True)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:02:47 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for writing figures to disk (render.py).
+"""
+import os
+
+import matplotlib.pyplot as plt
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+from conftest import JUDGES
+
+
+def test_render_figures(state, tmp_path):
+    summary, paths = jt.render_figures(state.generalizable_multi_level_summary, ['sex', 'departure'], plot = 'bar',
+                                       directory = str(tmp_path / 'figures'), name = 'MN sex', formats = ('png', 'svg'))
+    pd.testing.assert_frame_equal(summary, state.generalizable_multi_level_summary(['sex', 'departure'], plot = None))
+    assert len(paths) == 2 * 2  # a bar graph per sex, in two formats
+    assert os.path.basename(paths[0]) == 'MN_sex_1.png'
+    assert all(os.path.getsize(path) > 0 for path in paths)
+    assert plt.get_fignums() == []
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_render_section_reports(state, tmp_path, max_workers):
+    written = jt.render_section_reports(state, str(tmp_path / 'reports'), max_workers = max_workers)
+    assert sorted(written) == JUDGES
+    for judge, paths in written.items():
+        names = sorted(os.path.basename(path) for path in paths)
+        assert names[0] == 'summary_1.png'
+        assert all(name.startswith('vs_C%d_' % (JUDGES.index(judge) % 2)) for name in names[1:]) and len(names) > 1
+        assert all(os.path.dirname(path) == str(tmp_path / 'reports' / judge) and os.path.getsize(path) > 0 
+                   for path in paths)
+    assert plt.get_fignums() == []
+    assert jt.render_section_reports(state, str(tmp_path / 'reports'), sections = ['J2'], summary_plot = None, 
+                                     max_workers = 1)['J2'] == [path for path in written['J2'] if 'vs_' in path]
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 22:15:03 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for the significance tests, checked against textbook values.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+from conftest import JUDGES, YEARS
+from JUSTFAIR_Tools.significance import _chi2_sf
+
+
+def test_two_proportion_test():
+    z, p_values = jt.two_proportion_test([30, 0, 5], [100, 0, 10], [20, 3, 10], [100, 10, 20])
+    assert np.allclose(z[0], 1.63299, atol = 1e-5) and np.allclose(p_values[0], 0.10247, atol = 1e-5)
+    assert np.isnan(p_values[1])  # nobody in the first group
+    assert z[2] == 0 and p_values[2] == 1  # the same proportion
+
+
+def test_chi_squared_test():
+    chi_squared, dof, p_values = jt.chi_squared_test([[10, 20, 0], [5, 0, 0]], [[30, 40, 0], [0, 0, 0]])
+    assert np.allclose(chi_squared[0], 0.79365, atol = 1e-5) and dof[0] == 1  # the unused outcome is left out
+    assert np.allclose(p_values[0], 0.37300, atol = 1e-5)
+    assert np.isnan(p_values[1])
+
+
+@pytest.mark.parametrize('scipy', [True, False])
+def test_chi_squared_distribution(monkeypatch, scipy):
+    if not scipy:  # the exact formulas used without scipy
+        monkeypatch.setitem(sys.modules, 'scipy.stats', None)
+        monkeypatch.setitem(sys.modules, 'scipy.special', None)
+    # the 0.05 critical values for 1 to 5 degrees of freedom
+    assert np.allclose(_chi2_sf([3.841459, 5.991465, 7.814728, 9.487729, 11.070498], [1, 2, 3, 4, 5]), 0.05, atol = 1e-6)
+    assert np.allclose(jt.two_proportion_test([30], [100], [20], [100])[1], 0.10247, atol = 1e-5)
+
+
+def test_adjust_p_values():
+    p_values = [0.01, 0.04, 0.03, 0.2, np.nan]
+    assert np.allclose(jt.adjust_p_values(p_values, 'bonferroni'), [0.04, 0.16, 0.12, 0.8, np.nan], equal_nan = True)
+    assert np.allclose(jt.adjust_p_values(p_values, 'holm'), [0.04, 0.09, 0.09, 0.2, np.nan], equal_nan = True)
+    assert np.allclose(jt.adjust_p_values(p_values, 'fdr_bh'), [0.04, 0.16 / 3, 0.16 / 3, 0.2, np.nan], equal_nan = True)
+    with pytest.raises(ValueError):
+        jt.adjust_p_values(p_values, 'sidak')
+
+
+@pytest.mark.parametrize('test', ['proportions', 'chi squared'])
+def test_all_sections(state, test):
+    results = jt.tb_test_all_sections(state, inp_list_of_groups = ['sex', 'departure'], test = test, correction = 'holm')
+    counts = jt.tb_compare_all_sections(state, inp_list_of_groups = ['sex', 'departure'], by_year = False)
+    if test == 'proportions':
+        p_values = jt.two_proportion_test(counts['section_count'], counts['section_total'], 
+                                          counts['rest_count'], counts['rest_total'])[1]
+    else:  # one test per judge and sex, over its four departures
+        p_values = jt.chi_squared_test(counts['section_count'].to_numpy().reshape(-1, 4), 
+                                       counts['rest_count'].to_numpy().reshape(-1, 4))[2]
+        assert results[['county', 'judge', 'sex']].equals(counts[['county', 'judge', 'sex']].iloc[::4].reset_index(drop = True))
+    assert np.allclose(results['p_value'], p_values)
+    assert np.allclose(results['p_adjusted'], jt.adjust_p_values(p_values, 'holm'))
+    assert (results['significant'] == (results['p_adjusted'] < 0.05)).all()
+
+
+@pytest.mark.parametrize('by_year', [False, True])
+def test_chi_squared_with_shared_departure_labels(make_state, by_year):
+    # two codes share a label, the rows of each group still have to line up with their counts
+    distinct = make_state({0: 'Above Departure', 1: 'Within Range', 2: 'Below Range', 3: 'Missing'})
+    shared = make_state({0: 'Above Departure', 1: 'Within Range', 2: 'Missing', 3: 'Missing'})
+    expected = jt.tb_test_all_sections(distinct, inp_list_of_groups = ['sex', 'departure'], by_year = by_year,
+                                       test = 'chi squared')
+    results = jt.tb_test_all_sections(shared, inp_list_of_groups = ['sex', 'departure'], by_year = by_year,
+                                      test = 'chi squared')
+    assert len(results) == len(expected) == 2 * len(JUDGES) * (len(YEARS) if by_year else 1)
+    pd.testing.assert_frame_equal(results, expected)
+
+
+def test_percent_confidence_intervals():
+    counts = np.array([[50, 50, 0], [5, 10, 80], [0, 0, 0]])
+    totals = np.array([100, 100, 0])  # the second group has 5 people with no outcome
+    low, high = jt.percent_confidence_intervals(counts, totals, n_resamples = 4000, seed = 0)
+    # close to the normal approximation
+    share = counts[:2] / totals[:2, None]
+    margin = 100 * 1.96 * np.sqrt(share * (1 - share) / totals[:2, None])
+    assert np.allclose(low[:2], 100 * share - margin, atol = 2)
+    assert np.allclose(high[:2], 100 * share + margin, atol = 2)
+    assert np.all(low[2] == 0) and np.all(high[2] == 0)
+    # the same seed gives the same intervals, in this process or spread over a pool
+    again = jt.percent_confidence_intervals(counts, totals, n_resamples = 4000, seed = 0, max_workers = 2, block_size = 1)
+    single = jt.percent_confidence_intervals(counts, totals, n_resamples = 4000, seed = 0, max_workers = 1, block_size = 1)
+    assert np.array_equal(again[0], single[0]) and np.array_equal(again[1], single[1])
+
+
+def test_summary_confidence(state):
+    summary = state.generalizable_multi_level_summary(['sex', 'departure'], plot = None, confidence = 0.9, seed = 1)
+    assert ((summary['percent_low'] <= summary['percent']) & (summary['percent'] <= summary['percent_high'])).all()
+    pd.testing.assert_frame_equal(summary[['count', 'percent']], 
+                                  state.generalizable_multi_level_summary(['sex', 'departure'], plot = None))
+    state.query_cache.clear()  # drawn again, the same seed gives the same intervals
+    pd.testing.assert_frame_equal(state.generalizable_multi_level_summary(['sex', 'departure'], plot = None, 
+                                                                          confidence = 0.9, seed = 1), summary)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 12:31:52 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for State.save / State.load: a loaded snapshot should answer exactly like the state that was saved.
+"""
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+
+def check_same_state(loaded, saved):
+    pd.testing.assert_frame_equal(loaded.data, saved.data)
+    assert loaded.name == saved.name and loaded.order_of_outputs == saved.order_of_outputs
+    assert np.array_equal(loaded.years, saved.years)
+    assert np.array_equal(loaded.year_departure_counts, saved.year_departure_counts)
+    assert loaded.average_percents == saved.average_percents
+    assert loaded.yearly_average_percents == saved.yearly_average_percents
+    for kwargs in [{}, {'inp_list_of_groups': ['race', 'sex', 'departure'], 'years': [2011, 2012]}]:
+        pd.testing.assert_frame_equal(loaded.generalizable_multi_level_summary(plot = None, **kwargs),
+                                      saved.generalizable_multi_level_summary(plot = None, **kwargs))
+    pd.testing.assert_frame_equal(loaded.compare_judge_to_county('J4', 'C0', ['sex', 'departure'], plot = False, 
+                                                                 narrate = False, as_result = True).rates,
+                                  saved.compare_judge_to_county('J4', 'C0', ['sex', 'departure'], plot = False, 
+                                                                narrate = False, as_result = True).rates)
+
+
+@pytest.mark.parametrize('options', [{}, {'prune_columns': True},
+                                     {'prune_columns': True, 'partition_by_year': True, 'index_paths': ['judge'],
+                                      'summary_cube_depth': 2}])
+@pytest.mark.parametrize('load_options', [{}, {'mmap': False}, {'lazy': True}])
+def test_round_trip(make_state, tmp_path, options, load_options):
+    saved = make_state(**options)
+    saved.generalizable_multi_level_summary(plot = None)  # builds the summary cube, if there is one
+    saved.save(str(tmp_path / 'snapshot'))
+    loaded = jt.State.load(str(tmp_path / 'snapshot'), **load_options)
+    assert loaded.partition_by_year == saved.partition_by_year
+    assert (loaded.summary_cube is not None) == (saved.summary_cube is not None)
+    check_same_state(loaded, saved)
+
+
+def test_round_trip_arrow(make_state, tmp_path):
+    pytest.importorskip('pyarrow')
+    saved = make_state(prune_columns = True)
+    saved.save(str(tmp_path / 'snapshot'))
+    check_same_state(jt.State.load(str(tmp_path / 'snapshot'), backend = 'arrow'), saved)
+
+
+def test_old_snapshot_version(state, tmp_path):
+    state.save(str(tmp_path / 'snapshot'))
+    with open(tmp_path / 'snapshot' / 'state.pkl', 'rb') as f:
+        profile = pickle.load(f)
+    profile['snapshot_version'] = -1
+    with open(tmp_path / 'snapshot' / 'state.pkl', 'wb') as f:
+        pickle.dump(profile, f)
+    with pytest.raises(ValueError):
+        jt.State.load(str(tmp_path / 'snapshot'))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 12:04:11 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for what a State keeps about its data, checked against counting synthetic_data with pandas.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+from conftest import synthetic_data, YEARS
+
+
+def test_year_departure_counts(state):
+    data = synthetic_data()
+    crosstab = pd.crosstab(data['year'], data['departure'])
+    assert np.array_equal(state.years, YEARS)
+    # one column per departure in order_of_outputs, plus the missing / unknown ones (none here)
+    assert np.array_equal(state.year_departure_counts, np.column_stack([crosstab.to_numpy(), np.zeros(len(YEARS))]))
+
+    percents = 100 * crosstab.div(crosstab.sum(axis = 1), axis = 0)
+    for year in YEARS:
+        assert np.allclose(state.yearly_average_percents[year], percents.loc[year], atol = 0.005)
+    assert np.allclose(state.average_percents, 100 * data['departure'].value_counts(normalize = True).sort_index(), 
+                       atol = 0.005)
+    assert np.allclose(state.calc_state_avg_for_yearspan([2010, 2012]), percents.loc[[2010, 2012]].mean(), atol = 0.005)
+    with pytest.raises(KeyError):
+        state.calc_state_avg_for_yearspan([2009])
+
+
+@pytest.mark.parametrize('first_use', ['data', 'years', 'average_percents', 'summary'])
+def test_lazy_state(make_state, monkeypatch, first_use):
+    eager = make_state()
+    reads = []
+    read_csv = jt.State._read_csv
+    monkeypatch.setattr(jt.State, '_read_csv', lambda *args, **kwargs: reads.append(1) or read_csv(*args, **kwargs))
+    lazy = make_state(lazy = True)
+    assert len(reads) == 0  # nothing is read until it is used
+    if first_use == 'summary':
+        pd.testing.assert_frame_equal(lazy.generalizable_multi_level_summary(['sex', 'departure'], plot = None),
+                                      eager.generalizable_multi_level_summary(['sex', 'departure'], plot = None))
+    else:
+        getattr(lazy, first_use)
+    assert len(reads) == 1
+    assert np.array_equal(lazy.year_departure_counts, eager.year_departure_counts)
+    assert lazy.average_percents == eager.average_percents
+    assert lazy.yearly_average_percents == eager.yearly_average_percents
+    pd.testing.assert_frame_equal(lazy.data, eager.data)
+    assert len(reads) == 1  # and then kept
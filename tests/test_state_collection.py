@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:10:26 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Tests for StateCollection: querying many states together should give each state's own answers.
+"""
+import os
+
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+from conftest import synthetic_data, state_paths
+
+
+@pytest.fixture
+def sources(tmp_path):
+    sources = {}
+    for seed, name in enumerate(['MN', 'PA', 'WA']):
+        path = str(tmp_path / (name + '.csv'))
+        synthetic_data(n = 1000 + 500 * seed, seed = seed).to_csv(path, index = False)
+        sources[name] = {'inp_data_url': path, 'inp_paths': state_paths(), 'using_url': False}
+    return sources
+
+
+def expected_summary(sources, inp_list_of_groups, years):
+    return pd.concat([jt.State(name, **source).generalizable_multi_level_summary(inp_list_of_groups, years = years, 
+                                                                                 plot = None)
+                      for name, source in sources.items()], keys = list(sources), names = ['state'])
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_summary(sources, tmp_path, max_workers):
+    collection = jt.StateCollection(sources, max_workers = max_workers)
+    expected = expected_summary(sources, ['sex', 'departure'], [2011, 2012])
+    pd.testing.assert_frame_equal(collection.generalizable_multi_level_summary(['sex', 'departure'], [2011, 2012]), expected)
+
+    collection.load(snapshot_dir = str(tmp_path / 'snapshots'))  # the workers reopen the snapshots from here on
+    assert sorted(collection.states) == sorted(sources)
+    assert all(os.path.isdir(collection.sources[name]) for name in sources)
+    pd.testing.assert_frame_equal(collection.generalizable_multi_level_summary(['sex', 'departure'], [2011, 2012]), expected)
+    pd.testing.assert_frame_equal(collection['PA'].data, jt.State('PA', **sources['PA']).data)
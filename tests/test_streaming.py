@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 21:40:26 2026
+
+@author: MSU QSIDE JUSTFAIR 2023 Team
+
+Regression tests for reading the csv in chunks (chunksize), which used to leave a copy of the data in the temp folder.
+"""
+import glob
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import JUSTFAIR_Tools as jt
+
+
+def test_chunked_read_cleans_up(make_state):
+    before = set(glob.glob(os.path.join(tempfile.gettempdir(), 'justfair_*')))
+    make_state(chunksize = 300)
+    assert set(glob.glob(os.path.join(tempfile.gettempdir(), 'justfair_*'))) == before
+
+
+def test_chunked_read_cache(make_state, tmp_path, monkeypatch):
+    reference = make_state(prune_columns = True)
+    first = make_state(chunksize = 300, cache_dir = str(tmp_path / 'cache'))
+    monkeypatch.setattr(jt.State, '_stream_csv', lambda *args: pytest.fail('the csv was streamed again'))
+    second = make_state(chunksize = 300, cache_dir = str(tmp_path / 'cache'))
+    pd.testing.assert_frame_equal(second.data.reset_index(drop = True), first.data.reset_index(drop = True))
+    for state in [first, second]:
+        assert np.array_equal(state._year_departure_counts, reference._year_departure_counts)
+        pd.testing.assert_frame_equal(state.generalizable_multi_level_summary(['sex', 'departure'], plot = None),
+                                      reference.generalizable_multi_level_summary(['sex', 'departure'], plot = None))